@@ -0,0 +1,59 @@
+# benchmarks/bench_markdown_render.py
+"""
+Версии текста поста для публикации: прежняя цепочка re.sub (clean_markdown для
+Telegram и ещё раз внутри smart_vk_text для VK) против однопроходного разбора
+utils/markdown_render — без кэша и с кэшем по тексту. Заодно проверяет, что
+результаты совпадают.
+Запуск: python benchmarks/bench_markdown_render.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.legacy_markdown import legacy_clean_markdown, legacy_smart_vk_text  # noqa: E402
+from utils.markdown_render import RenderedPost, render_markdown  # noqa: E402
+
+SECTION = (
+    "## Зимний уход: **главные правила**\n\n"
+    "Холод и сухой воздух в помещениях *истончают* липидный барьер, поэтому зимой коже нужен __другой__ уход.\n\n"
+    "### Что делать\n"
+    "- Умывайтесь **мягким** средством без сульфатов\n"
+    "- Добавьте крем с *церамидами* и сквалáном\n"
+    "- Не забывайте про SPF: снег отражает до 80% UV\n\n"
+    "💡 _Совет косметолога:_ наносите крем за 30 минут до выхода на улицу.\n\n"
+)
+
+
+def _post(size: int) -> str:
+    return (SECTION * (size // len(SECTION) + 1))[:size]
+
+
+def _legacy(text):
+    return legacy_clean_markdown(text), legacy_smart_vk_text(text)
+
+
+def _single_pass(text):
+    rendered = RenderedPost(text)
+    return rendered.plain, rendered.vk
+
+
+def _cached(text):
+    rendered = render_markdown(text)
+    return rendered.plain, rendered.vk
+
+
+def main():
+    for size in (4000, 20000):
+        text = _post(size)
+        assert _legacy(text) == _single_pass(text), "результаты не совпадают"
+        number = 2000 if size < 10000 else 400
+        print(f"Пост {size} символов (Telegram + VK), мкс на публикацию:")
+        for name, fn in (("re.sub цепочка", _legacy), ("один проход", _single_pass), ("один проход, кэш", _cached)):
+            best = min(timeit.repeat(lambda: fn(text), number=number, repeat=5)) / number
+            print(f"  {name:<18} {best * 1e6:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/bench_publish_memory.py
+"""
+Пиковая память на одну загрузку картинки (tracemalloc): чтение файла в bytes и files= у requests
+(как было) против потоковой отправки открытого файла через MultipartStream.
+Стенд VK работает в отдельном процессе, чтобы его буферы не попадали в замер.
+Запуск: python benchmarks/bench_publish_memory.py
+"""
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name in ("BOT_TOKEN", "OPENAI_API_KEY", "YANDEX_API_KEY", "YANDEX_FOLDER_ID",
+             "TELEGRAM_CHANNEL_ID", "VK_ACCESS_TOKEN", "VK_GROUP_ID"):
+    os.environ.setdefault(name, "bench")
+
+import requests  # noqa: E402
+
+from benchmarks.vk_stub import VkApiStub  # noqa: E402
+from utils.rate_limit import AdaptiveRateLimiter  # noqa: E402
+from utils.tg_utils import streaming_request_sender  # noqa: E402
+from utils.vk_utils import VKPublisher  # noqa: E402
+
+IMAGE_SIZE = 8 * 1024 * 1024
+ROUNDS = 3
+
+
+def _serve(queue, stop):
+    with VkApiStub() as stub:
+        queue.put(stub.address)
+        stop.wait()
+
+
+def _peak(fn) -> int:
+    tracemalloc.start()
+    try:
+        for _ in range(ROUNDS):
+            fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    queue, stop = multiprocessing.Queue(), multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve, args=(queue, stop), daemon=True)
+    server.start()
+    address = queue.get(timeout=10)
+    upload_url = f"{address}/upload"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image.jpg")
+        with open(path, "wb") as f:
+            f.write(os.urandom(IMAGE_SIZE))
+
+        publisher = VKPublisher("bench", "1", api_url=f"{address}/method", limiter=AdaptiveRateLimiter(1000))
+        session = requests.Session()
+
+        def vk_bytes():
+            with open(path, "rb") as f:
+                data = f.read()
+            session.post(upload_url, files={"photo": ("image.jpg", io.BytesIO(data), "image/jpeg")}).json()
+
+        def vk_stream():
+            with open(path, "rb") as f:
+                publisher._upload_to_server(f)
+
+        def tg_bytes():
+            with open(path, "rb") as f:
+                data = f.read()
+            session.post(upload_url, params={"chat_id": 1}, files={"photo": io.BytesIO(data)}).json()
+
+        def tg_stream():
+            with open(path, "rb") as f:
+                streaming_request_sender("post", upload_url, params={"chat_id": 1}, files={"photo": f}).json()
+
+        # Прогрев: соединения, адрес сервера загрузки, ленивые импорты
+        for fn in (vk_bytes, vk_stream, tg_bytes, tg_stream):
+            fn()
+
+        results = [(name, _peak(fn)) for name, fn in (
+            ("VK: bytes + files=", vk_bytes),
+            ("VK: файл потоком", vk_stream),
+            ("Telegram: bytes + files=", tg_bytes),
+            ("Telegram: файл потоком", tg_stream),
+        )]
+
+    stop.set()
+    server.join(timeout=5)
+
+    print(f"Картинка: {IMAGE_SIZE / 1024 / 1024:.0f} МБ, пик tracemalloc за {ROUNDS} загрузки")
+    for name, peak in results:
+        print(f"{name:<26} {peak / 1024 / 1024:7.2f} МБ ({peak / IMAGE_SIZE:.2f} копии картинки)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# benchmarks/bench_yandex_client.py
+"""
+Накладные расходы на одно изображение: новый YCloudML на каждый вызов (как было)
+против долгоживущего YandexArtClient. Запуск: python benchmarks/bench_yandex_client.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for name in ("BOT_TOKEN", "OPENAI_API_KEY", "YANDEX_API_KEY", "YANDEX_FOLDER_ID",
+             "TELEGRAM_CHANNEL_ID", "VK_ACCESS_TOKEN", "VK_GROUP_ID"):
+    os.environ.setdefault(name, "bench")
+
+from yandex_cloud_ml_sdk import YCloudML  # noqa: E402
+
+from benchmarks.yandex_stub import YandexArtStub  # noqa: E402
+from utils.yandex_utils import YandexArtClient  # noqa: E402
+
+ROUNDS = 30
+
+
+def fresh_client_per_image(stub, prompt):
+    sdk = YCloudML(folder_id="bench", auth="bench", **stub.sdk_kwargs())
+    model = sdk.models.image_generation("yandex-art").configure(width_ratio=1, height_ratio=1, seed=1)
+    return bytes(model.run_deferred(prompt).wait(poll_interval=0.01).image_bytes)
+
+
+def main():
+    with YandexArtStub() as stub:
+        started = time.perf_counter()
+        for i in range(ROUNDS):
+            fresh_client_per_image(stub, f"prompt {i}")
+        before = (time.perf_counter() - started) / ROUNDS
+        list_calls_before = stub.endpoints.calls
+
+        client = YandexArtClient("bench", "bench", **stub.sdk_kwargs())
+        started = time.perf_counter()
+        for i in range(ROUNDS):
+            bytes(client.run_deferred(f"prompt {i}", seed=1).wait(poll_interval=0.01).image_bytes)
+        after = (time.perf_counter() - started) / ROUNDS
+        list_calls_after = stub.endpoints.calls - list_calls_before
+
+    print(f"Новый SDK на каждое изображение: {before * 1000:.1f} мс/изобр., ListApiEndpoints: {list_calls_before}")
+    print(f"Общий YandexArtClient:           {after * 1000:.1f} мс/изобр., ListApiEndpoints: {list_calls_after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/vk_stub.py
+"""
+Локальный HTTP-стенд VK API: методы /method/<имя> (включая execute) и сервер загрузки фото /upload.
+Считает TCP-соединения и вызовы методов, умеет имитировать сбои загрузки и отказы в публикации.
+"""
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.stub.lock:
+            self.server.stub.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server.stub
+        parts = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        params = dict(parse_qsl(parts.query))
+        if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            params.update(parse_qsl(body.decode("utf-8")))
+
+        if parts.path == "/upload":
+            status, payload = stub.upload(body)
+        else:
+            status, payload = 200, stub.call(parts.path.rsplit("/", 1)[-1], params)
+
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class VkApiStub:
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.stub = self
+        self.address = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.calls = []
+        self.posts = []
+        self.uploads = []  # Сырые тела запросов загрузки фото
+        self.fail_uploads = 0
+        self.fail_execute = False
+        self.reject_posts = []  # Коды ошибок, которыми по очереди отклоняются публикации
+        self._ids = itertools.count(1)
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.address}/method"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, method: str) -> int:
+        with self.lock:
+            return sum(1 for name, _ in self.calls if name == method)
+
+    def upload(self, body: bytes = b""):
+        with self.lock:
+            self.calls.append(("upload", {}))
+            self.uploads.append(body)
+            if self.fail_uploads:
+                self.fail_uploads -= 1
+                return 200, {"server": 1, "photo": "[]", "hash": ""}
+        return 200, {"server": 1, "photo": '[{"photo":"stub"}]', "hash": "stubhash"}
+
+    def call(self, method: str, params: dict):
+        with self.lock:
+            self.calls.append((method, params))
+            if method == "photos.getWallUploadServer":
+                return {"response": {"upload_url": f"{self.address}/upload"}}
+            if method == "photos.saveWallPhoto":
+                return {"response": [{"owner_id": -int(params.get("group_id", 1)), "id": next(self._ids)}]}
+            if method == "wall.post":
+                if self.reject_posts:
+                    return self._error(self.reject_posts.pop(0))
+                self.posts.append(params)
+                return {"response": {"post_id": len(self.posts)}}
+            if method == "execute":
+                return self._execute(params)
+        return {"error": {"error_code": 3, "error_msg": f"Unknown method passed: {method}"}}
+
+    @staticmethod
+    def _error(code: int):
+        return {"error": {"error_code": code, "error_msg": f"Stub error {code}"}}
+
+    def _execute(self, params: dict):
+        """Стенд не исполняет VKScript, а повторяет его смысл: saveWallPhoto + wall.post по Args"""
+        if self.fail_execute:
+            return {"error": {"error_code": 13, "error_msg": "Runtime error occurred during code invocation"}}
+        photo_id = next(self._ids)
+        attachment = f"photo-{params['group_id']}_{photo_id}"
+        if self.reject_posts:
+            error = self._error(self.reject_posts.pop(0))["error"]
+            return {
+                "response": {"post_id": None, "attachment": attachment},
+                "execute_errors": [dict(error, method="wall.post")],
+            }
+        post = {"owner_id": f"-{params['group_id']}", "message": params["message"], "attachments": attachment}
+        self.posts.append(post)
+        return {"response": {"post_id": len(self.posts), "attachment": attachment}}
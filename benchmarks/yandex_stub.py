@@ -0,0 +1,72 @@
+# benchmarks/yandex_stub.py
+"""
+Локальный gRPC-стенд YandexArt: ApiEndpointService, ImageGenerationAsyncService и OperationService.
+Операции сразу завершены и возвращают фиксированную «картинку».
+"""
+import itertools
+from concurrent import futures
+
+import grpc
+from google.protobuf.any_pb2 import Any as AnyProto
+from yandex.cloud.endpoint import api_endpoint_pb2, api_endpoint_service_pb2, api_endpoint_service_pb2_grpc
+from yandex.cloud.operation import operation_pb2, operation_service_pb2_grpc
+from yandex.cloud.ai.foundation_models.v1.image_generation import (
+    image_generation_service_pb2,
+    image_generation_service_pb2_grpc,
+)
+
+FAKE_IMAGE = b"\xff\xd8" + b"\x00" * 1024 + b"\xff\xd9"
+
+
+class _Endpoints(api_endpoint_service_pb2_grpc.ApiEndpointServiceServicer):
+    def __init__(self, address):
+        self.address = address
+        self.calls = 0
+
+    def List(self, request, context):
+        self.calls += 1
+        return api_endpoint_service_pb2.ListApiEndpointsResponse(
+            endpoints=[
+                api_endpoint_pb2.ApiEndpoint(id="ai-foundation-models", address=self.address),
+                api_endpoint_pb2.ApiEndpoint(id="operation", address=self.address),
+            ]
+        )
+
+
+class _ImageGeneration(image_generation_service_pb2_grpc.ImageGenerationAsyncServiceServicer):
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def Generate(self, request, context):
+        return operation_pb2.Operation(id=f"op-{next(self._ids)}", done=False)
+
+
+class _Operations(operation_service_pb2_grpc.OperationServiceServicer):
+    def Get(self, request, context):
+        response = AnyProto()
+        response.Pack(image_generation_service_pb2.ImageGenerationResponse(image=FAKE_IMAGE, model_version="stub"))
+        return operation_pb2.Operation(id=request.operation_id, done=True, response=response)
+
+
+class YandexArtStub:
+    def __init__(self):
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=8))
+        port = self.server.add_insecure_port("localhost:0")
+        self.address = f"localhost:{port}"
+        self.endpoints = _Endpoints(self.address)
+        api_endpoint_service_pb2_grpc.add_ApiEndpointServiceServicer_to_server(self.endpoints, self.server)
+        image_generation_service_pb2_grpc.add_ImageGenerationAsyncServiceServicer_to_server(
+            _ImageGeneration(), self.server
+        )
+        operation_service_pb2_grpc.add_OperationServiceServicer_to_server(_Operations(), self.server)
+
+    def __enter__(self):
+        self.server.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.stop(0)
+
+    def sdk_kwargs(self):
+        """Параметры YCloudML для подключения к стенду"""
+        return {"endpoint": self.address, "grpc_credentials": grpc.local_channel_credentials()}
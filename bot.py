@@ -1,17 +1,22 @@
 import logging
 import signal
 import sys
-from telebot import TeleBot
-from config import BOT_TOKEN
+from telebot import apihelper
+from config import BOT_TOKEN, BOT_MODE
 
 from handlers import general, edit_text, edit_image, publish_telegram, publish_vk, content_planning, admin
 from scheduler import init_scheduler
 from state import save_state
+from utils.tg_utils import streaming_request_sender
+from utils.tg_send_queue import QueuedTeleBot
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 log = logging.getLogger("tg-vk-bot")
 
-bot = TeleBot(BOT_TOKEN)
+# Отправка сообщений идёт через общую очередь с лимитами Telegram
+bot = QueuedTeleBot(BOT_TOKEN)
+# Фото и другие файлы уходят в Telegram потоком, без сборки тела запроса в памяти
+apihelper.CUSTOM_REQUEST_SENDER = streaming_request_sender
 
 # Инициализация планировщика
 content_scheduler = init_scheduler(bot)
@@ -30,6 +35,10 @@ publish_telegram.register(bot)
 publish_vk.register(bot)
 general.register(bot)  # Общий обработчик текста должен быть последним
 
+# Продолжаем пакетную генерацию и генерацию изображений недельного плана, если бот перезапускался
+content_planning.resume_planning_batch(bot)
+content_planning.resume_planning_images(bot)
+
 
 def signal_handler(signum, frame):
     """Обработчик сигналов для корректного завершения"""
@@ -56,7 +65,14 @@ if __name__ == "__main__":
     log.info("Use /start_scheduler to begin automatic scheduling")
 
     try:
-        bot.polling(none_stop=True, interval=0, timeout=20)
+        if BOT_MODE == "webhook":
+            from webhook import run_webhook
+
+            run_webhook(bot)
+        else:
+            # Если раньше работал webhook, Telegram не отдаст обновления через getUpdates, пока он не снят
+            bot.remove_webhook()
+            bot.polling(none_stop=True, interval=0, timeout=20)
     except KeyboardInterrupt:
         log.info("Bot stopped by user")
     except Exception as e:
@@ -8,13 +8,40 @@ log = logging.getLogger("tg-vk-bot")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL_TEXT = os.getenv("OPENAI_MODEL_TEXT", "gpt-4o")  # Модель для генерации текста постов
-OPENAI_MODEL_PROMPT = os.getenv("OPENAI_MODEL_PROMPT", "gpt-4o")  # Модель для создания промптов изображений
+OPENAI_MODEL_PROMPT = os.getenv("OPENAI_MODEL_PROMPT", "gpt-4o-mini")  # Модель для создания промптов изображений
+OPENAI_MODEL_FAST = os.getenv("OPENAI_MODEL_FAST", "gpt-4o-mini")  # Быстрая модель для правки тем
+OPENAI_MODEL_FALLBACK = os.getenv("OPENAI_MODEL_FALLBACK", "gpt-4o-mini")  # Запасная модель для хедж-запросов
+LLM_SLO_TEXT = float(os.getenv("LLM_SLO_TEXT", "25"))  # SLO (сек) для генерации и правки текста
+LLM_SLO_FAST = float(os.getenv("LLM_SLO_FAST", "8"))  # SLO (сек) для коротких задач (промпты, темы)
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))  # Лимит запросов к OpenAI в минуту
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))  # Лимит токенов OpenAI в минуту
+PLANNING_BATCH_MODE = os.getenv("PLANNING_BATCH_MODE", "off")  # Пакетная генерация недельного плана: off/openai/local
+BATCH_POLL_INTERVAL = int(os.getenv("BATCH_POLL_INTERVAL", "60"))  # Максимальный интервал опроса пакета (сек)
+PROMPT_VERSIONS = os.getenv("PROMPT_VERSIONS", "")  # Активные версии промптов, напр. "post_text=v1|v2,topics=v1"
 YANDEX_API_KEY = os.getenv("YANDEX_API_KEY")
 YANDEX_FOLDER_ID = os.getenv("YANDEX_FOLDER_ID")
+YANDEX_ART_MAX_CONCURRENCY = int(os.getenv("YANDEX_ART_MAX_CONCURRENCY", "3"))  # Одновременных генераций YandexArt
+IMAGE_REUSE_SIMILARITY = float(os.getenv("IMAGE_REUSE_SIMILARITY", "0.8"))  # Сходство промптов для повторного использования картинки (0 — не использовать)
+IMAGE_CANDIDATES = int(os.getenv("IMAGE_CANDIDATES", "3"))  # Вариантов картинки при правке изображения (1 — без выбора)
 TELEGRAM_CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID")
 VK_ACCESS_TOKEN = os.getenv("VK_ACCESS_TOKEN")
 VK_GROUP_ID = os.getenv("VK_GROUP_ID")
 VK_API_VERSION = os.getenv("VK_API_VERSION", "5.199")
+VK_RPS = float(os.getenv("VK_RPS", "3"))  # Лимит запросов к VK API в секунду на токен
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # Приём обновлений: polling или webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный https-адрес бота для webhook, напр. https://bot.example.com
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Секрет заголовка X-Telegram-Bot-Api-Secret-Token (пусто — случайный)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))  # Потоков, разбирающих очередь обновлений
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))  # Размер очереди; при переполнении ответ 503
+HANDLER_WORKERS = int(os.getenv("HANDLER_WORKERS", "4"))  # Потоков для долгих обработчиков (генерация, правки)
+TG_GLOBAL_RPS = float(os.getenv("TG_GLOBAL_RPS", "30"))  # Общий лимит исходящих сообщений Telegram в секунду
+TG_CHAT_RPS = float(os.getenv("TG_CHAT_RPS", "1"))  # Лимит сообщений в один личный чат в секунду
+TG_GROUP_RPM = float(os.getenv("TG_GROUP_RPM", "20"))  # Лимит сообщений в группу или канал в минуту
+TG_SEND_WORKERS = int(os.getenv("TG_SEND_WORKERS", "4"))  # Потоков отправки исходящих сообщений
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "3"))  # Сколько генераций постов идёт одновременно
+GENERATION_QUEUE_SIZE = int(os.getenv("GENERATION_QUEUE_SIZE", "20"))  # Сколько ждёт в очереди; сверх этого — отказ
 
 REQUIRED_ENV = [
     ("BOT_TOKEN", BOT_TOKEN),
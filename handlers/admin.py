@@ -1,15 +1,36 @@
 # handlers/admin.py
 from telebot.types import Message, CallbackQuery
 import logging
+import re
 from datetime import datetime
 
 from state import scheduled_posts, store_lock, save_state
 from utils.tg_utils import admin_keyboard, topics_approval_keyboard
 from utils.openai_utils import generate_topics
+from utils.prompts import prompt_cache_stats
+from utils.llm_client import llm_client
+from utils.model_router import model_router
+from utils.yandex_utils import image_jobs
+from utils.image_index import find_duplicates
+from utils.vk_utils import vk_api_stats, vk_publisher
+from utils.chat_dispatcher import chat_dispatcher
+from utils.tg_send_queue import tg_send_queue
+from utils.cancellation import generations
+from utils.singleflight import singleflight
+from utils.admission import admission
 from scheduler import init_scheduler
+import webhook
 
 log = logging.getLogger("tg-vk-bot")
 
+# Символы разметки Telegram Markdown, которые надо экранировать в пользовательском тексте
+MARKDOWN_SPECIAL = re.compile(r"([_*`\[])")
+
+
+def _escape_markdown(text) -> str:
+    """Экранирует пользовательский текст (темы постов) для сообщений с parse_mode="Markdown" """
+    return MARKDOWN_SPECIAL.sub(r"\\\1", str(text))
+
 
 def register(bot):
     """Регистрирует админские команды"""
@@ -73,6 +94,8 @@ def register(bot):
             pending_posts = scheduled_posts.get("pending_posts", [])
             approved_posts = scheduled_posts.get("approved_posts", [])
             published_posts = scheduled_posts.get("published_posts", [])
+            planning_batch = scheduled_posts.get("planning_batch")
+            planning_images = scheduled_posts.get("planning_images")
 
         message = "📊 **Статус планирования**\n\n"
 
@@ -84,6 +107,12 @@ def register(bot):
         else:
             message += "⚪ Нет активных тем\n"
 
+        if planning_batch:
+            stage = "тексты" if planning_batch["stage"] == "texts" else "промпты изображений"
+            message += f"📦 Пакетная генерация постов: этап «{stage}»\n"
+        if planning_images:
+            message += f"🎨 Генерируются изображения: {len(planning_images['posts'])} постов\n"
+
         # Посты
         message += f"🟡 Посты на согласовании: {len(pending_posts)}\n"
         message += f"✅ Посты в очереди: {len(approved_posts)}\n"
@@ -146,7 +175,7 @@ def register(bot):
         message = f"📋 **Очередь публикации ({len(approved_posts)} постов)**\n\n"
 
         for i, post in enumerate(approved_posts, 1):
-            topic = post.get("topic", "Без темы")[:50]
+            topic = _escape_markdown(post.get("topic", "Без темы")[:50])
             message += f"{i}. {topic}...\n"
 
         message += "\n📅 Публикация: Пн/Ср/Пт в 19:00 МСК"
@@ -170,7 +199,7 @@ def register(bot):
         if published_posts:
             # Последняя публикация
             last_post = published_posts[-1]
-            last_topic = last_post.get("topic", "Неизвестно")[:50]
+            last_topic = _escape_markdown(last_post.get("topic", "Неизвестно")[:50])
             message += f"\n📝 Последний пост: {last_topic}...\n"
 
             # Статистика по неделям
@@ -187,5 +216,118 @@ def register(bot):
 
             message += f"📈 За последнюю неделю: {len(recent_posts)} постов"
 
+            duplicates = find_duplicates((p.get("topic"), p.get("image_dhash")) for p in published_posts)
+            if duplicates:
+                message += f"\n♻️ Повторы картинок в архиве: {len(duplicates)}\n"
+                for topic_a, topic_b, _ in duplicates[:3]:
+                    message += f"• {_escape_markdown(str(topic_a)[:30])} ≈ {_escape_markdown(str(topic_b)[:30])}\n"
+
+        message += _performance_stats()
+
         bot.send_message(chat_id, message, parse_mode="Markdown")
         bot.answer_callback_query(call.id)
+
+
+def _performance_stats() -> str:
+    """Технические метрики для раздела статистики"""
+    message = ""
+
+    cache = prompt_cache_stats.snapshot()
+    if cache:
+        message += "\n\n🧠 **Кэш промптов OpenAI:**\n"
+        for key, entry in sorted(cache.items()):
+            message += (
+                f"• `{key}`: {entry['calls']} вызовов, "
+                f"{entry['cached_tokens']}/{entry['prompt_tokens']} токенов из кэша "
+                f"({entry['hit_rate']:.0%})\n"
+            )
+
+    llm = llm_client.stats()
+    if llm["requests"]:
+        message += "\n🚦 **Очередь OpenAI:**\n"
+        message += (
+            f"• В очереди: {llm['queue_depth']['interactive']} интерактивных, "
+            f"{llm['queue_depth']['background']} фоновых\n"
+        )
+        for lane, title in (("interactive", "интерактивные"), ("background", "фоновые")):
+            wait = llm["wait"][lane]
+            message += f"• Ожидание ({title}): среднее {wait['avg']:.1f} с, макс. {wait['max']:.1f} с\n"
+        message += f"• Запросов: {llm['requests']}, 429: {llm['throttled']}, повторов: {llm['retries']}\n"
+
+    router = model_router.stats()
+    if router["models"]:
+        message += "\n🔀 **Модели OpenAI:**\n"
+        for model, entry in sorted(router["models"].items()):
+            p95 = f"{entry['p95']:.1f} с" if entry["p95"] is not None else "мало данных"
+            message += f"• `{model}`: {entry['count']} ответов, p95 {p95}\n"
+        message += (
+            f"• Хеджей: {router['hedged']} (выиграли: {router['hedge_wins']}), "
+            f"фолбэков: {router['fallbacks']}\n"
+        )
+
+    vk_methods = vk_api_stats.snapshot()
+    if vk_methods:
+        message += f"\n🟦 **VK API** (лимит сейчас {vk_publisher.limiter.rate:.1f} запр./с):\n"
+        for method, entry in sorted(vk_methods.items()):
+            message += (
+                f"• `{method}`: {entry['calls']} вызовов, среднее {entry['avg']:.2f} с, "
+                f"макс. {entry['max']:.2f} с, отказов «too many»: {entry['throttled']}\n"
+            )
+
+    if webhook.webhook_server:
+        hook = webhook.webhook_server.stats()
+        message += (
+            f"\n📥 **Webhook:** получено {hook['received']}, обработано {hook['processed']}, "
+            f"в очереди {hook['queued']}, отклонено {hook['rejected']}, отложено (503) {hook['dropped']}\n"
+        )
+
+    sends = tg_send_queue.stats()
+    if sends["sent"]:
+        message += "\n📤 **Отправка в Telegram:**\n"
+        message += (
+            f"• Отправлено: {sends['sent']} (за минуту: {sends['per_minute']}), 429: {sends['throttled']}\n"
+            f"• В очереди: {sends['queued']['interactive']} ответов, {sends['queued']['background']} уведомлений\n"
+        )
+        for lane, title in (("interactive", "ответы"), ("background", "уведомления")):
+            delay = sends["delay"].get(lane)
+            if delay:
+                message += f"• Ожидание ({title}): среднее {delay['avg']:.2f} с, макс. {delay['max']:.2f} с\n"
+
+    handlers = chat_dispatcher.stats()
+    if handlers["running"] or handlers["queued"]:
+        message += (
+            f"\n⚙️ **Фоновые задачи:** выполняется {handlers['running']} из {handlers['workers']}, "
+            f"в очереди {handlers['queued']} (чатов: {handlers['chats']})\n"
+        )
+
+    flights = singleflight.stats()
+    if flights["deduplicated"]:
+        message += (
+            f"\n🔁 **Повторные запросы:** {flights['deduplicated']} объединено с уже выполняемыми "
+            f"(выполнено {flights['calls']})\n"
+        )
+        for kind, entry in sorted(flights["kinds"].items()):
+            if entry["deduplicated"]:
+                message += f"• `{kind}`: {entry['deduplicated']} из {entry['calls'] + entry['deduplicated']}\n"
+
+    posts = generations.stats()
+    if posts["cancelled"]:
+        message += (
+            f"\n⏹ **Генерации постов:** запущено {posts['started']}, отменено {posts['cancelled']} "
+            f"(сейчас идёт {posts['active']})\n"
+        )
+
+    queue = admission.stats()
+    if queue["queued"] or queue["rejected"]:
+        message += (
+            f"\n🚦 **Генерация постов:** выполняется {queue['running']} из {queue['limit']}, "
+            f"в очереди {queue['queued']} из {queue['queue_size']}, отклонено {queue['rejected']}\n"
+        )
+        if queue["average"] is not None:
+            message += f"• Средняя длительность: {queue['average']:.0f} с\n"
+
+    images = image_jobs.stats()
+    if images["active"] or images["queued"]:
+        message += f"\n🎨 **YandexArt:** генерируется {images['active']}, в очереди {images['queued']}\n"
+
+    return message
@@ -1,19 +1,43 @@
 # handlers/content_planning.py
 from telebot.types import Message, CallbackQuery
+import html
 import logging
+import threading
+import time
 from datetime import datetime
+from typing import Optional
 
+from config import BATCH_POLL_INTERVAL
 from state import scheduled_posts, planning_states, store_lock, save_state
-from utils.openai_utils import edit_topics, generate_text, generate_image_prompt
-from utils.yandex_utils import generate_image_bytes_with_yc
+from utils.openai_utils import edit_topics, generate_text, generate_image_prompt, build_chat_body
+from utils.openai_batch import (
+    get_batch_backend,
+    build_batch_line,
+    result_content,
+    FINAL_STATUSES,
+    TRANSIENT_BATCH_ERRORS,
+)
+from utils.yandex_utils import generate_image_bytes_with_yc, image_jobs, IMAGE_TIMEOUT
+from utils.image_index import image_index, near_duplicates
+from utils.llm_client import PRIORITY_BACKGROUND
 from utils.tg_utils import (
     topics_approval_keyboard,
     posts_approval_keyboard,
     send_post_with_image,
 )
+from utils.chat_dispatcher import run_in_background
+from utils.progress import ProgressReporter
+from utils.tg_send_queue import background_sends
 
 log = logging.getLogger("tg-vk-bot")
 
+# Как часто новый план проверяет, завершил ли предыдущий генерацию изображений (сек)
+PLANNING_IMAGES_WAIT = 5
+
+# Опрос пакета недельного плана — один поток на процесс; batch_id — какой пакет он опрашивает
+_batch_poller_lock = threading.Lock()
+_batch_poller = {"thread": None, "batch_id": None}
+
 
 def register(bot):
     """Регистрирует обработчики для планирования контента"""
@@ -37,8 +61,8 @@ def register(bot):
         bot.answer_callback_query(call.id, "✅ Темы одобрены!")
         bot.send_message(chat_id, "✅ Темы одобрены! Начинаю генерацию постов...", reply_markup=None)
 
-        # Запускаем генерацию постов
-        _generate_posts_for_topics(bot, chat_id)
+        # Генерация постов идёт в пуле долгих обработчиков — диспетчер Telegram не ждёт её
+        run_in_background(bot, chat_id, _generate_posts, bot, chat_id)
 
     @bot.callback_query_handler(func=lambda c: c.data == "edit_topics")
     def ask_edit_topics(call: CallbackQuery):
@@ -78,6 +102,7 @@ def register(bot):
             save_state()
 
         bot.answer_callback_query(call.id, "✅ Пост одобрен!")
+        _warn_duplicate_image(bot, chat_id, post)
 
         # Показываем следующий пост или завершаем
         _show_next_post_or_finish(bot, chat_id, post_index)
@@ -134,7 +159,12 @@ def handle_planning_message(bot, msg: Message):
     elif action == "waiting_custom_topics":
         _handle_custom_topics(bot, msg)
     elif action == "waiting_post_edit":
-        _handle_post_edit(bot, msg)
+        if not (msg.text or "").strip():
+            bot.send_message(chat_id, "Пожалуйста, опишите, как изменить пост.")
+            return
+        # Состояние снимаем сразу: правка выполняется в фоне, и следующее сообщение не должно попасть в неё же
+        planning_states.pop(chat_id, None)
+        run_in_background(bot, chat_id, _handle_post_edit, bot, msg, state.get("post_index", 0))
 
 
 def _handle_topics_edit(bot, msg: Message):
@@ -146,14 +176,15 @@ def _handle_topics_edit(bot, msg: Message):
         bot.send_message(chat_id, "Пожалуйста, опишите, как изменить темы.")
         return
 
+    # Отправка может ждать лимита Telegram — под store_lock её не делаем
     with store_lock:
         pending = scheduled_posts.get("pending_topics")
-        if not pending:
-            bot.send_message(chat_id, "❌ Нет тем для редактирования.")
-            planning_states.pop(chat_id, None)
-            return
+        current_topics = pending["topics"] if pending else None
 
-        current_topics = pending["topics"]
+    if current_topics is None:
+        bot.send_message(chat_id, "❌ Нет тем для редактирования.")
+        planning_states.pop(chat_id, None)
+        return
 
     try:
         bot.send_message(chat_id, "🔄 Редактирую темы...")
@@ -214,38 +245,26 @@ def _handle_custom_topics(bot, msg: Message):
     planning_states.pop(chat_id, None)
 
 
-def _handle_post_edit(bot, msg: Message):
+def _handle_post_edit(bot, msg: Message, post_index: int):
     """Обрабатывает редактирование поста"""
     chat_id = msg.chat.id
     instruction = msg.text.strip()
-    state = planning_states.get(chat_id, {})
-    post_index = state.get("post_index", 0)
-
-    if not instruction:
-        bot.send_message(chat_id, "Пожалуйста, опишите, как изменить пост.")
-        return
 
     with store_lock:
         pending_posts = scheduled_posts.get("pending_posts", [])
-        if post_index >= len(pending_posts):
-            bot.send_message(chat_id, "❌ Пост не найден.")
-            planning_states.pop(chat_id, None)
-            return
+        post = pending_posts[post_index] if post_index < len(pending_posts) else None
 
-        post = pending_posts[post_index]
+    if post is None:
+        bot.send_message(chat_id, "❌ Пост не найден.")
+        return
 
     try:
         bot.send_message(chat_id, "🔄 Редактирую пост...")
 
         # Редактируем текст поста
-        from utils.openai_utils import _openai_chat
+        from utils.openai_utils import edit_post_sections
 
-        prompt = (
-            "Отредактируй текст поста строго по инструкции. Сохрани факты, улучшай структуру и ясность. "
-            "Верни только готовый текст без пояснений.\n\n"
-            f"ТЕКСТ:\n{post['text']}\n\nИНСТРУКЦИЯ:\n{instruction}"
-        )
-        new_text = _openai_chat([{"role": "user", "content": prompt}], "gpt-4o")
+        new_text = edit_post_sections(post["text"], instruction)
 
         # Генерируем новое изображение если нужно
         new_prompt = generate_image_prompt(new_text)
@@ -259,8 +278,10 @@ def _handle_post_edit(bot, msg: Message):
             updated_post = ScheduledPost.from_dict(old_post_data)
             updated_post.text = new_text
             updated_post.image_bytes = new_image_bytes
+            updated_post.ensure_image_dhash()
             pending_posts[post_index] = updated_post.to_dict()
             save_state()
+        image_index.add(new_prompt, new_image_bytes)
 
         # Показываем обновленный пост без ограничений
         _show_post_for_approval(bot, chat_id, post_index)
@@ -269,7 +290,14 @@ def _handle_post_edit(bot, msg: Message):
         log.exception("Error editing post")
         bot.send_message(chat_id, f"❌ Ошибка редактирования поста: {e}")
 
-    planning_states.pop(chat_id, None)
+
+@background_sends
+def _generate_posts(bot, chat_id: int):
+    """Генерация постов для одобренных тем: пакетом (дешевле, в фоне) или сразу"""
+    if get_batch_backend():
+        _generate_posts_for_topics_batch(bot, chat_id)
+    else:
+        _generate_posts_for_topics(bot, chat_id)
 
 
 def _generate_posts_for_topics(bot, chat_id: int):
@@ -282,52 +310,372 @@ def _generate_posts_for_topics(bot, chat_id: int):
             bot.send_message(chat_id, "❌ Нет одобренных тем.")
             return
 
-        bot.send_message(chat_id, f"🔄 Генерирую {len(topics)} постов, это займет около минуты...")
+        # Весь ход генерации — правки одного статусного сообщения
+        progress = ProgressReporter(bot, chat_id, f"🔄 Генерирую {len(topics)} постов, это займет около минуты").start()
 
-        posts = []
+        # Изображения генерируются параллельно: ставим задачу сразу после промпта
+        # и переходим к следующей теме, а результаты собираем в конце
+        record = _acquire_planning_images(chat_id, progress)
+        items = {}
         for i, topic in enumerate(topics, 1):
             try:
-                bot.send_message(chat_id, f"📝 Генерирую пост {i}/{len(topics)}: {topic[:50]}...")
+                progress.stage(f"Пост {i}/{len(topics)}: {topic[:50]}")
 
-                # Генерируем текст поста
-                text = generate_text(topic)
+                # Генерируем текст поста (фоновый приоритет: быстрые посты идут вперёд)
+                text = generate_text(topic, priority=PRIORITY_BACKGROUND)
 
                 # Генерируем промпт для изображения
-                image_prompt = generate_image_prompt(text)
+                image_prompt = generate_image_prompt(text, priority=PRIORITY_BACKGROUND)
 
-                # Генерируем изображение
-                image_bytes = generate_image_bytes_with_yc(image_prompt)
-
-                # Создаем объект поста
-                from scheduler import ScheduledPost
-
-                post = ScheduledPost(
-                    topic=topic, text=text, publish_date=None, status="pending"
-                )
-                post.image_bytes = image_bytes
-                posts.append(post.to_dict())
+                # Ставим генерацию изображения в очередь YandexArt
+                index, item = _submit_planning_image(record, topic, text, image_prompt)
+                items[index] = item
 
             except Exception as e:
                 log.exception(f"Error generating post for topic: {topic}")
-                bot.send_message(chat_id, f"❌ Ошибка генерации поста для темы '{topic[:30]}...': {e}")
+                progress.fail_stage(f"Ошибка генерации поста для темы '{topic[:30]}...': {e}")
 
-        if posts:
-            with store_lock:
-                scheduled_posts["pending_posts"] = posts
-                save_state()
-
-            bot.send_message(chat_id, f"✅ Сгенерировано {len(posts)} постов! Начинаем согласование...")
-
-            # Показываем первый пост для одобрения
-            _show_post_for_approval(bot, chat_id, 0)
-        else:
-            bot.send_message(chat_id, "❌ Не удалось сгенерировать ни одного поста.")
+        _finish_planning_images(bot, record, items, progress)
 
     except Exception as e:
         log.exception("Error generating posts")
         bot.send_message(chat_id, f"❌ Ошибка генерации постов: {e}")
 
 
+def _generate_posts_for_topics_batch(bot, chat_id: int):
+    """Ставит генерацию постов для одобренных тем в пакетную очередь OpenAI"""
+    try:
+        with store_lock:
+            topics = scheduled_posts.get("approved_topics", [])
+
+        if not topics:
+            bot.send_message(chat_id, "❌ Нет одобренных тем.")
+            return
+
+        lines = [
+            build_batch_line(f"text-{i}", build_chat_body("post_text", topic=topic)) for i, topic in enumerate(topics)
+        ]
+        batch_id = get_batch_backend().submit(lines)
+
+        with store_lock:
+            scheduled_posts["planning_batch"] = {
+                "stage": "texts",
+                "batch_id": batch_id,
+                "chat_id": chat_id,
+                "posts": [{"topic": topic, "text": None} for topic in topics],
+                "submitted_at": datetime.now().isoformat(),
+            }
+            save_state()
+
+        log.info(f"Planning batch submitted: {batch_id} ({len(topics)} topics)")
+        bot.send_message(
+            chat_id,
+            f"📦 {len(topics)} постов поставлены в пакетную генерацию.\n"
+            "Это дешевле, но может занять время — я пришлю черновики, когда они будут готовы.",
+        )
+        resume_planning_batch(bot)
+
+    except Exception as e:
+        log.exception("Error submitting planning batch")
+        bot.send_message(chat_id, f"❌ Ошибка пакетной генерации, генерирую посты по одному: {e}")
+        _generate_posts_for_topics(bot, chat_id)
+
+
+def resume_planning_batch(bot):
+    """Запускает фоновый опрос пакета недельного плана (в том числе после перезапуска бота)"""
+    with store_lock:
+        job = scheduled_posts.get("planning_batch")
+        batch_id = job["batch_id"] if job else None
+    if not batch_id or not get_batch_backend():
+        return
+
+    with _batch_poller_lock:
+        thread = _batch_poller["thread"]
+        if thread is not None and thread.is_alive() and _batch_poller["batch_id"] == batch_id:
+            return  # Этот пакет уже опрашивается
+        # Прежний поток, если он ещё жив, увидит чужой batch_id и завершится сам
+        thread = threading.Thread(target=_poll_planning_batch, args=(bot, batch_id), daemon=True)
+        _batch_poller.update(thread=thread, batch_id=batch_id)
+        thread.start()
+
+
+def _current_planning_batch(batch_id: str):
+    """Копия записи пакета, если план ещё опрашивает именно этот пакет (иначе его заменил новый план)"""
+    with store_lock:
+        job = scheduled_posts.get("planning_batch")
+        return dict(job) if job and job["batch_id"] == batch_id else None
+
+
+@background_sends
+def _poll_planning_batch(bot, batch_id: str):
+    """Опрашивает пакет и переводит план по этапам: тексты → промпты → изображения"""
+    backend = get_batch_backend()
+    interval = 2
+
+    while True:
+        job = _current_planning_batch(batch_id)
+        if not job:
+            log.info(f"Planning batch {batch_id} is no longer current, poller stops")
+            return
+
+        try:
+            status = backend.status(batch_id)
+            results = backend.results(batch_id) if status.get("status") == "completed" else None
+        except TRANSIENT_BATCH_ERRORS as e:
+            # Сеть или API временно недоступны — оплаченный пакет не бросаем
+            log.warning(f"Planning batch {batch_id} poll failed, retrying in {interval} s: {e}")
+            time.sleep(interval)
+            interval = min(interval * 2, BATCH_POLL_INTERVAL)
+            continue
+        except Exception as e:
+            log.exception("Error polling planning batch")
+            _drop_planning_batch(bot, job, e)
+            return
+
+        if status.get("status") not in FINAL_STATUSES:
+            time.sleep(interval)
+            interval = min(interval * 2, BATCH_POLL_INTERVAL)
+            continue
+
+        try:
+            if results is None:
+                raise RuntimeError(f"пакет {batch_id} завершился со статусом {status['status']}")
+
+            if job["stage"] == "texts":
+                batch_id = _finish_batch_texts(job, results)
+                if not batch_id:
+                    return
+                with _batch_poller_lock:
+                    _batch_poller["batch_id"] = batch_id
+                interval = 2
+                continue
+
+            _finish_batch_prompts(bot, job, results)
+            return
+
+        except Exception as e:
+            log.exception("Error in planning batch")
+            _drop_planning_batch(bot, job, e)
+            return
+
+
+def _drop_planning_batch(bot, job, error: Exception):
+    """Снимает пакет плана после ошибки (если его ещё не заменил новый план) и сообщает о ней"""
+    with store_lock:
+        current = scheduled_posts.get("planning_batch")
+        if not current or current["batch_id"] != job["batch_id"]:
+            return
+        scheduled_posts.pop("planning_batch", None)
+        save_state()
+    bot.send_message(job["chat_id"], f"❌ Ошибка пакетной генерации постов: {error}")
+
+
+def _finish_batch_texts(job, results) -> Optional[str]:
+    """
+    Этап 1 готов: сохраняем тексты и отправляем пакет промптов для изображений.
+    Возвращает id пакета промптов или None, если план тем временем заменили новым.
+    """
+    texts = {}
+    for i, post in enumerate(job["posts"]):
+        try:
+            texts[i] = result_content(results.get(f"text-{i}", {"error": "нет ответа"}))
+        except Exception as e:
+            log.error(f"Batch text failed for topic '{post['topic']}': {e}")
+
+    if not texts:
+        raise RuntimeError("не удалось сгенерировать ни одного текста")
+
+    # Пакет промптов платный — не отправляем его за уже заменённый план
+    if not _current_planning_batch(job["batch_id"]):
+        return None
+    lines = [build_batch_line(f"prompt-{i}", build_chat_body("image_prompt", text=text)) for i, text in texts.items()]
+    batch_id = get_batch_backend().submit(lines)
+
+    with store_lock:
+        current = scheduled_posts.get("planning_batch")
+        if not current or current["batch_id"] != job["batch_id"]:
+            log.warning(f"Planning batch replaced while submitting prompts, batch {batch_id} is ignored")
+            return None
+        for i, text in texts.items():
+            current["posts"][i]["text"] = text
+        current.update(stage="prompts", batch_id=batch_id)
+        save_state()
+    log.info(f"Planning batch texts done, prompts batch submitted: {batch_id}")
+    return batch_id
+
+
+def _finish_batch_prompts(bot, job, results):
+    """Этап 2 готов: генерируем изображения и отдаём черновики на согласование"""
+    chat_id = job["chat_id"]
+    with store_lock:
+        current = scheduled_posts.get("planning_batch")
+        if not current or current["batch_id"] != job["batch_id"]:
+            return
+        # Пакет обработан: после перезапуска его не нужно подхватывать снова
+        scheduled_posts.pop("planning_batch", None)
+        save_state()
+
+    progress = ProgressReporter(bot, chat_id, "📦 Тексты постов готовы, генерирую изображения").start()
+    record = _acquire_planning_images(chat_id, progress)
+    items = {}
+    for i, post in enumerate(job["posts"]):
+        if not post["text"]:
+            continue
+        try:
+            image_prompt = result_content(results.get(f"prompt-{i}", {"error": "нет ответа"}))
+            index, item = _submit_planning_image(record, post["topic"], post["text"], image_prompt)
+            items[index] = item
+        except Exception as e:
+            log.exception(f"Error finishing batch post for topic: {post['topic']}")
+            progress.note(f"Ошибка генерации поста для темы '{post['topic'][:30]}...': {e}")
+
+    _finish_planning_images(bot, record, items, progress)
+
+
+def _start_planning_images(chat_id: int) -> Optional[dict]:
+    """
+    Заводит запись о генерации изображений недельного плана. В ней лежат черновики
+    постов, промпты и id операций YandexArt, чтобы после перезапуска бота дождаться
+    уже оплаченных генераций, а не запускать их заново.
+    Запись одна на бота: пока изображения предыдущего плана не готовы, возвращает None.
+    """
+    with store_lock:
+        if scheduled_posts.get("planning_images"):
+            return None
+        record = scheduled_posts["planning_images"] = {"chat_id": chat_id, "posts": [], "prompts": []}
+        save_state()
+        return record
+
+
+def _acquire_planning_images(chat_id: int, progress: ProgressReporter) -> dict:
+    """Запись генерации изображений для нового плана; если ещё завершается предыдущий план — ждёт его"""
+    record = _start_planning_images(chat_id)
+    if record is None:
+        log.info("Previous plan is still finishing its images, new plan waits")
+        progress.stage("Жду, пока завершится предыдущий план")
+    while record is None:
+        time.sleep(PLANNING_IMAGES_WAIT)
+        record = _start_planning_images(chat_id)
+    return record
+
+
+def _submit_planning_image(record: dict, topic: str, text: str, image_prompt: str):
+    """
+    Сохраняет черновик поста в запись плана и ставит генерацию его изображения.
+    Возвращает (индекс, (черновик, промпт, future)).
+    """
+    from scheduler import ScheduledPost
+
+    post = ScheduledPost(topic=topic, text=text, publish_date=None, status="pending").to_dict()
+    with store_lock:
+        index = len(record["posts"])
+        record["posts"].append(post)
+        record["prompts"].append(image_prompt)
+        save_state()
+
+    future = image_jobs.submit(
+        image_prompt, on_started=lambda operation_id: _remember_operation(record, index, operation_id)
+    )
+    return index, (dict(post), image_prompt, future)
+
+
+def _remember_operation(record: dict, index: int, operation_id: str):
+    with store_lock:
+        if scheduled_posts.get("planning_images") is record and index < len(record["posts"]):
+            record["posts"][index]["image_operation_id"] = operation_id
+            save_state()
+
+
+def resume_planning_images(bot):
+    """Продолжает генерацию изображений недельного плана, прерванную перезапуском бота"""
+    with store_lock:
+        record = scheduled_posts.get("planning_images")
+        drafts = [dict(post) for post in record["posts"]] if record else []
+        prompts = list(record["prompts"]) if record else []
+    if not record:
+        return
+
+    items = {}
+    for index, post in enumerate(drafts):
+        operation_id = post.get("image_operation_id")
+        if operation_id:
+            log.info(f"Re-attaching YandexArt operation {operation_id} for topic: {post['topic']}")
+            future = image_jobs.attach(operation_id)
+        else:
+            future = image_jobs.submit(
+                prompts[index], on_started=lambda operation_id, i=index: _remember_operation(record, i, operation_id)
+            )
+        items[index] = (post, prompts[index], future)
+
+    progress = ProgressReporter(
+        bot, record["chat_id"], "🔄 Бот перезапускался — дожидаюсь изображений для постов недельного плана"
+    ).start()
+    threading.Thread(target=_finish_planning_images, args=(bot, record, items, progress), daemon=True).start()
+
+
+@background_sends
+def _finish_planning_images(bot, record: dict, items: dict, progress: ProgressReporter):
+    """
+    Дожидается изображений плана и отдаёт черновики на согласование.
+    items — {индекс: (черновик, промпт, future)}; общая запись в scheduled_posts не перечитывается.
+    """
+    from scheduler import ScheduledPost
+
+    chat_id = record["chat_id"]
+    posts = []
+    try:
+        progress.stage(f"Изображения: 0/{len(items)}")
+        for done, (index, (draft, prompt, future)) in enumerate(sorted(items.items()), 1):
+            post = ScheduledPost.from_dict(dict(draft))
+            try:
+                image_bytes = future.result(timeout=IMAGE_TIMEOUT + 60)
+            except Exception as e:
+                log.exception(f"Error generating image for topic: {post.topic}")
+                progress.note(f"Ошибка генерации изображения для темы '{post.topic[:30]}...': {e}")
+                continue
+            finally:
+                progress.update(f"Изображения: {done}/{len(items)}")
+
+            post.image_operation_id = None
+            post.image_bytes = image_bytes
+            post.ensure_image_dhash()
+            image_index.add(prompt, image_bytes)
+            posts.append(post.to_dict())
+    finally:
+        # Запись снимаем в любом случае, иначе следующий план будет ждать её вечно
+        with store_lock:
+            if scheduled_posts.get("planning_images") is record:
+                scheduled_posts.pop("planning_images", None)
+            if posts:
+                scheduled_posts["pending_posts"] = posts
+            save_state()
+
+    if not posts:
+        progress.fail("❌ Не удалось сгенерировать ни одного поста.")
+        return
+
+    progress.done(f"✅ Сгенерировано {len(posts)} постов! Начинаем согласование...")
+
+    # Показываем первый пост для одобрения
+    _show_post_for_approval(bot, chat_id, 0)
+
+
+def _warn_duplicate_image(bot, chat_id: int, post_data: dict):
+    """Предупреждает, если картинка поста визуально повторяет уже опубликованную"""
+    with store_lock:
+        published = [
+            (item.get("topic"), item.get("image_dhash")) for item in scheduled_posts.get("published_posts", [])
+        ]
+
+    topics = near_duplicates(post_data.get("image_dhash"), published)
+    if topics:
+        bot.send_message(
+            chat_id,
+            "⚠️ Картинка этого поста почти совпадает с уже опубликованной:\n"
+            + "\n".join(f"• {topic}" for topic in topics[:3]),
+        )
+
+
 def _show_post_for_approval(bot, chat_id: int, post_index: int):
     """Показывает пост для одобрения"""
     with store_lock:
@@ -345,18 +693,28 @@ def _show_post_for_approval(bot, chat_id: int, post_index: int):
 
         post = ScheduledPost.from_dict(post_data)
 
-        full_text = f"📝 **Пост {post_index + 1} из {total_posts}**\n\n"
-        full_text += f"**Тема:** {post.topic}\n\n"
-        full_text += post.text
+        full_text = f"📝 <b>Пост {post_index + 1} из {total_posts}</b>\n\n"
+        full_text += f"<b>Тема:</b> {html.escape(post.topic or '')}\n\n"
+        full_text += post.rendered.html
 
-        send_post_with_image(
-            bot,
-            chat_id,
-            full_text,
-            post.image_bytes,
-            reply_markup=posts_approval_keyboard(post_index, total_posts),
-            parse_mode="Markdown",
-        )
+        def remember_file_id(file_id: str):
+            # Публикация в канал потом отправит картинку по этому file_id
+            with store_lock:
+                post_data["image_file_id"] = file_id
+                save_state()
+
+        # Превью — той же версией картинки, что уйдёт в канал; файл читается, только если file_id ещё нет
+        with post.open_image("tg") as image:
+            send_post_with_image(
+                bot,
+                chat_id,
+                full_text,
+                image,
+                reply_markup=posts_approval_keyboard(post_index, total_posts),
+                parse_mode="HTML",
+                file_id=post.image_file_id,
+                on_upload=remember_file_id,
+            )
     except Exception as e:
         log.exception("Error showing post for approval")
         bot.send_message(chat_id, f"❌ Ошибка отображения поста: {e}")
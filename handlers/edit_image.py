@@ -1,9 +1,13 @@
 # handlers/edit_image.py
 from telebot.types import Message, CallbackQuery
+from config import IMAGE_CANDIDATES
 from state import user_drafts, user_states, store_lock
-from utils.openai_utils import _openai_chat
-from utils.yandex_utils import generate_image_bytes_with_yc
-from utils.tg_utils import action_keyboard, send_post_with_image
+from utils.openai_utils import generate_image_prompt_with_wish
+from utils.yandex_utils import generate_image_candidates, generate_image_bytes_with_yc
+from utils.image_index import image_index
+from utils.tg_utils import action_keyboard, send_draft_post, send_image_candidates, post_html
+from utils.chat_dispatcher import run_in_background
+from utils.progress import ProgressReporter
 
 
 def register(bot):
@@ -14,6 +18,71 @@ def register(bot):
             call.message.chat.id, "Опишите желаемые изменения изображения (цвет, крупный план, объект и т.д.):"
         )
 
+    @bot.callback_query_handler(func=lambda c: c.data == "fresh_image")
+    def fresh_image(call: CallbackQuery):
+        """Новая генерация по промпту черновика вместо картинки из индекса"""
+        user_id = call.message.chat.id
+        with store_lock:
+            draft = user_drafts.get(user_id)
+        if not draft or not draft.get("image_prompt"):
+            bot.answer_callback_query(call.id, "❌ Нет черновика")
+            return
+
+        bot.answer_callback_query(call.id, "🎨 Генерирую новую картинку…")
+        # Генерация YandexArt долгая — в пул обработчиков, чтобы не держать другие чаты
+        run_in_background(bot, user_id, regenerate_image, bot, user_id)
+
+    @bot.callback_query_handler(func=lambda c: c.data.startswith("pick_image_"))
+    def pick_image(call: CallbackQuery):
+        user_id = call.message.chat.id
+        index = int(call.data.split("_")[-1])
+
+        with store_lock:
+            draft = user_drafts.get(user_id)
+            candidates = (draft or {}).get("image_candidates") or []
+            if index >= len(candidates):
+                bot.answer_callback_query(call.id, "❌ Вариант больше недоступен")
+                return
+            draft["image_bytes"] = candidates[index]
+
+        bot.answer_callback_query(call.id, f"✅ Выбран вариант {index + 1}")
+        # Варианты уже отправлялись альбомом — выбранный уходит по file_id, без повторной загрузки
+        send_draft_post(
+            bot,
+            user_id,
+            post_html(draft["text"]),
+            draft,
+            candidates[index],
+            reply_markup=action_keyboard(),
+            parse_mode="HTML",
+        )
+
+
+def regenerate_image(bot, user_id):
+    """Генерирует новую картинку по промпту черновика"""
+    with store_lock:
+        draft = user_drafts.get(user_id)
+    if not draft or not draft.get("image_prompt"):
+        bot.send_message(user_id, "❌ Нет активного черновика.")
+        return
+
+    progress = ProgressReporter(bot, user_id, "🎨 Новая картинка").start()
+    try:
+        progress.stage("Генерирую изображение")
+        new_bytes = generate_image_bytes_with_yc(draft["image_prompt"])
+    except Exception as e:
+        progress.fail(f"❌ Не удалось сгенерировать изображение: {e}")
+        return
+    image_index.add(draft["image_prompt"], new_bytes)
+
+    with store_lock:
+        draft["image_bytes"] = new_bytes
+    # Черновик будет отдельным сообщением — статусное больше не нужно
+    progress.delete()
+    send_draft_post(
+        bot, user_id, post_html(draft["text"]), draft, reply_markup=action_keyboard(), parse_mode="HTML"
+    )
+
 
 def apply_image_instruction(bot, msg: Message):
     user_id = msg.chat.id
@@ -22,26 +91,28 @@ def apply_image_instruction(bot, msg: Message):
 
     if not draft:
         bot.send_message(user_id, "❌ Нет активного черновика.")
-        user_states.pop(user_id, None)
         return
 
     wish = (msg.text or "").strip()
-    prompt = (
-        "Сформируй краткий промпт для генератора изображений (1:1) на основе текста поста и пожелания. "
-        "Стиль минималистичный, без текста, фокус на теме ухода за кожей.\n\n"
-        f"ПОСТ:\n{draft['text']}\n\nПОЖЕЛАНИЕ:\n{wish}"
-    )
 
     try:
-        new_prompt = _openai_chat([{"role": "user", "content": prompt}], "gpt-4o")
-        new_bytes = generate_image_bytes_with_yc(new_prompt)
+        new_prompt = generate_image_prompt_with_wish(draft["text"], wish)
+        # Несколько вариантов за одно ожидание: генерируются параллельно с разными seed
+        candidates = generate_image_candidates(new_prompt, IMAGE_CANDIDATES)
     except Exception as e:
         bot.send_message(user_id, f"❌ Не удалось обновить изображение: {e}")
-        user_states.pop(user_id, None)
         return
 
+    image_index.add(new_prompt, candidates[0])
+
     with store_lock:
-        draft["image_bytes"] = new_bytes
+        draft["image_bytes"] = candidates[0]
+        draft["image_prompt"] = new_prompt
+        draft["image_candidates"] = candidates
 
-    send_post_with_image(bot, user_id, draft["text"], new_bytes, reply_markup=action_keyboard())
-    user_states.pop(user_id, None)
+    if len(candidates) > 1:
+        send_image_candidates(bot, user_id, candidates, draft)
+    else:
+        send_draft_post(
+            bot, user_id, post_html(draft["text"]), draft, reply_markup=action_keyboard(), parse_mode="HTML"
+        )
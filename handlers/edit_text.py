@@ -1,8 +1,8 @@
 # handlers/edit_text.py
 from telebot.types import Message, CallbackQuery
 from state import user_drafts, store_lock, user_states
-from utils.openai_utils import _openai_chat
-from utils.tg_utils import action_keyboard, send_post_with_image
+from utils.openai_utils import edit_post_sections
+from utils.tg_utils import action_keyboard, send_draft_post, post_html
 
 
 def register(bot):
@@ -19,23 +19,15 @@ def apply_edit_instruction(bot, msg: Message):
 
     if not draft:
         bot.send_message(user_id, "❌ Нет активного черновика.")
-        user_states.pop(user_id, None)
         return
 
-    prompt = (
-        "Отредактируй текст строго по инструкции. Сохрани факты, улучшай структуру и ясность. "
-        "Верни только готовый текст без пояснений.\n\n"
-        f"ТЕКСТ:\n{draft['text']}\n\nИНСТРУКЦИЯ:\n{(msg.text or '').strip()}"
-    )
     try:
-        new_text = _openai_chat([{"role": "user", "content": prompt}], "gpt-4o")
+        new_text = edit_post_sections(draft["text"], (msg.text or "").strip())
     except Exception as e:
         bot.send_message(user_id, f"❌ Не получилось отредактировать: {e}")
-        user_states.pop(user_id, None)
         return
 
     with store_lock:
         draft["text"] = new_text
 
-    send_post_with_image(bot, user_id, new_text, draft["image_bytes"], reply_markup=action_keyboard())
-    user_states.pop(user_id, None)
+    send_draft_post(bot, user_id, post_html(new_text), draft, reply_markup=action_keyboard(), parse_mode="HTML")
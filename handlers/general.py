@@ -2,8 +2,21 @@
 from telebot.types import Message
 from utils.openai_utils import generate_text, generate_image_prompt
 from utils.yandex_utils import generate_image_bytes_with_yc
-from utils.tg_utils import action_keyboard, send_post_with_image
+from utils.image_index import image_index
+from utils.tg_utils import (
+    action_keyboard,
+    send_draft_post,
+    fresh_image_keyboard,
+    cancel_generation_keyboard,
+    post_html,
+)
+from utils.chat_dispatcher import run_in_background
+from utils.progress import ProgressReporter
+from utils.cancellation import Generation, GenerationCancelled, generations
+from utils.admission import AdmissionRejected, admission
 from state import user_drafts, store_lock, user_states
+from typing import Optional
+import html
 import logging
 
 log = logging.getLogger("tg-vk-bot")
@@ -59,7 +72,7 @@ def register(bot):
             "• Публикация: Пн/Ср/Пт 19:00 МСК\n\n"
             "✏️ Редактирование:\n"
             "• Изменить текст - отредактировать содержание\n"
-            "• Изменить картинку - новое изображение\n\n"
+            "• Изменить картинку - несколько вариантов на выбор\n\n"
             "📤 Публикация:\n"
             "• В Telegram - с изображением\n"
             "• В VK - с изображением\n\n"
@@ -84,17 +97,26 @@ def register(bot):
 
         try:
             topic = draft.get("topic", "Неизвестная тема")
-            full_text = "📝 **Текущий черновик**\n"
-            full_text += f"🏷️ Тема: _{topic}_\n\n"
-            full_text += draft["text"]
+            # Текст поста — HTML из разобранного Markdown: непарный маркер не ломает отправку
+            full_text = "📝 <b>Текущий черновик</b>\n"
+            full_text += f"🏷️ Тема: <i>{html.escape(topic)}</i>\n\n"
+            full_text += post_html(draft["text"])
 
-            send_post_with_image(
-                bot, user_id, full_text, draft["image_bytes"], reply_markup=action_keyboard(), parse_mode="Markdown"
-            )
+            send_draft_post(bot, user_id, full_text, draft, reply_markup=action_keyboard(), parse_mode="HTML")
         except Exception as e:
             log.exception("Error showing draft")
             bot.send_message(user_id, f"❌ Ошибка отображения черновика: {e}")
 
+    @bot.callback_query_handler(func=lambda c: c.data.startswith("cancel_generation_"))
+    def cancel_generation(call):
+        generation_id = int(call.data.split("_")[-1])
+        if generations.cancel(call.message.chat.id, generation_id=generation_id):
+            bot.answer_callback_query(call.id, "⏹ Отменяю генерацию…")
+            # Генерация, ещё ждущая в очереди, снимается сразу
+            admission.pump()
+        else:
+            bot.answer_callback_query(call.id, "Генерация уже завершена")
+
     # Обработчик неизвестных команд
     @bot.message_handler(func=lambda m: m.content_type == "text" and m.text.startswith("/"))
     def unknown_command(msg: Message):
@@ -132,25 +154,85 @@ def register(bot):
             handle_planning_message(bot, msg)
             return
 
-        # Существующие состояния
+        # Существующие состояния. Состояние снимаем сразу: правка выполняется в фоне,
+        # и следующее сообщение не должно попасть в ту же правку
         if state == "waiting_edit_hint":
             from handlers.edit_text import apply_edit_instruction
 
-            apply_edit_instruction(bot, msg)
+            user_states.pop(user_id, None)
+            run_in_background(bot, user_id, apply_edit_instruction, bot, msg)
             return
         if state == "waiting_image_hint":
             from handlers.edit_image import apply_image_instruction
 
-            apply_image_instruction(bot, msg)
+            user_states.pop(user_id, None)
+            run_in_background(bot, user_id, apply_image_instruction, bot, msg)
             return
 
-        # Обычная генерация поста
-        handle_topic(bot, msg)
+        # Обычная генерация поста. Новая тема сразу отменяет предыдущую генерацию чата,
+        # даже если та ещё ждёт своей очереди
+        submit_topic(bot, msg, generations.start(user_id))
+
+
+def submit_topic(bot, msg: Message, generation: Generation):
+    """
+    Ставит генерацию поста в общую очередь генераций. Статусное сообщение отправляется
+    сразу: пока генерация ждёт, в нём виден номер в очереди и примерное время ожидания.
+    """
+    topic = (msg.text or "").strip()
+    progress = ProgressReporter(
+        bot,
+        msg.chat.id,
+        f"🚀 Быстрый режим\n📝 Тема: {topic}",
+        reply_markup=cancel_generation_keyboard(generation.id),
+    ).start()
+    queued = []
+
+    def on_queue(position: int, eta: float):
+        text = f"В очереди: №{position}, ожидание ~{eta:.0f} с"
+        if queued:
+            progress.update(text)
+        else:
+            queued.append(position)
+            progress.stage(text)
+
+    def on_cancel():
+        generations.finish(generation)
+        progress.fail(f"⏹ Генерация отменена: {generation.reason or 'не удалось запустить'}")
+
+    try:
+        admission.submit(
+            msg.chat.id,
+            handle_topic,
+            bot,
+            msg,
+            generation,
+            progress,
+            on_queue=on_queue,
+            on_cancel=on_cancel,
+            cancelled=lambda: generation.cancelled,
+        )
+    except AdmissionRejected:
+        generations.finish(generation)
+        progress.fail("🚦 Сейчас слишком много запросов — очередь заполнена. Попробуйте через минуту.")
+
+
+def handle_topic(
+    bot, msg: Message, generation: Optional[Generation] = None, progress: Optional[ProgressReporter] = None
+):
+    generation = generation or generations.start(msg.chat.id)
+    try:
+        with generation.activate():
+            _generate_post(bot, msg, generation, progress)
+    finally:
+        generations.finish(generation)
 
 
-def handle_topic(bot, msg: Message):
+def _generate_post(bot, msg: Message, generation: Generation, progress: Optional[ProgressReporter] = None):
     topic = (msg.text or "").strip()
     if not topic:
+        if progress is not None:
+            progress.delete()
         bot.send_message(
             msg.chat.id,
             "🤔 Пожалуйста, укажите тему поста.\n\n"
@@ -163,52 +245,82 @@ def handle_topic(bot, msg: Message):
         )
         return
 
-    # Показываем индикатор режима
-    status_msg = bot.send_message(
-        msg.chat.id,
-        f"🚀 **Быстрый режим**\n"
-        f"📝 Тема: _{topic}_\n\n"
-        f"⏳ Генерирую пост и изображение...\n"
-        f"Это займёт ~10–20 секунд",
-        parse_mode="Markdown",
-    )
+    if generation.cancelled:
+        # Пока генерация ждала очереди, пришла новая тема или её отменили
+        if progress is not None:
+            progress.fail(f"⏹ Генерация отменена: {generation.reason}")
+        return
+
+    # Одно статусное сообщение: этапы генерации показываются правками, а не новыми сообщениями
+    if progress is None:
+        progress = ProgressReporter(
+            bot,
+            msg.chat.id,
+            f"🚀 Быстрый режим\n📝 Тема: {topic}",
+            reply_markup=cancel_generation_keyboard(generation.id),
+        ).start()
 
     try:
-        # Генерируем контент
+        # Генерируем контент; перед каждым этапом проверяем, не отменена ли генерация
+        generation.check()
+        progress.stage("Пишу текст")
         text = generate_text(topic)
+        generation.check()
+        progress.stage("Составляю промпт для изображения")
         prompt = generate_image_prompt(text)
-        image_bytes = generate_image_bytes_with_yc(prompt)
 
-        # Удаляем статусное сообщение
-        try:
-            bot.delete_message(msg.chat.id, status_msg.message_id)
-        except BaseException:
-            pass  # Игнорируем ошибки удаления
+        # Похожий промпт уже генерировали — сразу показываем готовую картинку
+        match = image_index.find(prompt)
+        image_bytes = image_index.load(match[0]) if match else None
+        reused = bool(image_bytes)
+        if reused:
+            log.info(f"Reusing indexed image (similarity {match[1]:.2f}) for topic: {topic}")
+        else:
+            generation.check()
+            progress.stage("Генерирую изображение")
+            image_bytes = generate_image_bytes_with_yc(prompt)
+            image_index.add(prompt, image_bytes)
+
+        # Отменённый результат не должен заменить черновик
+        generation.check()
+
+        # Пост будет отдельным сообщением — статусное больше не нужно
+        progress.delete()
+
+    except GenerationCancelled as e:
+        log.info(f"Generation for topic cancelled ({e}): {topic}")
+        progress.fail(f"⏹ Генерация отменена: {e}")
+        return
 
     except Exception as e:
         log.exception("Ошибка генерации")
-        bot.edit_message_text(
-            f"❌ **Ошибка генерации**\n\n"
-            f"Не удалось создать пост по теме: _{topic}_\n"
-            f"Ошибка: `{str(e)[:100]}...`\n\n"
-            f"Попробуйте другую тему или повторите попытку.",
-            msg.chat.id,
-            status_msg.message_id,
-            parse_mode="Markdown",
+        progress.fail(
+            f"❌ Не удалось создать пост: {str(e)[:100]}\n"
+            f"Попробуйте другую тему или повторите попытку."
         )
         return
 
     # Сохраняем черновик
     with store_lock:
-        user_drafts[msg.chat.id] = {"text": text, "image_bytes": image_bytes, "topic": topic, "created_at": msg.date}
+        draft = user_drafts[msg.chat.id] = {
+            "text": text,
+            "image_bytes": image_bytes,
+            "image_prompt": prompt,
+            "topic": topic,
+            "created_at": msg.date,
+        }
 
     try:
         # Отправляем готовый пост без ограничений длины
-        full_text = f"✅ **Пост готов!**\n\n{text}"
+        full_text = f"✅ <b>Пост готов!</b>\n\n{post_html(text)}"
 
-        send_post_with_image(
-            bot, msg.chat.id, full_text, image_bytes, reply_markup=action_keyboard(), parse_mode="Markdown"
-        )
+        send_draft_post(bot, msg.chat.id, full_text, draft, reply_markup=action_keyboard(), parse_mode="HTML")
+        if reused:
+            bot.send_message(
+                msg.chat.id,
+                "♻️ Картинка взята из ранее сгенерированных по похожему промпту.",
+                reply_markup=fresh_image_keyboard(),
+            )
 
         # Дополнительная информация
         bot.send_message(
@@ -2,7 +2,8 @@
 from telebot.types import CallbackQuery
 from config import TELEGRAM_CHANNEL_ID
 from state import user_drafts, store_lock
-from utils.tg_utils import send_post_with_image
+from utils.tg_utils import send_post_with_image, draft_file_id
+from utils.image_renditions import get_rendition
 import logging
 
 log = logging.getLogger("tg-vk-bot")
@@ -23,7 +24,11 @@ def register(bot):
             # Для каналов используем полный текст без обрезки, очищенный от Markdown
             from utils.tg_utils import clean_markdown
 
-            send_post_with_image(bot, TELEGRAM_CHANNEL_ID, clean_markdown(draft["text"]), draft["image_bytes"])
+            # Картинку уже видели в превью — публикуем по её file_id, не загружая байты повторно.
+            # Превью загружало версию для Telegram; она же уходит, если file_id не примут
+            file_id = draft_file_id(draft)
+            image = get_rendition(draft["image_bytes"], "tg")
+            send_post_with_image(bot, TELEGRAM_CHANNEL_ID, clean_markdown(draft["text"]), image, file_id=file_id)
         except Exception as e:
             log.exception("Ошибка публикации в канал")
             bot.answer_callback_query(call.id, "❌ Ошибка публикации в Telegram")
@@ -4,6 +4,7 @@ from config import VK_GROUP_ID
 from state import user_drafts, store_lock
 from utils.tg_utils import smart_vk_text
 from utils.vk_utils import vk_publish_text, vk_post_url, vk_publish_with_image_required
+from utils.image_renditions import get_rendition
 import logging
 
 log = logging.getLogger("tg-vk-bot")
@@ -23,7 +24,9 @@ def register(bot):
         bot.answer_callback_query(call.id, "Публикуем в VK…")
         try:
             # Используем функцию с гарантированной публикацией с картинкой
-            post_id = vk_publish_with_image_required(VK_GROUP_ID, draft["image_bytes"], smart_vk_text(draft["text"]))
+            post_id = vk_publish_with_image_required(
+                VK_GROUP_ID, get_rendition(draft["image_bytes"], "vk"), smart_vk_text(draft["text"])
+            )
             url = vk_post_url(VK_GROUP_ID, post_id)
             bot.send_message(chat_id, f"✅ Опубликовано с картинкой: {url}")
         except Exception as e:
@@ -47,7 +50,9 @@ def register(bot):
 
         # Сначала пытаемся с картинкой
         try:
-            post_id = vk_publish_with_image_required(VK_GROUP_ID, draft["image_bytes"], smart_vk_text(draft["text"]))
+            post_id = vk_publish_with_image_required(
+                VK_GROUP_ID, get_rendition(draft["image_bytes"], "vk"), smart_vk_text(draft["text"])
+            )
             url = vk_post_url(VK_GROUP_ID, post_id)
             bot.send_message(chat_id, f"✅ Опубликовано с картинкой: {url}")
             return
@@ -8,9 +8,12 @@ import pytz
 from typing import Optional
 from dataclasses import dataclass, asdict
 import base64
+from contextlib import contextmanager
 
 from state import scheduled_posts, store_lock, save_state, save_image_to_file, load_image_from_file, delete_image_file
 from utils.openai_utils import generate_topics
+from utils.llm_client import PRIORITY_BACKGROUND
+from utils.tg_send_queue import background_sends
 from config import TELEGRAM_CHANNEL_ID, VK_GROUP_ID
 
 log = logging.getLogger("tg-vk-bot")
@@ -28,6 +31,9 @@ class ScheduledPost:
     status: str = "pending"  # pending, published_tg, published_vk, completed, failed
     post_id_tg: Optional[str] = None
     post_id_vk: Optional[str] = None
+    image_operation_id: Optional[str] = None  # Незавершённая генерация YandexArt
+    image_dhash: Optional[str] = None  # Перцептивный хэш картинки для поиска повторов
+    image_file_id: Optional[str] = None  # file_id картинки в Telegram после первой отправки
     
     @property
     def image_bytes(self):
@@ -41,11 +47,48 @@ class ScheduledPost:
         """Сохраняет изображение в файл"""
         if self.image_filename:
             delete_image_file(self.image_filename)
+        # file_id и хэш относились к прежней картинке
+        self.image_file_id = None
+        self.image_dhash = None
         if value:
             self.image_filename = save_image_to_file(value)
         else:
             self.image_filename = None
 
+    @contextmanager
+    def open_image(self, platform: str):
+        """
+        Открытый на чтение файл версии изображения для площадки ("tg"/"vk") или None.
+        Версия кэшируется рядом с оригиналом; файл отправляется потоком, без копии в памяти.
+        """
+        from utils.image_renditions import rendition_file
+
+        path = rendition_file(self.image_filename, platform) if self.image_filename else None
+        if not path:
+            yield None
+            return
+        with open(path, "rb") as f:
+            yield f
+
+    @property
+    def rendered(self):
+        """Версии текста для площадок (plain/html/vk); кэшируются по тексту поста"""
+        from utils.markdown_render import render_markdown
+
+        return render_markdown(self.text or "")
+
+    def ensure_image_dhash(self) -> Optional[str]:
+        """Считает перцептивный хэш картинки, если он ещё не посчитан"""
+        if not self.image_dhash and self.image_filename:
+            from utils.image_index import dhash
+
+            image_bytes = self.image_bytes
+            try:
+                self.image_dhash = dhash(image_bytes) if image_bytes else None
+            except Exception as e:
+                log.warning(f"Cannot hash image {self.image_filename}: {e}")
+        return self.image_dhash
+
     def to_dict(self):
         """Конвертирует в словарь для сохранения в JSON"""
         data = asdict(self)
@@ -114,8 +157,9 @@ class ContentScheduler:
             self.scheduler_thread.join(timeout=5)
         log.info("Content scheduler stopped")
 
+    @background_sends
     def _run_scheduler(self):
-        """Основной цикл планировщика"""
+        """Основной цикл планировщика; его сообщения уступают очередь ответам пользователям"""
         while self.running:
             try:
                 # Проверяем расписание
@@ -133,7 +177,7 @@ class ContentScheduler:
 
         try:
             log.info("Generating weekly topics...")
-            topics = generate_topics()
+            topics = generate_topics(priority=PRIORITY_BACKGROUND)
 
             # Сохраняем темы в состояние
             with store_lock:
@@ -196,11 +240,19 @@ class ContentScheduler:
             telegram_success = bool(post.post_id_tg)  # Уже опубликовано если есть post_id_tg
             if not telegram_success:
                 try:
-                    from utils.tg_utils import send_post_with_image, clean_markdown
-
-                    tg_msg = send_post_with_image(
-                        self.bot, TELEGRAM_CHANNEL_ID, clean_markdown(post.text), post.image_bytes
-                    )
+                    from utils.tg_utils import send_post_with_image
+
+                    # Картинка уже загружалась в Telegram для превью — отправляем по file_id, файл не читается.
+                    # Новый file_id сохраняется с постом: повторная попытка не загрузит картинку снова
+                    with post.open_image("tg") as image:
+                        tg_msg = send_post_with_image(
+                            self.bot,
+                            TELEGRAM_CHANNEL_ID,
+                            post.rendered.plain,
+                            image,
+                            file_id=post.image_file_id,
+                            on_upload=lambda file_id: setattr(post, "image_file_id", file_id),
+                        )
                     post.post_id_tg = str(tg_msg.message_id)
                     telegram_success = True
                     log.info("Published to Telegram")
@@ -218,10 +270,10 @@ class ContentScheduler:
             if not vk_success:
                 try:
                     from utils.vk_utils import vk_publish_with_image_required, vk_post_url
-                    from utils.tg_utils import smart_vk_text
 
                     # Публикация в VK с картинкой и умной обработкой текста
-                    post_id_vk = vk_publish_with_image_required(VK_GROUP_ID, post.image_bytes, smart_vk_text(post.text))
+                    with post.open_image("vk") as image:
+                        post_id_vk = vk_publish_with_image_required(VK_GROUP_ID, image, post.rendered.vk)
                     post.post_id_vk = str(post_id_vk)
                     vk_success = True
 
@@ -287,6 +339,8 @@ class ContentScheduler:
             with store_lock:
                 posts_queue[0] = post.to_dict()
                 if post.status == "completed":
+                    # Хэш картинки остаётся в архиве для поиска визуальных повторов
+                    post.ensure_image_dhash()
                     # Удаляем изображение только после успешной публикации в обеих соцсетях
                     post.cleanup_image()
                     # Удаляем опубликованный пост из очереди
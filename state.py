@@ -1,3 +1,4 @@
+import glob
 import threading
 from typing import Dict, Any
 import json
@@ -85,6 +86,10 @@ def delete_image_file(filename):
         if os.path.exists(filepath):
             os.remove(filepath)
             print(f"Image file deleted: {filename}")
+        # Версии под площадки (<имя>.tg.jpg, <имя>.vk.jpg) удаляем вместе с оригиналом
+        stem = os.path.splitext(filename)[0]
+        for rendition in glob.glob(os.path.join(TEMP_IMAGES_DIR, f"{glob.escape(stem)}.*.jpg")):
+            os.remove(rendition)
     except Exception as e:
         print(f"Error deleting image file: {e}")
 
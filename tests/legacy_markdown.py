@@ -0,0 +1,38 @@
+# tests/legacy_markdown.py
+"""
+Прежняя очистка Markdown — цепочка re.sub из utils/tg_utils.clean_markdown до
+перехода на utils/markdown_render. Эталон для проверки эквивалентности и замера.
+"""
+import re
+
+
+def legacy_clean_markdown(text: str) -> str:
+    if not text:
+        return ""
+
+    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
+    text = re.sub(r"__(.*?)__", r"\1", text)
+    text = re.sub(r"\*(.*?)\*", r"\1", text)
+    text = re.sub(r"_(.*?)_", r"\1", text)
+    text = re.sub(r"^#{1,6}\s*", "", text, flags=re.MULTILINE)
+    text = re.sub(r"(?<!\S)\*(?!\S)", "", text)
+    text = re.sub(r"(?<!\S)#(?!\S)", "", text)
+    return text.strip()
+
+
+def legacy_smart_vk_text(text: str) -> str:
+    if not text:
+        return ""
+
+    clean_text = legacy_clean_markdown(text)
+    if len(clean_text) <= 15000:
+        return clean_text
+
+    truncated = clean_text[:14500]
+    last_sentence = truncated.rfind(".")
+    if last_sentence > 10000:
+        return truncated[: last_sentence + 1] + "\n\n... (продолжение в комментариях)"
+    last_paragraph = truncated.rfind("\n\n")
+    if last_paragraph > 8000:
+        return truncated[:last_paragraph] + "\n\n... (продолжение в комментариях)"
+    return truncated + "..."
@@ -0,0 +1,13 @@
+"""
+Тесты админских сообщений
+"""
+
+
+def test_topics_are_escaped_for_markdown():
+    """Темы с символами разметки не ломают сообщение статистики"""
+    from handlers.admin import _escape_markdown
+
+    assert _escape_markdown("Кислоты_AHA и *пилинги* [2024] `тест`") == (
+        "Кислоты\\_AHA и \\*пилинги\\* \\[2024] \\`тест\\`"
+    )
+    assert _escape_markdown("Уход за кожей.") == "Уход за кожей."
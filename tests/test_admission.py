@@ -0,0 +1,142 @@
+"""
+Тесты допуска генераций: лимит одновременных генераций, номера в очереди и отказ при переполнении
+"""
+import threading
+import time
+
+import pytest
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def _controller(limit, queue_size):
+    from utils.admission import AdmissionController
+    from utils.chat_dispatcher import ChatDispatcher
+
+    return AdmissionController(limit, queue_size, dispatcher=ChatDispatcher(max_workers=8))
+
+
+def test_limit_and_queue_positions():
+    from utils.admission import DEFAULT_DURATION
+
+    admission = _controller(limit=2, queue_size=5)
+    release = threading.Event()
+    running, peak, done, updates = [], [], [], {}
+
+    def task(i):
+        running.append(i)
+        peak.append(len(running))
+        release.wait(5)
+        running.remove(i)
+        done.append(i)
+
+    def on_queue(chat):
+        return lambda position, eta: updates.setdefault(chat, []).append((position, eta))
+
+    positions = [admission.submit(chat, task, chat, on_queue=on_queue(chat)) for chat in range(5)]
+    assert positions == [0, 0, 1, 2, 3]
+    # Генерации идут волнами по limit штук: №3 ждёт две волны
+    assert updates[4] == [(3, 2 * DEFAULT_DURATION)]
+
+    _wait_for(lambda: len(running) == 2)
+    assert admission.stats()["queued"] == 3
+
+    release.set()
+    _wait_for(lambda: len(done) == 5)
+    assert max(peak) <= 2
+    # Ожидающие узнают о продвижении очереди
+    seen = [pos for pos, _ in updates[4]]
+    assert seen == sorted(set(seen), reverse=True) and seen[-1] >= 1
+    stats = admission.stats()
+    assert stats["running"] == 0 and stats["queued"] == 0 and stats["admitted"] == 5
+    assert stats["average"] is not None
+
+
+def test_full_queue_is_rejected():
+    from utils.admission import AdmissionRejected
+
+    admission = _controller(limit=1, queue_size=1)
+    release = threading.Event()
+    done = []
+    task = lambda: (release.wait(5), done.append(1))
+
+    assert admission.submit(1, task) == 0
+    assert admission.submit(2, task) == 1
+    with pytest.raises(AdmissionRejected):
+        admission.submit(3, task)
+    assert admission.stats()["rejected"] == 1
+
+    release.set()
+    _wait_for(lambda: len(done) == 2)
+
+
+def test_cancelled_entry_leaves_queue():
+    """Отменённый запрос не занимает место в очереди и не запускается"""
+    from utils.cancellation import Generation
+
+    admission = _controller(limit=1, queue_size=1)
+    release = threading.Event()
+    done, cancelled = [], []
+    task = lambda name: (release.wait(5), done.append(name))
+
+    admission.submit(1, task, "первый")
+    generation = Generation(2)
+    admission.submit(
+        2, task, "отменённый", on_cancel=lambda: cancelled.append(2), cancelled=lambda: generation.cancelled
+    )
+    generation.cancel("отменено пользователем")
+
+    # Место освободилось — следующий запрос принимается
+    assert admission.submit(3, task, "третий") == 1
+    assert cancelled == [2]
+
+    release.set()
+    _wait_for(lambda: len(done) == 2)
+    assert done == ["первый", "третий"]
+
+
+def test_busy_chat_does_not_hold_a_slot():
+    """Запрос чата, занятого своей долгой задачей, ждёт в очереди, а место получает другой чат"""
+    from utils.admission import AdmissionController
+    from utils.chat_dispatcher import ChatDispatcher
+
+    dispatcher = ChatDispatcher(max_workers=4)
+    admission = AdmissionController(limit=1, queue_size=5, dispatcher=dispatcher)
+    planning, release = threading.Event(), threading.Event()
+    order = []
+
+    dispatcher.submit(1, planning.wait, 5)  # Недельный план чата 1
+    assert admission.submit(1, lambda: order.append(1)) == 1
+    assert admission.submit(2, lambda: (release.wait(5), order.append(2))) == 0
+    assert admission.stats()["queued"] == 1
+
+    # Чат 1 освободился, но место занято чатом 2 — ждёт его
+    planning.set()
+    _wait_for(lambda: dispatcher.pending(1) == 0)
+    assert order == []
+    release.set()
+    _wait_for(lambda: order == [2, 1])
+    _wait_for(lambda: admission.stats()["running"] == 0)
+
+
+def test_failed_dispatch_releases_the_slot():
+    from utils.admission import AdmissionController
+    from utils.chat_dispatcher import ChatDispatcher
+
+    class BrokenDispatcher(ChatDispatcher):
+        def submit(self, chat_id, fn, *args, **kwargs):
+            raise RuntimeError("пул остановлен")
+
+    admission = AdmissionController(limit=1, queue_size=5, dispatcher=BrokenDispatcher(max_workers=1))
+    cancelled = []
+
+    admission.submit(1, lambda: None, on_cancel=lambda: cancelled.append(1))
+
+    assert cancelled == [1]
+    stats = admission.stats()
+    assert stats["running"] == 0 and stats["starting"] == 0
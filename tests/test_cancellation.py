@@ -0,0 +1,63 @@
+"""
+Тесты отмены устаревших генераций
+"""
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+
+def test_new_generation_supersedes_previous():
+    from utils.cancellation import GenerationRegistry, SUPERSEDED
+
+    registry = GenerationRegistry()
+    first = registry.start(1)
+    other_chat = registry.start(2)
+    second = registry.start(1)
+
+    assert first.cancelled and first.reason == SUPERSEDED
+    assert not second.cancelled and not other_chat.cancelled
+
+    # Кнопка со старого сообщения не отменяет новую генерацию
+    assert not registry.cancel(1, generation_id=first.id)
+    assert registry.cancel(1, generation_id=second.id)
+    assert second.cancelled
+    assert registry.stats()["cancelled"] == 2
+
+    registry.finish(first)
+    registry.finish(second)
+    assert registry.stats()["active"] == 1
+
+
+def test_wait_interrupted_by_cancel():
+    """Ожидание результата прерывается отменой, а ещё не начатая задача отменяется"""
+    from utils.cancellation import Generation, GenerationCancelled
+
+    generation = Generation(1)
+    future = Future()
+    threading.Timer(0.05, generation.cancel, args=("пришла новая тема",)).start()
+
+    started = time.monotonic()
+    with pytest.raises(GenerationCancelled, match="новая тема"):
+        generation.wait(future, timeout=5)
+    assert time.monotonic() - started < 1
+    assert future.cancelled()
+
+
+def test_llm_request_skipped_after_cancel():
+    """Запрос отменённой генерации не уходит в OpenAI"""
+    from utils.cancellation import Generation, GenerationCancelled
+    from utils.llm_client import LLMClient
+
+    class FailingSession:
+        def post(self, *args, **kwargs):
+            raise AssertionError("запрос не должен отправляться")
+
+    client = LLMClient("key", rpm=60, tpm=100000)
+    client.session = FailingSession()
+    generation = Generation(1)
+    generation.cancel("отменено пользователем")
+
+    with generation.activate(), pytest.raises(GenerationCancelled):
+        client.chat({"messages": [{"role": "user", "content": "тема"}]})
@@ -0,0 +1,64 @@
+"""
+Тесты пула долгих обработчиков: порядок задач внутри чата и независимость чатов
+"""
+import threading
+import time
+
+
+def test_tasks_of_one_chat_run_in_order():
+    """Задачи одного чата выполняются строго по очереди, даже если потоков в пуле несколько"""
+    from utils.chat_dispatcher import ChatDispatcher
+
+    dispatcher = ChatDispatcher(max_workers=4)
+    done, running, overlaps = [], [], []
+
+    def task(i):
+        running.append(i)
+        if len(running) > 1:
+            overlaps.append(i)
+        time.sleep(0.01)
+        running.remove(i)
+        done.append(i)
+
+    futures = [dispatcher.submit(1, task, i)[0] for i in range(5)]
+    for future in futures:
+        future.result(timeout=5)
+
+    assert done == [0, 1, 2, 3, 4]
+    assert overlaps == []
+    assert dispatcher.pending(1) == 0
+
+
+def test_long_chat_does_not_block_other_chats():
+    """Долгая задача одного чата не задерживает короткую задачу другого"""
+    from utils.chat_dispatcher import ChatDispatcher
+
+    dispatcher = ChatDispatcher(max_workers=2)
+    release = threading.Event()
+
+    slow, ahead = dispatcher.submit("admin", release.wait, 5)
+    assert ahead == 0
+    queued, ahead = dispatcher.submit("admin", lambda: "second")
+    assert ahead == 1
+
+    assert dispatcher.submit("user", lambda: "quick")[0].result(timeout=2) == "quick"
+    assert not queued.done()
+
+    release.set()
+    assert queued.result(timeout=5) == "second"
+
+
+def test_errors_do_not_stop_chat_queue():
+    """Ошибка в задаче попадает в её Future, следующие задачи чата выполняются"""
+    from utils.chat_dispatcher import ChatDispatcher
+
+    dispatcher = ChatDispatcher(max_workers=1)
+
+    def fail():
+        raise ValueError("boom")
+
+    failed, _ = dispatcher.submit(1, fail)
+    ok, _ = dispatcher.submit(1, lambda: 42)
+
+    assert ok.result(timeout=5) == 42
+    assert isinstance(failed.exception(timeout=5), ValueError)
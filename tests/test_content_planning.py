@@ -0,0 +1,51 @@
+"""
+Тесты недельного плана: запись генерации изображений одна на бота
+"""
+from concurrent.futures import Future
+from unittest.mock import Mock
+
+
+def test_second_plan_does_not_replace_images_record(monkeypatch):
+    """Пока изображения первого плана не готовы, второй план не затирает его черновики"""
+    from handlers import content_planning
+    from state import scheduled_posts
+
+    monkeypatch.setattr(content_planning, "save_state", lambda: None)
+    monkeypatch.delitem(scheduled_posts, "planning_images", raising=False)
+
+    first = content_planning._start_planning_images(1)
+    first["posts"].append({"topic": "первый план"})
+    assert content_planning._start_planning_images(2) is None
+    assert scheduled_posts["planning_images"] is first
+
+    # Завершение чужой записи не снимает текущую, а черновики берутся из переданных, а не из общей записи
+    failed = Future()
+    failed.set_exception(RuntimeError("YandexArt недоступен"))
+    stale = {"chat_id": 3, "posts": [], "prompts": []}
+    progress = Mock()
+    content_planning._finish_planning_images(
+        Mock(), stale, {0: ({"topic": "старый", "text": "t", "publish_date": None}, "p", failed)}, progress
+    )
+
+    assert scheduled_posts["planning_images"] is first
+    progress.fail.assert_called_once()
+
+    content_planning._finish_planning_images(Mock(), first, {}, Mock())
+    assert "planning_images" not in scheduled_posts
+
+
+def test_finished_batch_is_saved_as_done(monkeypatch):
+    """Завершённый пакет снимается и с диска: после перезапуска он не обрабатывается повторно"""
+    from handlers import content_planning
+    from state import scheduled_posts
+
+    saved = []
+    monkeypatch.setattr(content_planning, "save_state", lambda: saved.append("planning_batch" in scheduled_posts))
+    monkeypatch.delitem(scheduled_posts, "planning_images", raising=False)
+    job = {"chat_id": 1, "batch_id": "batch-1", "stage": "prompts", "posts": [{"topic": "тема", "text": ""}]}
+    monkeypatch.setitem(scheduled_posts, "planning_batch", job)
+
+    content_planning._finish_batch_prompts(Mock(), job, {})
+
+    assert "planning_batch" not in scheduled_posts
+    assert saved and saved[0] is False
@@ -0,0 +1,43 @@
+"""
+Тесты правки картинки черновика
+"""
+from unittest.mock import Mock
+
+
+def test_fresh_image_runs_in_background(monkeypatch):
+    """Кнопка «Новая картинка» сразу отвечает на нажатие, а генерация идёт в пуле обработчиков"""
+    from handlers import edit_image
+    from state import user_drafts
+
+    handlers = {}
+    bot = Mock()
+    bot.callback_query_handler.side_effect = lambda func: lambda fn: handlers.setdefault(fn.__name__, fn)
+    background = Mock()
+    monkeypatch.setattr(edit_image, "run_in_background", background)
+    generate = Mock(side_effect=AssertionError("генерация не в потоке бота"))
+    monkeypatch.setattr(edit_image, "generate_image_bytes_with_yc", generate)
+    monkeypatch.setitem(user_drafts, 7, {"text": "текст", "image_prompt": "крем на белом фоне"})
+
+    edit_image.register(bot)
+    handlers["fresh_image"](Mock(id="cb", message=Mock(chat=Mock(id=7))))
+
+    bot.answer_callback_query.assert_called_once()
+    background.assert_called_once_with(bot, 7, edit_image.regenerate_image, bot, 7)
+
+
+def test_regenerate_image_updates_draft(monkeypatch):
+    from handlers import edit_image
+    from state import user_drafts
+
+    draft = {"text": "текст", "image_prompt": "крем на белом фоне", "image_bytes": b"old"}
+    monkeypatch.setitem(user_drafts, 7, draft)
+    monkeypatch.setattr(edit_image, "generate_image_bytes_with_yc", lambda prompt: b"new")
+    monkeypatch.setattr(edit_image.image_index, "add", Mock())
+    send = Mock()
+    monkeypatch.setattr(edit_image, "send_draft_post", send)
+
+    edit_image.regenerate_image(Mock(), 7)
+
+    assert draft["image_bytes"] == b"new"
+    edit_image.image_index.add.assert_called_once_with("крем на белом фоне", b"new")
+    send.assert_called_once()
@@ -0,0 +1,70 @@
+"""
+Тесты индекса сгенерированных изображений
+"""
+import io
+
+from PIL import Image, ImageDraw
+
+
+def _image(color, circle=(40, 40, 200, 200), size=256) -> bytes:
+    image = Image.new("RGB", (size, size), "white")
+    ImageDraw.Draw(image).ellipse(circle, fill=color)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def test_dhash_matches_near_duplicates():
+    """Пережатая и слегка изменённая картинка близка по dHash, другая композиция — нет"""
+    from utils.image_index import dhash, hamming, DUPLICATE_DISTANCE
+
+    original = dhash(_image("pink"))
+    resized = Image.open(io.BytesIO(_image("pink"))).resize((200, 200))
+    buffer = io.BytesIO()
+    resized.save(buffer, "JPEG", quality=60)
+
+    assert hamming(original, dhash(buffer.getvalue())) <= DUPLICATE_DISTANCE
+    assert hamming(original, dhash(_image("pink", circle=(150, 10, 250, 120)))) > DUPLICATE_DISTANCE
+
+
+def test_index_finds_similar_prompt(tmp_path):
+    """Похожий промпт находит сохранённую картинку, непохожий — нет"""
+    from utils.image_index import ImageIndex
+
+    index = ImageIndex(str(tmp_path / "index.json"), str(tmp_path / "cache"), min_similarity=0.6)
+    image = _image("pink")
+    index.add("Минималистичное фото: крем для лица на белом фоне, мягкий свет", image)
+
+    match = index.find("минималистичное фото, крем для лица на чистом белом фоне, мягкий свет")
+    assert match is not None
+    assert index.load(match[0]) == image
+    assert index.find("мужчина бреется в ванной") is None
+
+    # Индекс переживает перезапуск
+    reloaded = ImageIndex(str(tmp_path / "index.json"), str(tmp_path / "cache"), min_similarity=0.6)
+    assert reloaded.find("крем для лица на белом фоне, мягкий свет, минималистичное фото") is not None
+
+
+def test_find_duplicates_in_archive():
+    from utils.image_index import dhash, find_duplicates
+
+    archive = [("a", dhash(_image("pink"))), ("b", dhash(_image("blue", (150, 10, 250, 120)))), ("c", None)]
+    archive.append(("d", dhash(_image("pink"))))
+    assert [(a, b) for a, b, _ in find_duplicates(archive)] == [("a", "d")]
+
+
+def test_replaced_image_is_rehashed(tmp_path, monkeypatch):
+    """После замены картинки поста хэш и file_id считаются заново"""
+    import state
+    from scheduler import ScheduledPost
+    from utils.image_index import dhash
+
+    monkeypatch.setattr(state, "TEMP_IMAGES_DIR", str(tmp_path))
+    post = ScheduledPost(topic="тема", text="текст")
+    post.image_bytes = _image("pink")
+    post.image_file_id = "old-file-id"
+    assert post.ensure_image_dhash() == dhash(_image("pink"))
+
+    post.image_bytes = _image("blue", (150, 10, 250, 120))
+    assert post.image_file_id is None
+    assert post.ensure_image_dhash() == dhash(_image("blue", (150, 10, 250, 120)))
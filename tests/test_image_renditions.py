@@ -0,0 +1,73 @@
+"""
+Тесты версий изображения под площадки
+"""
+import io
+import os
+
+from PIL import Image
+
+
+def _noisy_png(size=1400) -> bytes:
+    """Большая «шумная» картинка, которая плохо сжимается"""
+    image = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_render_limits_size_and_dimensions():
+    """Версия — прогрессивный JPEG в пределах стороны и близко к целевому размеру"""
+    from utils.image_renditions import render, PROFILES
+
+    original = _noisy_png()
+    data = render(original, PROFILES["tg"])
+
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == "JPEG"
+        assert max(image.size) == PROFILES["tg"].max_side
+        assert image.info.get("progressive") or image.info.get("progression")
+    assert len(data) < len(original)
+
+
+def test_small_jpeg_is_kept_as_is():
+    """Небольшой JPEG в пределах профиля не пережимается повторно"""
+    from utils.image_renditions import render, PROFILES
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (512, 512), (200, 150, 150)).save(buffer, "JPEG", quality=80)
+    original = buffer.getvalue()
+
+    assert render(original, PROFILES["vk"]) is original
+
+
+def test_rendition_cached_next_to_original_and_deleted_with_it(tmp_path, monkeypatch):
+    """Версия для файла сохраняется рядом с оригиналом и удаляется вместе с ним"""
+    monkeypatch.chdir(tmp_path)
+    from state import save_image_to_file, delete_image_file
+    from utils.image_renditions import get_rendition, rendition_path
+
+    filename = save_image_to_file(_noisy_png(1000))
+    first = get_rendition(None, "vk", filename=filename)
+    assert os.path.exists(rendition_path(filename, "vk"))
+    assert get_rendition(None, "vk", filename=filename) == first
+
+    delete_image_file(filename)
+    assert os.listdir(tmp_path / "temp_images") == []
+
+
+def test_failed_rendition_write_falls_back_to_original(tmp_path, monkeypatch):
+    """Не удалось записать версию (диск заполнен) — публикуется оригинал"""
+    monkeypatch.chdir(tmp_path)
+    import utils.image_renditions as image_renditions
+    from state import TEMP_IMAGES_DIR, save_image_to_file
+
+    filename = save_image_to_file(_noisy_png(1000))
+
+    def full_disk(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(image_renditions.os, "replace", full_disk)
+    path = image_renditions.rendition_file(filename, "tg")
+
+    assert path == os.path.join(TEMP_IMAGES_DIR, filename)
+    assert os.listdir(tmp_path / "temp_images") == [filename]
@@ -0,0 +1,181 @@
+"""
+Тесты общего клиента OpenAI
+"""
+
+import time
+
+
+class FakeResponse:
+    def __init__(self, status_code, data, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+        self.text = str(data)
+
+    def json(self):
+        return self._data
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        self.calls.append((time.monotonic(), json))
+        return self.responses.pop(0)
+
+
+def _ok(content="ok"):
+    return FakeResponse(
+        200,
+        {"choices": [{"message": {"content": content}}], "usage": {"total_tokens": 10}},
+    )
+
+
+def test_retry_after_is_honoured():
+    """На 429 клиент ждёт Retry-After и повторяет запрос"""
+    from utils.llm_client import LLMClient
+
+    client = LLMClient("key", rpm=600, tpm=100000)
+    client.session = FakeSession([FakeResponse(429, {"error": "rate"}, {"retry-after-ms": "200"}), _ok()])
+
+    data = client.chat({"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+
+    assert data["choices"][0]["message"]["content"] == "ok"
+    first, second = client.session.calls
+    assert second[0] - first[0] >= 0.2, "Повтор должен идти не раньше Retry-After"
+    assert client.stats()["throttled"] == 1
+
+
+def test_token_bucket_wait_time():
+    """Пустая корзина сообщает, сколько ждать пополнения"""
+    from utils.rate_limit import TokenBucket
+
+    bucket = TokenBucket(rate=10, capacity=10)
+    assert bucket.try_consume(10) == 0
+    wait = bucket.try_consume(5)
+    assert 0.4 <= wait <= 0.5
+
+
+class FakeClient:
+    """Клиент с заданной задержкой и ошибками по моделям"""
+
+    def __init__(self, delays, failing=()):
+        self.delays = delays
+        self.failing = set(failing)
+        self.models = []
+        self.abandoned = {}
+
+    def chat(self, payload, priority=0, abandoned=None, on_latency=None, on_send=None):
+        model = payload["model"]
+        self.models.append(model)
+        self.abandoned[model] = abandoned
+        if on_send is not None:
+            on_send()
+        time.sleep(self.delays.get(model, 0))
+        if model in self.failing:
+            raise RuntimeError(f"{model} недоступна")
+        return {"choices": [{"message": {"content": model}}]}
+
+
+def test_router_hedges_slow_primary():
+    """Если основная модель не уложилась в SLO, отвечает запасная"""
+    from utils.model_router import ModelRouter, Route
+
+    client = FakeClient({"slow": 1.0, "fast": 0.01})
+    router = ModelRouter({"task": Route("slow", "fast", slo=0.1)}, client=client)
+
+    data, model = router.chat("task", [{"role": "user", "content": "hi"}])
+
+    assert model == "fast"
+    assert router.stats()["hedged"] == 1
+    assert router.stats()["hedge_wins"] == 1
+    # Проигравший запрос, если он ещё ждёт лимитера, не отправится
+    assert client.abandoned["slow"].is_set()
+
+
+def test_router_falls_back_on_error():
+    """Ошибка основной модели сразу переключает на запасную"""
+    from utils.model_router import ModelRouter, Route
+
+    client = FakeClient({}, failing={"primary"})
+    router = ModelRouter({"task": Route("primary", "backup", slo=5)}, client=client)
+
+    _, model = router.chat("task", [{"role": "user", "content": "hi"}])
+
+    assert model == "backup"
+    assert router.stats()["fallbacks"] == 1
+
+
+def test_abandoned_request_is_not_sent():
+    """Запрос, ставший ненужным, пока ждал лимитера, не уходит в OpenAI"""
+    import threading
+
+    import pytest
+    from utils.llm_client import LLMClient, RequestAbandoned
+
+    client = LLMClient("key", rpm=600, tpm=100000)
+    client.session = FakeSession([_ok()])
+    abandoned = threading.Event()
+    abandoned.set()
+
+    with pytest.raises(RequestAbandoned):
+        client.chat({"model": "m", "messages": []}, abandoned=abandoned)
+    assert client.session.calls == []
+
+
+def test_abandoned_while_queued_spends_no_budget():
+    """Хедж-запрос, проигравший, пока ждал ёмкости лимитера, снимается с очереди и не тратит лимиты"""
+    import threading
+
+    import pytest
+    from utils.llm_client import LLMClient, RequestAbandoned
+
+    client = LLMClient("key", rpm=6, tpm=100000)  # Один запрос в корзине, следующий — через 10 с
+    client.session = FakeSession([_ok()])
+    client.chat({"model": "m", "messages": []})
+    abandoned = threading.Event()
+    threading.Timer(0.1, abandoned.set).start()
+
+    started = time.monotonic()
+    with pytest.raises(RequestAbandoned):
+        client.chat({"model": "m", "messages": []}, abandoned=abandoned)
+
+    assert time.monotonic() - started < 1
+    assert len(client.session.calls) == 1
+    # Запрос из корзины не списан: следующий ждёт только пополнения после первого
+    assert client._requests.wait_time(1) <= 10
+
+
+def test_latency_excludes_limiter_wait():
+    """В задержку модели идёт только HTTP-запрос, а не ожидание очереди лимитера"""
+    from utils.llm_client import LLMClient
+    from utils.model_router import ModelRouter, Route
+
+    client = LLMClient("key", rpm=600, tpm=100000)
+    client.session = FakeSession([_ok()])
+    client._pause(0.3)
+    router = ModelRouter({"task": Route("m", None, slo=5)}, client=client)
+
+    router.chat("task", [{"role": "user", "content": "hi"}])
+
+    (sample,) = router.latency._recent("m")
+    assert sample < 0.1
+
+
+def test_queued_primary_is_not_hedged():
+    """SLO отсчитывается с отправки: ожидание в очереди лимитера не вызывает хедж"""
+    from utils.llm_client import LLMClient
+    from utils.model_router import ModelRouter, Route
+
+    client = LLMClient("key", rpm=600, tpm=100000)
+    client.session = FakeSession([_ok()])
+    client._pause(0.3)
+    router = ModelRouter({"task": Route("m", "backup", slo=0.1)}, client=client)
+
+    _, model = router.chat("task", [{"role": "user", "content": "hi"}])
+
+    assert model == "m"
+    assert router.stats()["hedged"] == 0
+    assert len(client.session.calls) == 1
@@ -0,0 +1,58 @@
+"""
+Тесты однопроходного разбора Markdown: совпадение с прежней цепочкой re.sub и HTML для Telegram
+"""
+import random
+
+POST = (
+    "## Зимний уход: **главные правила**\n\n"
+    "Холод *истончает* липидный барьер, поэтому зимой нужен __другой__ уход.\n\n"
+    "### Что делать\n"
+    "* Умывайтесь **мягким** средством\n"
+    "- Крем с церамидами, SPF 30 *\n\n"
+    "#уход #зима\n"
+    "💡 _Совет:_ снег отражает до 80% UV\n"
+)
+
+
+def test_plain_matches_legacy_regex_chain():
+    """plain и vk совпадают с прежней цепочкой re.sub, включая непарные и слипшиеся маркеры"""
+    from tests.legacy_markdown import legacy_clean_markdown, legacy_smart_vk_text
+    from utils.markdown_render import RenderedPost
+
+    rng = random.Random(47)
+    alphabet = list("**__#  \n\tab") + ["\n\n", "# ", "## ", "###", "*a*", "**b**", "__c__"]
+    samples = [POST, POST * 200, "", "#\n\n## Заголовок", "***a*** __b_ *c"]
+    samples += ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40))) for _ in range(3000)]
+
+    for text in samples:
+        rendered = RenderedPost(text)
+        assert rendered.plain == legacy_clean_markdown(text), repr(text)
+        assert rendered.vk == legacy_smart_vk_text(text), repr(text)
+
+
+def test_html_keeps_formatting():
+    from utils.markdown_render import RenderedPost
+
+    html = RenderedPost(POST).html
+
+    assert html.startswith("<b>Зимний уход: </b><b>главные правила</b>\n\n")
+    assert "Холод <i>истончает</i> липидный барьер, поэтому зимой нужен <b>другой</b> уход." in html
+    assert "\n<b>Что делать</b>\n" in html
+    assert "Умывайтесь <b>мягким</b> средством" in html
+    assert "<i>Совет:</i>" in html
+
+
+def test_html_escapes_text():
+    from utils.markdown_render import RenderedPost
+
+    assert RenderedPost("**a < b & c**").html == "<b>a &lt; b &amp; c</b>"
+
+
+def test_post_renditions_cached():
+    from scheduler import ScheduledPost
+
+    post = ScheduledPost(topic="Уход", text=POST)
+
+    assert post.rendered is ScheduledPost(topic="Уход", text=POST).rendered
+    post.text = "**Новый** текст"
+    assert post.rendered.plain == "Новый текст"
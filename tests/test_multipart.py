@@ -0,0 +1,51 @@
+"""
+Тесты потокового тела multipart/form-data
+"""
+import io
+from email.parser import BytesParser
+from email.policy import HTTP
+
+
+def _parse(stream):
+    """Разбирает тело стандартным парсером MIME: {поле: (имя файла, содержимое)}"""
+    raw = f"Content-Type: {stream.content_type}\r\n\r\n".encode() + b"".join(stream)
+    message = BytesParser(policy=HTTP).parsebytes(raw)
+    return {
+        part.get_param("name", header="content-disposition"): (part.get_filename(), part.get_payload(decode=True))
+        for part in message.iter_parts()
+    }
+
+
+def test_body_matches_length_and_parts(tmp_path):
+    """Длина тела известна заранее, а содержимое разбирается как обычный multipart"""
+    from utils.multipart import MultipartStream
+
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(b"file-content" * 10000)
+
+    with open(path, "rb") as f:
+        stream = MultipartStream(
+            {"photo": f, "thumb": ("thumb.jpg", b"thumb-bytes", "image/jpeg"), "doc": io.BytesIO(b"doc")},
+            fields={"chat_id": 42},
+            chunk_size=4096,
+        )
+        single = MultipartStream({"photo": f})
+        assert len(b"".join(single)) == len(single)
+        parts = _parse(stream)
+
+    assert parts["photo"] == ("photo.jpg", b"file-content" * 10000)
+    assert parts["thumb"] == ("thumb.jpg", b"thumb-bytes")
+    assert parts["doc"] == ("doc", b"doc")
+    assert parts["chat_id"][1] == b"42"
+
+
+def test_read_returns_bounded_chunks():
+    """read(size) не отдаёт больше size байт — большой файл не собирается в памяти целиком"""
+    from utils.multipart import MultipartStream
+
+    stream = MultipartStream({"photo": ("image.jpg", io.BytesIO(b"x" * 100000), "image/jpeg")})
+    chunks = iter(lambda: stream.read(8192), b"")
+    sizes = [len(chunk) for chunk in chunks]
+
+    assert max(sizes) <= 8192
+    assert sum(sizes) == len(stream)
@@ -0,0 +1,96 @@
+"""
+Тесты пакетной генерации на локальной замене Batch API
+"""
+
+import json
+import time
+
+
+def _wait_completed(backend, batch_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if backend.status(batch_id)["status"] == "completed":
+            return
+        time.sleep(0.01)
+    raise AssertionError("Пакет не завершился")
+
+
+def test_local_batch_roundtrip(tmp_path):
+    """Локальный пакет пишет файлы в формате Batch API и отдаёт результаты по custom_id"""
+    from utils.openai_batch import LocalBatchBackend, build_batch_line, result_content
+
+    def execute(body):
+        if body["messages"][-1]["content"] == "сломай":
+            raise RuntimeError("ошибка модели")
+        return {"choices": [{"message": {"content": body["messages"][-1]["content"].upper()}}]}
+
+    backend = LocalBatchBackend(execute, base_dir=str(tmp_path))
+    lines = [
+        build_batch_line("text-0", {"model": "m", "messages": [{"role": "user", "content": "пост"}]}),
+        build_batch_line("text-1", {"model": "m", "messages": [{"role": "user", "content": "сломай"}]}),
+    ]
+    batch_id = backend.submit(lines)
+    _wait_completed(backend, batch_id)
+
+    with open(tmp_path / f"{batch_id}.input.jsonl", encoding="utf-8") as f:
+        first = json.loads(f.readline())
+    assert first["url"] == "/v1/chat/completions" and first["method"] == "POST"
+
+    results = backend.results(batch_id)
+    assert result_content(results["text-0"]) == "ПОСТ"
+    assert "error" in results["text-1"]
+
+
+def test_parse_batch_output_errors():
+    """Строки с HTTP-ошибкой считаются неудачными"""
+    from utils.openai_batch import parse_batch_output
+
+    output = "\n".join(
+        [
+            json.dumps({"custom_id": "a", "response": {"status_code": 200, "body": {"choices": []}}, "error": None}),
+            json.dumps({"custom_id": "b", "response": {"status_code": 429, "body": {"error": "rate"}}, "error": None}),
+        ]
+    )
+    results = parse_batch_output(output)
+    assert "body" in results["a"]
+    assert "error" in results["b"]
+
+
+def test_planning_poller_retries_transient_errors(monkeypatch):
+    """Сбой сети не снимает оплаченный пакет, а опрос прекращается, когда план заменили новым"""
+    from types import SimpleNamespace
+    from unittest.mock import Mock
+
+    from handlers import content_planning
+    from state import scheduled_posts
+    from utils.openai_batch import TransientBatchError
+
+    polled = []
+
+    class Backend:
+        def status(self, batch_id):
+            polled.append(batch_id)
+            if len(polled) == 1:
+                raise TransientBatchError("502")
+            # Пока пакет выполнялся, утвердили новый план
+            scheduled_posts["planning_batch"] = dict(scheduled_posts["planning_batch"], batch_id="batch-new")
+            return {"status": "in_progress"}
+
+        def results(self, batch_id):
+            raise AssertionError("незавершённый пакет не скачивается")
+
+    monkeypatch.setattr(content_planning, "get_batch_backend", lambda: Backend())
+    monkeypatch.setattr(content_planning, "save_state", lambda: None)
+    monkeypatch.setattr(content_planning, "time", SimpleNamespace(sleep=lambda seconds: None))
+    monkeypatch.setitem(
+        scheduled_posts,
+        "planning_batch",
+        {"stage": "texts", "batch_id": "batch-old", "chat_id": 1, "posts": [{"topic": "тема", "text": None}]},
+    )
+    bot = Mock()
+
+    content_planning._poll_planning_batch(bot, "batch-old")
+
+    assert polled == ["batch-old", "batch-old"]
+    assert scheduled_posts["planning_batch"]["batch_id"] == "batch-new"
+    bot.send_message.assert_not_called()
@@ -0,0 +1,55 @@
+"""
+Тесты точечного редактирования поста по разделам
+"""
+
+POST = """Давайте разберёмся, правда ли кожа привыкает к косметике?
+
+**Что это такое?**
+Привыкание — это миф.
+
+### Миф 1: кожа привыкает
+Нет, не привыкает.
+
+**Итог**
+Сияющая кожа — это система привычек.
+"""
+
+
+def test_split_is_reversible():
+    """Разбиение находит вступление, подзаголовки и вывод и не теряет текст"""
+    from utils.post_sections import split_sections, join_sections
+
+    sections = split_sections(POST)
+
+    assert [s.key for s in sections] == ["s0", "s1", "s2", "s3"]
+    assert sections[0].title == "Вступление"
+    assert sections[2].title.startswith("Миф 1")
+    assert sections[-1].title.endswith("(вывод)")
+    assert join_sections(sections) == POST
+
+
+def test_only_patched_section_changes(monkeypatch):
+    """Модель возвращает один раздел — остальные остаются побайтно прежними"""
+    import utils.openai_utils as openai_utils
+
+    def fake_chat(name, priority=0, payload=None, **variables):
+        assert name == "text_section_edit"
+        return '{"sections": {"s2": "### Миф 1: кожа привыкает\\nКоротко: нет."}}'
+
+    monkeypatch.setattr(openai_utils, "_chat_with_prompt", fake_chat)
+    new_text = openai_utils.edit_post_sections(POST, "упрости миф")
+
+    assert "Коротко: нет." in new_text
+    assert "Нет, не привыкает." not in new_text
+    assert new_text.startswith("Давайте разберёмся")
+    assert new_text.endswith("Сияющая кожа — это система привычек.\n")
+
+
+def test_unexpected_json_falls_back_to_full_rewrite(monkeypatch):
+    """JSON не того вида (не объект, sections не объект) — обычная правка всего текста"""
+    import utils.openai_utils as openai_utils
+
+    for response in ("[]", '"текст"', "null", '{"sections": ["s1"]}'):
+        monkeypatch.setattr(openai_utils, "_chat_with_prompt", lambda *a, r=response, **kw: r)
+        monkeypatch.setattr(openai_utils, "edit_post_text", lambda text, instruction: "переписано")
+        assert openai_utils.edit_post_sections(POST, "короче") == "переписано", response
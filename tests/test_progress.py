@@ -0,0 +1,72 @@
+"""
+Тесты статусного сообщения долгих операций
+"""
+import time
+from types import SimpleNamespace
+
+
+class FakeBot:
+    """Бот, который запоминает отправки и правки сообщений"""
+
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+        self.deleted = []
+
+    def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.edits.append(text)
+
+    def delete_message(self, chat_id, message_id):
+        self.deleted.append(message_id)
+
+
+def test_stages_collapse_into_few_edits():
+    """Частые этапы не превращаются в отдельные сообщения и правки: итог показывается сразу"""
+    from utils.progress import ProgressReporter
+
+    bot = FakeBot()
+    progress = ProgressReporter(bot, 1, "План", min_interval=60).start()
+    for i in range(1, 8):
+        progress.stage(f"Пост {i}/7")
+    progress.note("Ошибка генерации")
+    progress.done("✅ Готово")
+
+    assert len(bot.sent) == 1
+    assert len(bot.edits) == 1
+    final = bot.edits[-1]
+    assert "✅ Пост 7/7 —" in final
+    assert "⚠️ Ошибка генерации" in final
+    assert "✅ Готово" in final
+
+
+def test_pending_edit_flushed_after_interval():
+    """Изменение внутри интервала показывается отложенной правкой"""
+    from utils.progress import ProgressReporter
+
+    bot = FakeBot()
+    progress = ProgressReporter(bot, 1, "План", min_interval=0.1).start()
+    progress.stage("Пишу текст")
+    progress.stage("Генерирую изображение")
+    assert bot.edits == []
+
+    time.sleep(0.3)
+    assert len(bot.edits) == 1
+    assert "⏳ Генерирую изображение…" in bot.edits[0]
+    assert "✅ Пишу текст —" in bot.edits[0]
+
+
+def test_delete_cancels_pending_edit():
+    from utils.progress import ProgressReporter
+
+    bot = FakeBot()
+    progress = ProgressReporter(bot, 1, "Пост", min_interval=0.1).start()
+    progress.stage("Пишу текст")
+    progress.delete()
+    time.sleep(0.2)
+
+    assert bot.deleted == [1]
+    assert bot.edits == []
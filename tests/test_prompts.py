@@ -0,0 +1,43 @@
+"""
+Тесты реестра промптов
+"""
+
+
+def test_static_prefix_is_stable():
+    """Статический system-префикс не зависит от переменных и идёт первым"""
+    from utils.prompts import get_prompt
+
+    template = get_prompt("post_text", "v1")
+    first = template.build(topic="Витамин С для лица")
+    second = template.build(topic="Зимний уход")
+
+    assert first[0]["role"] == "system"
+    assert first[0]["content"] == second[0]["content"], "Префикс должен быть побайтно одинаковым"
+    assert "Витамин С" not in first[0]["content"], "Переменные не должны попадать в префикс"
+    assert first[-1]["content"].endswith("Витамин С для лица")
+
+
+def test_prompt_cache_stats():
+    """Статистика считает долю закэшированных токенов"""
+    from utils.prompts import PromptCacheStats
+
+    stats = PromptCacheStats()
+    stats.record("post_text@v1", {"prompt_tokens": 1000, "prompt_tokens_details": {"cached_tokens": 0}})
+    stats.record("post_text@v1", {"prompt_tokens": 1000, "prompt_tokens_details": {"cached_tokens": 900}})
+    stats.record("post_text@v1", None)
+
+    entry = stats.snapshot()["post_text@v1"]
+    assert entry["calls"] == 3
+    assert entry["cached_tokens"] == 900
+    assert abs(entry["hit_rate"] - 0.45) < 1e-9
+
+
+def test_latest_version_is_compared_numerically(monkeypatch):
+    """Без активной версии берётся последняя: v10 новее v2"""
+    from utils import prompts
+
+    monkeypatch.setattr(prompts, "_registry", {})
+    for version in ("v1", "v2", "v10"):
+        prompts.register_prompt(prompts.PromptTemplate("test_prompt", version, "system", "{x}"))
+
+    assert prompts.get_prompt("test_prompt").version == "v10"
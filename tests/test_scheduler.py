@@ -0,0 +1,39 @@
+"""
+Тесты публикации запланированных постов
+"""
+import io
+from unittest.mock import Mock
+
+from PIL import Image
+
+
+def _jpeg() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "pink").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def test_publish_remembers_uploaded_file_id(tmp_path, monkeypatch):
+    """Картинка, загруженная при публикации, сохраняется с постом по file_id"""
+    import scheduler
+    import state
+    from utils import vk_utils
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(scheduler, "save_state", lambda: None)
+    monkeypatch.setattr(vk_utils, "vk_publish_with_image_required", Mock(side_effect=RuntimeError("VK недоступен")))
+
+    post = scheduler.ScheduledPost(topic="тема", text="Короткий пост")
+    post.image_bytes = _jpeg()
+    monkeypatch.setitem(state.scheduled_posts, "approved_posts", [post.to_dict()])
+
+    bot = Mock()
+    bot.send_photo.return_value = Mock(message_id=5, photo=[Mock(file_id="small"), Mock(file_id="uploaded")])
+    publisher = scheduler.ContentScheduler(bot)
+    publisher.set_admin_chat_id(1)
+
+    publisher._publish_scheduled_post()
+
+    (queued,) = state.scheduled_posts["approved_posts"]
+    assert queued["status"] == "published_tg"
+    assert queued["image_file_id"] == "uploaded"
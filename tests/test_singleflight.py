@@ -0,0 +1,125 @@
+"""
+Тесты объединения одинаковых одновременных запросов
+"""
+import threading
+import time
+
+import pytest
+
+
+def _slow(calls, result="ответ", delay=0.2):
+    def fn():
+        calls.append(threading.current_thread().name)
+        time.sleep(delay)
+        return result
+
+    return fn
+
+
+def test_identical_calls_share_one_execution():
+    from utils.singleflight import SingleFlight, normalize
+
+    flight = SingleFlight()
+    calls, results = [], []
+    fn = _slow(calls)
+
+    threads = [
+        threading.Thread(target=lambda t=topic: results.append(flight.do(("post_text", normalize(t)), fn)))
+        for topic in ("Зимний уход", "  зимний   УХОД ", "Зимний уход")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["ответ"] * 3
+    stats = flight.stats()
+    assert stats["calls"] == 1 and stats["deduplicated"] == 2 and stats["in_flight"] == 0
+    assert stats["kinds"]["post_text"] == {"calls": 1, "deduplicated": 2}
+
+    # После завершения тот же запрос — снова новый вызов, а не кэш
+    flight.do(("post_text", "зимний уход"), _slow(calls, delay=0))
+    assert len(calls) == 2
+
+
+def test_waiting_call_cancelled_alone():
+    """Отмена ждущего вызова не отменяет ведущий"""
+    from utils.cancellation import Generation, GenerationCancelled
+    from utils.singleflight import SingleFlight
+
+    flight = SingleFlight()
+    calls, leader_result, errors = [], [], []
+    leader = threading.Thread(target=lambda: leader_result.append(flight.do(("topics",), _slow(calls, delay=0.3))))
+    leader.start()
+    time.sleep(0.05)
+
+    generation = Generation(2)
+
+    def follower():
+        with generation.activate():
+            try:
+                flight.do(("topics",), _slow(calls))
+            except GenerationCancelled as e:
+                errors.append(e)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    time.sleep(0.05)
+    generation.cancel("отменено пользователем")
+    thread.join(timeout=1)
+    leader.join()
+
+    assert len(errors) == 1
+    assert leader_result == ["ответ"]
+    assert len(calls) == 1
+
+
+def test_leader_cancellation_not_inherited():
+    """Если отменили генерацию ведущего, ждущий выполняет запрос сам"""
+    from utils.cancellation import Generation, GenerationCancelled, check_cancelled
+    from utils.singleflight import SingleFlight
+
+    flight = SingleFlight()
+    generation = Generation(1)
+    started = threading.Event()
+
+    def cancellable():
+        started.set()
+        time.sleep(0.1)
+        check_cancelled()
+        return "ответ ведущего"
+
+    def leader():
+        with generation.activate(), pytest.raises(GenerationCancelled):
+            flight.do(("image", "prompt"), cancellable)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    started.wait()
+    threading.Timer(0.02, generation.cancel, args=("пришла новая тема",)).start()
+
+    assert flight.do(("image", "prompt"), lambda: "свой ответ") == "свой ответ"
+    thread.join()
+
+
+def test_interactive_call_does_not_join_background_flight(monkeypatch):
+    """Быстрый пост не ждёт такой же запрос планировщика в фоновой очереди"""
+    import utils.openai_utils as openai_utils
+    from utils.llm_client import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+    calls = []
+
+    def fake_chat(name, priority, **variables):
+        calls.append(priority)
+        time.sleep(0.2)
+        return "текст"
+
+    monkeypatch.setattr(openai_utils, "_chat_with_prompt", fake_chat)
+    background = threading.Thread(target=openai_utils.generate_text, args=("Зимний уход", PRIORITY_BACKGROUND))
+    background.start()
+    time.sleep(0.05)
+
+    assert openai_utils.generate_text("зимний уход") == "текст"
+    background.join()
+    assert sorted(calls) == [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND]
@@ -0,0 +1,95 @@
+"""
+Тесты очереди исходящих сообщений Telegram
+"""
+import threading
+import time
+
+
+def test_per_chat_limit_does_not_slow_other_chats():
+    """Лимит одного чата не задерживает отправку в другой чат"""
+    from utils.tg_send_queue import TelegramSendQueue, CHAT_BURST
+
+    queue = TelegramSendQueue(global_rate=1000, chat_rate=10, group_rate=10, workers=2)
+    sent = []
+
+    started = time.monotonic()
+    futures = [queue.submit(1, lambda i=i: sent.append((1, i, time.monotonic()))) for i in range(CHAT_BURST + 2)]
+    queue.call(2, lambda: sent.append((2, 0, time.monotonic())))
+    for future in futures:
+        future.result(timeout=5)
+
+    chat_1 = [at for chat, _, at in sent if chat == 1]
+    other = next(at for chat, _, at in sent if chat == 2)
+    assert [i for chat, i, _ in sent if chat == 1] == list(range(CHAT_BURST + 2))
+    # Сверх всплеска сообщения в чат идут не чаще chat_rate
+    assert chat_1[-1] - started >= 0.15
+    assert other - started < 0.1
+
+
+def test_flood_wait_is_retried_transparently():
+    """429 с retry_after: запрос повторяется после паузы, вызывающий получает результат"""
+    from telebot.apihelper import ApiTelegramException
+    from utils.tg_send_queue import TelegramSendQueue
+
+    queue = TelegramSendQueue(global_rate=1000, chat_rate=100, workers=1)
+    attempts = []
+
+    def send():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise ApiTelegramException(
+                "sendMessage",
+                None,
+                {"error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 0.2}},
+            )
+        return "ok"
+
+    assert queue.call(1, send) == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+    assert queue.stats()["throttled"] == 1
+
+
+def test_interactive_replies_go_before_notifications():
+    """Ответы пользователям обгоняют накопившиеся фоновые уведомления"""
+    from utils.llm_client import PRIORITY_BACKGROUND
+    from utils.tg_send_queue import TelegramSendQueue, send_priority
+
+    queue = TelegramSendQueue(global_rate=1000, chat_rate=1000, workers=1)
+    order, release = [], threading.Event()
+
+    blocker = queue.submit("busy", release.wait, 5)
+    with send_priority(PRIORITY_BACKGROUND):
+        notifications = [queue.submit(f"chat-{i}", order.append, f"notify-{i}") for i in range(3)]
+    reply = queue.submit("user", order.append, "reply")
+
+    time.sleep(0.05)
+    release.set()
+    for future in [blocker, reply] + notifications:
+        future.result(timeout=5)
+
+    assert order[0] == "reply"
+    stats = queue.stats()
+    assert stats["sent"] == 5
+    assert stats["delay"]["background"]["max"] >= 0.05
+
+
+def test_messages_to_one_chat_keep_their_order():
+    """Ответ пользователю не обгоняет более раннее фоновое сообщение в тот же чат"""
+    from utils.llm_client import PRIORITY_BACKGROUND
+    from utils.tg_send_queue import TelegramSendQueue, send_priority
+
+    queue = TelegramSendQueue(global_rate=1000, chat_rate=1000, workers=1)
+    order, release = [], threading.Event()
+
+    blocker = queue.submit("busy", release.wait, 5)
+    with send_priority(PRIORITY_BACKGROUND):
+        notifications = [queue.submit("other", order.append, "other"), queue.submit("user", order.append, "notify")]
+    reply = queue.submit("user", order.append, "reply")
+
+    time.sleep(0.05)
+    release.set()
+    for future in [blocker, reply] + notifications:
+        future.result(timeout=5)
+
+    # Чат пользователя обслуживается с приоритетом ответа, но его сообщения — по порядку
+    assert order == ["notify", "reply", "other"]
@@ -0,0 +1,103 @@
+"""
+Тесты отправки постов в Telegram: повторная отправка картинки по file_id
+"""
+from types import SimpleNamespace
+
+
+class FakeBot:
+    """Бот, который запоминает, что передавалось в send_photo"""
+
+    def __init__(self, reject_file_ids=False):
+        self.photos = []
+        self.reject_file_ids = reject_file_ids
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        from telebot.apihelper import ApiTelegramException
+
+        if isinstance(photo, str) and self.reject_file_ids:
+            raise ApiTelegramException(
+                "sendPhoto", None, {"error_code": 400, "description": "Bad Request: wrong file identifier"}
+            )
+        self.photos.append(photo)
+        file_id = photo if isinstance(photo, str) else f"file-{len(self.photos)}"
+        return SimpleNamespace(message_id=len(self.photos), photo=[SimpleNamespace(file_id=f"{file_id}-small"),
+                                                                    SimpleNamespace(file_id=file_id)])
+
+    def send_message(self, chat_id, text, **kwargs):
+        return SimpleNamespace(message_id=0, photo=None)
+
+
+def test_draft_image_uploaded_once():
+    """Первый показ черновика загружает картинку, следующие и публикация идут по file_id"""
+    from utils.tg_utils import send_draft_post, draft_file_id
+
+    bot = FakeBot()
+    draft = {"text": "Пост", "image_bytes": b"image-1"}
+
+    send_draft_post(bot, 1, "Пост", draft)
+    send_draft_post(bot, 1, "Пост", draft)
+
+    assert not isinstance(bot.photos[0], str)
+    assert bot.photos[1] == "file-1"
+    assert draft_file_id(draft) == "file-1"
+
+    # Новая картинка — новый ключ: старый file_id не используется
+    draft["image_bytes"] = b"image-2"
+    assert draft_file_id(draft) is None
+    send_draft_post(bot, 1, "Пост", draft)
+    assert not isinstance(bot.photos[2], str)
+
+
+def test_rejected_file_id_falls_back_to_upload():
+    """Если Telegram не принял file_id, картинка загружается и file_id обновляется"""
+    from utils.tg_utils import send_post_with_image
+
+    bot = FakeBot(reject_file_ids=True)
+    uploaded = []
+
+    message = send_post_with_image(bot, 1, "Пост", b"image", file_id="stale", on_upload=uploaded.append)
+
+    assert message.message_id == 1
+    assert uploaded == ["file-1"]
+
+
+def test_scheduled_post_file_id_reset_with_new_image(tmp_path, monkeypatch):
+    """Замена картинки поста сбрасывает сохранённый file_id"""
+    import state
+    from scheduler import ScheduledPost
+
+    monkeypatch.setattr(state, "TEMP_IMAGES_DIR", str(tmp_path))
+    post = ScheduledPost.from_dict({"topic": "Тема", "text": "Текст", "image_file_id": "old"})
+    assert post.image_file_id == "old"
+
+    post.image_bytes = b"new image"
+    assert post.image_file_id is None
+    assert ScheduledPost.from_dict(post.to_dict()).image_filename == post.image_filename
+
+
+def test_post_html_escapes_and_survives_unpaired_markers():
+    """Предпросмотр отправляется как HTML: непарная * не ломает разметку, а < экранируется"""
+    from utils.tg_utils import post_html
+
+    html = post_html("**SPF** 30 < 50 и *непарная звезда")
+
+    assert html.startswith("<b>SPF</b> 30 &lt; 50")
+    assert html.count("<b>") == html.count("</b>") and html.count("<i>") == html.count("</i>")
+    assert post_html("") == ""
+
+
+def test_draft_preview_uploads_telegram_rendition():
+    """Превью загружает версию для Telegram, а не оригинал: её file_id потом уходит в канал"""
+    import io
+
+    from PIL import Image
+    from utils.tg_utils import send_draft_post
+
+    original = io.BytesIO()
+    Image.new("RGB", (2000, 1500), "white").save(original, "PNG")
+    bot = FakeBot()
+
+    send_draft_post(bot, 1, "Пост", {"text": "Пост", "image_bytes": original.getvalue()})
+
+    with Image.open(bot.photos[0]) as uploaded:
+        assert uploaded.format == "JPEG" and max(uploaded.size) <= 1280
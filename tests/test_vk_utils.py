@@ -0,0 +1,151 @@
+"""
+Тесты публикации в VK на локальном стенде VK API
+"""
+
+
+def _publisher(stub):
+    """Публикатор для стенда; лимит запросов высокий, чтобы не замедлять тесты"""
+    from utils.rate_limit import AdaptiveRateLimiter
+    from utils.vk_utils import VKPublisher
+
+    return VKPublisher("token", "123", api_url=stub.api_url, limiter=AdaptiveRateLimiter(1000))
+
+
+def test_connections_pooled_and_upload_server_cached():
+    """Повторные публикации идут по тёплым соединениям и без лишнего getWallUploadServer"""
+    from benchmarks.vk_stub import VkApiStub
+
+    with VkApiStub() as stub:
+        publisher = _publisher(stub)
+        for i in range(3):
+            resp = publisher.publish_post(f"Пост {i}", image_bytes=b"\xff\xd8image\xff\xd9")
+            assert resp["response"]["post_id"] == i + 1
+
+        assert stub.count("photos.getWallUploadServer") == 1
+        assert stub.posts[-1]["attachments"].startswith("photo-123_")
+        assert stub.connections == 1
+
+
+def test_upload_server_refreshed_after_failed_upload():
+    """Неудачная загрузка по закэшированному адресу запрашивает новый адрес и повторяет загрузку"""
+    from benchmarks.vk_stub import VkApiStub
+
+    with VkApiStub() as stub:
+        publisher = _publisher(stub)
+        publisher.upload_photo(image_bytes=b"image")
+
+        stub.fail_uploads = 1
+        assert publisher.upload_photo(image_bytes=b"image").startswith("photo-123_")
+        assert stub.count("photos.getWallUploadServer") == 2
+        assert stub.count("upload") == 3
+
+
+def test_photo_post_saved_and_published_in_one_execute():
+    """Сохранение фото и публикация идут одним запросом execute, длинный текст — в теле запроса"""
+    from benchmarks.vk_stub import VkApiStub
+
+    with VkApiStub() as stub:
+        publisher = _publisher(stub)
+        text = "Длинный пост. " * 1000
+        resp = publisher.publish_post(text, image_bytes=b"image")
+
+        assert resp["response"]["post_id"] == 1
+        assert stub.count("execute") == 1
+        assert stub.count("photos.saveWallPhoto") == 0
+        assert stub.count("wall.post") == 0
+        assert stub.posts[0]["message"] == text
+
+
+def test_execute_failure_falls_back_to_separate_calls():
+    from benchmarks.vk_stub import VkApiStub
+
+    with VkApiStub() as stub:
+        stub.fail_execute = True
+        publisher = _publisher(stub)
+        resp = publisher.publish_post("Пост", image_bytes=b"image")
+
+        assert resp["response"]["post_id"] == 1
+        assert stub.count("photos.saveWallPhoto") == 1
+        assert stub.count("wall.post") == 1
+
+
+def _publisher_for(stub, monkeypatch):
+    import utils.vk_utils as vk_utils
+
+    monkeypatch.setattr(vk_utils, "vk_publisher", _publisher(stub))
+    return vk_utils
+
+
+def test_strategies_reuse_uploaded_photo(monkeypatch):
+    """После отказа VK фото не загружается повторно, а текст меняется по коду ошибки"""
+    from benchmarks.vk_stub import VkApiStub
+
+    with VkApiStub() as stub:
+        vk_utils = _publisher_for(stub, monkeypatch)
+        stub.reject_posts = [222, 100]
+
+        post_id = vk_utils.vk_publish_with_image_required("123", b"image", "Подробнее: https://example.com/x ✨" * 50)
+
+        assert post_id == 1
+        assert stub.count("upload") == 1
+        assert stub.count("photos.saveWallPhoto") == 0
+        assert "example.com" not in stub.posts[0]["message"]
+        assert len(stub.posts[0]["message"]) <= vk_utils.VK_MIN_TEXT_LENGTH + 3
+        assert stub.posts[0]["attachments"] == "photo-123_1"
+
+
+def test_access_errors_are_not_retried(monkeypatch):
+    from benchmarks.vk_stub import VkApiStub
+
+    with VkApiStub() as stub:
+        vk_utils = _publisher_for(stub, monkeypatch)
+        stub.reject_posts = [214]
+
+        try:
+            vk_utils.vk_publish_with_image_required("123", b"image", "Пост")
+        except vk_utils.VkApiError as e:
+            assert e.code == 214
+        else:
+            raise AssertionError("ошибка прав доступа не передана")
+        assert stub.count("upload") == 1
+        assert stub.count("wall.post") == 0
+
+
+def test_too_many_requests_lowers_rate_and_retries():
+    """Ошибка 6 снижает общий лимит токена, запрос повторяется, счётчики попадают в статистику"""
+    from benchmarks.vk_stub import VkApiStub
+    from utils.rate_limit import AdaptiveRateLimiter
+    from utils.vk_utils import VKPublisher, vk_api_stats
+
+    with VkApiStub() as stub:
+        limiter = AdaptiveRateLimiter(20)
+        publisher = VKPublisher("token", "123", api_url=stub.api_url, limiter=limiter)
+        before = vk_api_stats.snapshot().get("wall.post", {"throttled": 0})["throttled"]
+
+        stub.reject_posts = [6]
+        resp = publisher._vk_call("wall.post", params={"owner_id": "-123", "message": "Пост"})
+
+        assert resp["response"]["post_id"] == 1
+        assert limiter.throttled == 1
+        assert limiter.rate < 20
+        assert vk_api_stats.snapshot()["wall.post"]["throttled"] == before + 1
+
+
+def test_upload_streams_open_file_and_retries_from_start(tmp_path):
+    """Открытый файл загружается потоком целиком, и при повторной загрузке — снова с начала"""
+    from benchmarks.vk_stub import VkApiStub
+
+    image = b"\xff\xd8" + bytes(range(256)) * 1000 + b"\xff\xd9"
+    path = tmp_path / "image.vk.jpg"
+    path.write_bytes(image)
+
+    with VkApiStub() as stub, open(path, "rb") as f:
+        publisher = _publisher(stub)
+        publisher.upload_photo(image_bytes=b"warm up cached server")
+        stub.fail_uploads = 1
+        assert publisher.upload_photo(image_bytes=f).startswith("photo-123_")
+
+        assert len(stub.uploads) == 3
+        for body in stub.uploads[1:]:
+            assert image in body
+            assert b'name="photo"; filename="image.jpg"' in body
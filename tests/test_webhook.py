@@ -0,0 +1,162 @@
+"""
+Тесты приёма обновлений через webhook: записанные обновления отправляются POST-запросом на локальный сервер
+"""
+import json
+import threading
+import urllib.error
+import urllib.request
+
+SECRET = "test-secret"
+
+# Обновление в том виде, в каком его присылает Telegram
+RECORDED_UPDATE = {
+    "update_id": 100500,
+    "message": {
+        "message_id": 7,
+        "from": {"id": 42, "is_bot": False, "first_name": "Анна"},
+        "chat": {"id": 42, "type": "private", "first_name": "Анна"},
+        "date": 1700000000,
+        "text": "Уход за кожей зимой",
+    },
+}
+
+
+def _update(update_id: int, text: str = "тема"):
+    update = json.loads(json.dumps(RECORDED_UPDATE))
+    update["update_id"] = update_id
+    update["message"]["text"] = text
+    return update
+
+
+def _post(server, update, secret=SECRET):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.port}{server.path}",
+        data=json.dumps(update).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def _server(bot, **kwargs):
+    from webhook import WebhookServer
+
+    server = WebhookServer(bot, SECRET, host="127.0.0.1", port=0, **kwargs)
+    server.start()
+    return server
+
+
+def test_recorded_update_reaches_handler():
+    """Обновление с верным секретом доходит до обработчика сообщений"""
+    from telebot import TeleBot
+
+    bot = TeleBot("123:test", threaded=False)
+    received = []
+    done = threading.Event()
+
+    @bot.message_handler(content_types=["text"])
+    def on_text(message):
+        received.append(message.text)
+        done.set()
+
+    server = _server(bot)
+    try:
+        assert _post(server, RECORDED_UPDATE) == 200
+        assert done.wait(5)
+    finally:
+        server.stop()
+
+    assert received == ["Уход за кожей зимой"]
+    assert server.stats()["processed"] == 1
+
+
+def test_wrong_secret_is_rejected():
+    """Запрос без правильного секрета не попадает в очередь"""
+    from telebot import TeleBot
+
+    bot = TeleBot("123:test", threaded=False)
+    server = _server(bot)
+    try:
+        assert _post(server, RECORDED_UPDATE, secret="wrong") == 403
+        assert _post(server, RECORDED_UPDATE, secret="") == 403
+    finally:
+        server.stop()
+
+    assert server.stats()["received"] == 0
+    assert server.stats()["rejected"] == 2
+
+
+def test_full_queue_asks_telegram_to_retry():
+    """Когда очередь заполнена, сервер отвечает 503, а не ждёт — Telegram повторит доставку"""
+    from telebot import TeleBot
+
+    bot = TeleBot("123:test", threaded=False)
+    started, release = threading.Event(), threading.Event()
+
+    @bot.message_handler(content_types=["text"])
+    def on_text(message):
+        started.set()
+        release.wait(5)
+
+    server = _server(bot, workers=1, queue_size=1)
+    try:
+        assert _post(server, _update(1)) == 200
+        assert started.wait(5)  # Рабочий поток занят первым обновлением
+        assert _post(server, _update(2)) == 200  # Второе ждёт в очереди
+        assert _post(server, _update(3)) == 503
+    finally:
+        release.set()
+        server.stop()
+
+    assert server.stats()["dropped"] == 1
+
+
+def test_updates_of_one_chat_keep_their_order():
+    """Обновления одного чата разбираются по порядку, даже если рабочих потоков несколько"""
+    import time
+
+    from telebot import TeleBot
+
+    bot = TeleBot("123:test", threaded=False)
+    received = []
+    done = threading.Event()
+
+    @bot.message_handler(content_types=["text"])
+    def on_text(message):
+        if message.text == "1":
+            time.sleep(0.2)  # Первое обновление обрабатывается дольше остальных
+        received.append(message.text)
+        if len(received) == 5:
+            done.set()
+
+    server = _server(bot, workers=4)
+    try:
+        for i in range(1, 6):
+            assert _post(server, _update(i, str(i))) == 200
+        assert done.wait(5)
+    finally:
+        server.stop()
+
+    assert received == ["1", "2", "3", "4", "5"]
+
+
+def test_callback_is_routed_by_its_chat():
+    from telebot.types import Update
+    from webhook import update_chat_id
+
+    callback = {
+        "update_id": 1,
+        "callback_query": {
+            "id": "cb",
+            "from": {"id": 7, "is_bot": False, "first_name": "Анна"},
+            "chat_instance": "ci",
+            "data": "approve",
+            "message": RECORDED_UPDATE["message"],
+        },
+    }
+    assert update_chat_id(Update.de_json(callback)) == 42
+    assert update_chat_id(Update.de_json(RECORDED_UPDATE)) == 42
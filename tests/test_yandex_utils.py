@@ -0,0 +1,207 @@
+"""
+Тесты клиента YandexArt
+"""
+import time
+
+
+class FakeResult:
+    image_bytes = b"image"
+
+
+class FakeOperation:
+    def wait(self, **kwargs):
+        return FakeResult()
+
+
+class FakeModel:
+    def __init__(self, sdk):
+        self.sdk = sdk
+
+    def configure(self, **kwargs):
+        return self
+
+    def run_deferred(self, prompt):
+        if self.sdk.fail_auth:
+            self.sdk.fail_auth = False
+            raise RuntimeError("StatusCode.UNAUTHENTICATED: token expired")
+        return FakeOperation()
+
+
+class FakeSDK:
+    created = 0
+    fail_auth = False
+
+    def __init__(self, folder_id, auth):
+        FakeSDK.created += 1
+        self.models = self
+
+    def image_generation(self, name):
+        return FakeModel(FakeSDK)
+
+
+def test_client_is_created_once():
+    """SDK создаётся лениво и переиспользуется между изображениями"""
+    from utils.yandex_utils import YandexArtClient
+
+    FakeSDK.created = 0
+    client = YandexArtClient("folder", "key", sdk_factory=FakeSDK)
+    assert FakeSDK.created == 0
+
+    for _ in range(5):
+        assert client.generate("prompt") == b"image"
+    assert FakeSDK.created == 1
+
+
+def test_client_recreated_on_auth_error():
+    """Ошибка авторизации пересоздаёт SDK и повторяет запрос"""
+    from utils.yandex_utils import YandexArtClient
+
+    FakeSDK.created = 0
+    client = YandexArtClient("folder", "key", sdk_factory=FakeSDK)
+    client.generate("prompt")
+
+    FakeSDK.fail_auth = True
+    assert client.generate("prompt") == b"image"
+    assert FakeSDK.created == 2
+
+
+class PolledStatus:
+    def __init__(self, running):
+        self.is_running = running
+
+
+class PolledOperation:
+    def __init__(self, polls_left):
+        self.id = "op"
+        self.polls_left = polls_left
+
+    def get_status(self):
+        self.polls_left -= 1
+        return PolledStatus(self.polls_left > 0)
+
+    def get_result(self):
+        return FakeResult()
+
+
+class CountingClient:
+    def __init__(self):
+        self.operations = []
+
+    def run_deferred(self, prompt, seed=None):
+        operation = PolledOperation(3)
+        self.operations.append(operation)
+        return operation
+
+
+def test_job_manager_runs_concurrently_within_cap():
+    """Менеджер возвращает futures, держит не больше max_concurrency операций и опрашивает их сам"""
+    from utils.yandex_utils import ImageJobManager
+
+    client = CountingClient()
+    manager = ImageJobManager(client, max_concurrency=2, poll_initial=0.01, poll_max=0.02)
+
+    futures = [manager.submit(f"prompt {i}") for i in range(5)]
+    assert manager.stats()["active"] <= 2
+
+    assert [f.result(timeout=5) for f in futures] == [b"image"] * 5
+    assert len(client.operations) == 5
+    assert manager.stats() == {"active": 0, "queued": 0}
+
+
+def test_job_manager_propagates_errors():
+    """Ошибка запуска операции попадает в future, а не в поток поллера"""
+    from utils.yandex_utils import ImageJobManager
+
+    class BrokenClient:
+        def run_deferred(self, prompt, seed=None):
+            raise RuntimeError("quota exceeded")
+
+    manager = ImageJobManager(BrokenClient(), poll_initial=0.01)
+    future = manager.submit("prompt")
+    try:
+        future.result(timeout=5)
+    except RuntimeError as e:
+        assert "quota" in str(e)
+    else:
+        raise AssertionError("ошибка не передана в future")
+
+
+def test_attach_restored_operation():
+    """Операцию по сохранённому id можно опросить и забрать результат через SDK"""
+    from benchmarks.yandex_stub import YandexArtStub, FAKE_IMAGE
+    from utils.yandex_utils import YandexArtClient
+
+    with YandexArtStub() as stub:
+        client = YandexArtClient("folder", "key", **stub.sdk_kwargs())
+        operation = client.attach("op-restored")
+        assert operation.id == "op-restored"
+        assert not operation.get_status().is_running
+        assert bytes(operation.get_result().image_bytes) == FAKE_IMAGE
+
+
+def test_job_manager_reports_and_attaches_operation_ids():
+    """id операции передаётся в on_started, а attach() дожидается операции без повторного запуска"""
+    from utils.yandex_utils import ImageJobManager
+
+    class AttachingClient(CountingClient):
+        def __init__(self):
+            super().__init__()
+            self.attached = []
+
+        def attach(self, operation_id):
+            self.attached.append(operation_id)
+            return PolledOperation(2)
+
+    client = AttachingClient()
+    manager = ImageJobManager(client, poll_initial=0.01, poll_max=0.02)
+
+    started = []
+    assert manager.submit("prompt", on_started=started.append).result(timeout=5) == b"image"
+    assert started == ["op"]
+
+    assert manager.attach("op-saved").result(timeout=5) == b"image"
+    assert client.attached == ["op-saved"]
+    assert len(client.operations) == 1
+
+
+def test_image_candidates_use_distinct_seeds(monkeypatch):
+    """Варианты изображения запускаются параллельно с разными seed, неудачные пропускаются"""
+    from concurrent.futures import Future
+    import utils.yandex_utils as yandex_utils
+
+    class FakeJobs:
+        def __init__(self):
+            self.seeds = []
+
+        def submit(self, prompt, seed=None):
+            self.seeds.append(seed)
+            future = Future()
+            if len(self.seeds) == 2:
+                future.set_exception(RuntimeError("moderation"))
+            else:
+                future.set_result(f"image-{seed}".encode())
+            return future
+
+    jobs = FakeJobs()
+    monkeypatch.setattr(yandex_utils, "image_jobs", jobs)
+
+    images = yandex_utils.generate_image_candidates("prompt", 3)
+    assert len(set(jobs.seeds)) == 3
+    assert images == [f"image-{jobs.seeds[0]}".encode(), f"image-{jobs.seeds[2]}".encode()]
+
+
+def test_cancelled_job_is_not_launched():
+    """Отменённая генерация, ждавшая слота, не запускает операцию YandexArt"""
+    from utils.yandex_utils import ImageJobManager
+
+    client = CountingClient()
+    manager = ImageJobManager(client, max_concurrency=1, poll_initial=0.01, poll_max=0.02)
+
+    first = manager.submit("prompt 1")
+    second = manager.submit("prompt 2")
+    assert second.cancel()
+
+    assert first.result(timeout=5) == b"image"
+    time.sleep(0.1)
+    assert len(client.operations) == 1
+    assert manager.stats() == {"active": 0, "queued": 0}
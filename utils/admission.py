@@ -0,0 +1,206 @@
+# utils/admission.py
+"""
+Допуск генераций постов: общий лимит одновременных генераций и ограниченная очередь.
+
+Генерация поста держит OpenAI и YandexArt десятки секунд, и без лимита наплыв
+тем замедляет всех сразу. AdmissionController пропускает к пулу обработчиков
+(utils/chat_dispatcher) не больше limit генераций, остальные ждут в очереди
+до queue_size мест — ожидающим сообщается номер в очереди и примерное время
+ожидания по длительности последних генераций. Когда очередь заполнена, запрос
+сразу отклоняется (AdmissionRejected), а не ставится в конец бесконечного ожидания.
+
+Место занимается, только когда генерацию можно начать сразу: запрос чата, у
+которого в пуле ещё идут свои задачи (недельный план, правка картинки), ждёт в
+очереди, пока чат не освободится, и не держит место за собой. Время генерации
+для оценки ожидания считается с фактического начала.
+
+Отменённые генерации (utils/cancellation) снимаются с очереди, не занимая место.
+"""
+import functools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from config import GENERATION_CONCURRENCY, GENERATION_QUEUE_SIZE
+from utils.chat_dispatcher import ChatDispatcher, chat_dispatcher
+
+log = logging.getLogger("tg-vk-bot")
+
+# Длительность генерации для оценки ожидания, пока своих замеров нет (сек)
+DEFAULT_DURATION = 30.0
+# По скольким последним генерациям оценивается ожидание
+DURATION_SAMPLES = 20
+
+
+class AdmissionRejected(RuntimeError):
+    """Очередь генераций заполнена — запрос не принят"""
+
+
+class _Entry:
+    def __init__(self, chat_id, fn: Callable, args, kwargs, on_queue, on_cancel, cancelled):
+        self.chat_id = chat_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.on_queue = on_queue
+        self.on_cancel = on_cancel
+        self.cancelled = cancelled
+        self.position: Optional[int] = None  # Номер в очереди, о котором уже сообщили; 0 — запущена
+
+    def is_cancelled(self) -> bool:
+        return bool(self.cancelled and self.cancelled())
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        limit: int = GENERATION_CONCURRENCY,
+        queue_size: int = GENERATION_QUEUE_SIZE,
+        dispatcher: ChatDispatcher = chat_dispatcher,
+    ):
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self._dispatcher = dispatcher
+        self._lock = threading.Lock()
+        self._queue: Deque[_Entry] = deque()
+        self._starting = 0  # Переданы в пул и вот-вот начнутся
+        self._running = 0
+        self._durations: Deque[float] = deque(maxlen=DURATION_SAMPLES)
+        self._admitted = 0
+        self._rejected = 0
+        # Чат освободился — его запрос из очереди можно запускать
+        dispatcher.add_idle_listener(lambda chat_id: self.pump())
+
+    def submit(
+        self,
+        chat_id,
+        fn: Callable,
+        *args,
+        on_queue: Optional[Callable[[int, float], Any]] = None,
+        on_cancel: Optional[Callable[[], Any]] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+        **kwargs,
+    ) -> int:
+        """
+        Запускает fn(*args, **kwargs) в пуле обработчиков чата, как только есть свободное место.
+        Возвращает номер в очереди (0 — запущена сразу) или бросает AdmissionRejected.
+        on_queue(номер, ожидание в секундах) вызывается при постановке в очередь и при каждом
+        продвижении; on_cancel() — если запрос сняли с очереди, потому что cancelled() стал истинным,
+        или его не удалось передать в пул.
+        """
+        entry = _Entry(chat_id, fn, args, kwargs, on_queue, on_cancel, cancelled)
+        with self._lock:
+            actions = self._drop_cancelled()
+            if self._running + self._starting >= self.limit and len(self._queue) >= self.queue_size:
+                self._rejected += 1
+                rejected = True
+            else:
+                self._queue.append(entry)
+                self._admitted += 1
+                rejected = False
+                actions += self._schedule()
+        self._perform(actions)
+        if rejected:
+            log.warning(f"Admission: queue is full ({self.queue_size}), rejected generation for chat {chat_id}")
+            raise AdmissionRejected("очередь генераций заполнена")
+        return entry.position or 0
+
+    def pump(self):
+        """Снимает с очереди отменённые запросы и запускает следующие, если есть места"""
+        with self._lock:
+            actions = self._drop_cancelled() + self._schedule()
+        self._perform(actions)
+
+    def eta(self, position: int) -> float:
+        """Примерное ожидание (сек) для номера в очереди: генерации идут волнами по limit штук"""
+        with self._lock:
+            return self._eta(position)
+
+    def _eta(self, position: int) -> float:
+        average = sum(self._durations) / len(self._durations) if self._durations else DEFAULT_DURATION
+        return math.ceil(position / self.limit) * average
+
+    def _drop_cancelled(self) -> list:
+        actions = []
+        kept = deque()
+        for entry in self._queue:
+            if entry.is_cancelled():
+                if entry.on_cancel:
+                    actions.append(entry.on_cancel)
+            else:
+                kept.append(entry)
+        self._queue = kept
+        return actions
+
+    def _schedule(self) -> list:
+        """Под блокировкой: запускает запросы на свободные места и пересчитывает номера остальных"""
+        actions = []
+        for entry in list(self._queue):
+            if self._running + self._starting >= self.limit:
+                break
+            if self._dispatcher.pending(entry.chat_id):
+                continue  # Чат ещё занят своими задачами — место не занимаем, ждём освобождения
+            self._queue.remove(entry)
+            entry.position = 0
+            self._starting += 1
+            actions.append(functools.partial(self._dispatch, entry))
+        for position, entry in enumerate(self._queue, 1):
+            if entry.position != position:
+                entry.position = position
+                if entry.on_queue:
+                    actions.append(functools.partial(entry.on_queue, position, self._eta(position)))
+        return actions
+
+    def _perform(self, actions: list):
+        # Уведомления и запуск — вне блокировки: они отправляют сообщения и ставят задачи в пул
+        for action in actions:
+            try:
+                action()
+            except Exception:
+                log.exception("Admission callback failed")
+
+    def _dispatch(self, entry: _Entry):
+        try:
+            self._dispatcher.submit(entry.chat_id, self._run, entry)
+        except Exception:
+            log.exception(f"Admission: cannot dispatch generation for chat {entry.chat_id}")
+            with self._lock:
+                self._starting -= 1
+            if entry.on_cancel:
+                entry.on_cancel()
+            self.pump()
+
+    def _run(self, entry: _Entry) -> Any:
+        with self._lock:
+            self._starting -= 1
+            self._running += 1
+        started = time.monotonic()
+        try:
+            return entry.fn(*entry.args, **entry.kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                # Отменённая генерация обрывается раньше и занизила бы оценку ожидания
+                if not entry.is_cancelled():
+                    self._durations.append(time.monotonic() - started)
+            self.pump()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "starting": self._starting,
+                "queued": len(self._queue),
+                "limit": self.limit,
+                "queue_size": self.queue_size,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "average": sum(self._durations) / len(self._durations) if self._durations else None,
+            }
+
+
+# Общий допуск генераций постов
+admission = AdmissionController()
@@ -0,0 +1,140 @@
+# utils/cancellation.py
+"""
+Отмена устаревших генераций.
+
+Каждая генерация поста получает Generation — флаг отмены, привязанный к чату.
+Новая тема из того же чата (или кнопка «Отменить» на статусном сообщении)
+отменяет предыдущую генерацию, даже если та ещё ждёт в очереди чата.
+Отмена кооперативная: генерация проверяет флаг между этапами, LLM-клиент —
+перед каждым запросом, ожидание картинки прерывается сразу, а ещё не
+запущенная операция YandexArt снимается с очереди.
+"""
+import itertools
+import threading
+from concurrent.futures import CancelledError, Future
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+SUPERSEDED = "пришла новая тема"
+CANCELLED_BY_USER = "отменено пользователем"
+
+_context = threading.local()
+_ids = itertools.count(1)
+
+
+class GenerationCancelled(RuntimeError):
+    """Генерация отменена; дальнейшие этапы не выполняются"""
+
+
+class Generation:
+    def __init__(self, chat_id):
+        self.id = next(_ids)
+        self.chat_id = chat_id
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+        self._futures: List[Future] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str) -> bool:
+        """Отменяет генерацию и ожидаемые ею задачи; False, если она уже была отменена"""
+        with self._lock:
+            if self.reason is not None:
+                return False
+            self.reason = reason
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.cancel()
+        return True
+
+    def check(self):
+        if self.reason is not None:
+            raise GenerationCancelled(self.reason)
+
+    def wait(self, future: Future, timeout: Optional[float] = None) -> Any:
+        """future.result(), прерываемый отменой генерации (ещё не начатая задача при этом отменяется)"""
+        with self._lock:
+            if self.reason is None:
+                self._futures.append(future)
+        if self.reason is not None:
+            future.cancel()
+        try:
+            return future.result(timeout=timeout)
+        except CancelledError:
+            raise GenerationCancelled(self.reason or CANCELLED_BY_USER) from None
+        finally:
+            with self._lock:
+                if future in self._futures:
+                    self._futures.remove(future)
+
+    @contextmanager
+    def activate(self):
+        """Делает генерацию текущей для потока: её отмену видят LLM-клиент и ожидание картинок"""
+        previous = getattr(_context, "generation", None)
+        _context.generation = self
+        try:
+            yield self
+        finally:
+            _context.generation = previous
+
+
+def current_generation() -> Optional[Generation]:
+    return getattr(_context, "generation", None)
+
+
+def check_cancelled():
+    """Прерывает текущую генерацию потока, если она отменена"""
+    generation = current_generation()
+    if generation is not None:
+        generation.check()
+
+
+class GenerationRegistry:
+    """Текущая генерация каждого чата"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: Dict[Any, Generation] = {}
+        self._started = 0
+        self._cancelled = 0
+
+    def start(self, chat_id) -> Generation:
+        """Новая генерация чата; предыдущая, если ещё не закончилась, отменяется"""
+        generation = Generation(chat_id)
+        with self._lock:
+            previous = self._current.get(chat_id)
+            self._current[chat_id] = generation
+            self._started += 1
+        if previous is not None and previous.cancel(SUPERSEDED):
+            self._count_cancelled()
+        return generation
+
+    def cancel(self, chat_id, reason: str = CANCELLED_BY_USER, generation_id: Optional[int] = None) -> bool:
+        """Отменяет текущую генерацию чата (или только генерацию generation_id, если она ещё текущая)"""
+        with self._lock:
+            generation = self._current.get(chat_id)
+        if generation is None or (generation_id is not None and generation.id != generation_id):
+            return False
+        if not generation.cancel(reason):
+            return False
+        self._count_cancelled()
+        return True
+
+    def finish(self, generation: Generation):
+        with self._lock:
+            if self._current.get(generation.chat_id) is generation:
+                del self._current[generation.chat_id]
+
+    def _count_cancelled(self):
+        with self._lock:
+            self._cancelled += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"active": len(self._current), "started": self._started, "cancelled": self._cancelled}
+
+
+# Генерации постов по чатам
+generations = GenerationRegistry()
@@ -0,0 +1,106 @@
+# utils/chat_dispatcher.py
+"""
+Пул для долгих обработчиков (генерация постов, правки, картинки).
+
+Обработчик telebot только подтверждает приём и ставит задачу сюда, поэтому
+поток диспетчера Telegram сразу свободен для следующих обновлений. Задачи
+одного чата выполняются строго по очереди (FIFO), задачи разных чатов —
+параллельно, не больше max_workers одновременно. После каждой задачи чат
+уступает поток следующему в очереди пула, так что длинная серия задач
+одного чата (недельный план) не задерживает остальных.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+from config import HANDLER_WORKERS
+
+log = logging.getLogger("tg-vk-bot")
+
+
+class ChatDispatcher:
+    def __init__(self, max_workers: int = HANDLER_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chat-worker")
+        self._lock = threading.Lock()
+        # Очереди задач по чатам; чат есть в словаре, пока у него есть невыполненные задачи
+        self._chats: Dict[Any, Deque[Tuple[Future, Callable, tuple, dict]]] = {}
+        self._running = 0
+        self._idle_listeners: List[Callable[[Any], Any]] = []
+
+    def add_idle_listener(self, listener: Callable[[Any], Any]):
+        """listener(chat_id) вызывается, когда у чата не осталось задач"""
+        self._idle_listeners.append(listener)
+
+    def submit(self, chat_id, fn: Callable, *args, **kwargs) -> Tuple[Future, int]:
+        """Ставит задачу чата в очередь; возвращает Future и число задач этого чата перед ней"""
+        future = Future()
+        with self._lock:
+            tasks = self._chats.get(chat_id)
+            if tasks is None:
+                self._chats[chat_id] = deque([(future, fn, args, kwargs)])
+                self._executor.submit(self._run_next, chat_id)
+                return future, 0
+            tasks.append((future, fn, args, kwargs))
+            return future, len(tasks) - 1
+
+    def _run_next(self, chat_id):
+        """Выполняет первую задачу чата; следующую ставит в конец очереди пула"""
+        with self._lock:
+            future, fn, args, kwargs = self._chats[chat_id][0]
+            self._running += 1
+
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                log.exception(f"Background handler {getattr(fn, '__name__', fn)} failed for chat {chat_id}")
+                future.set_exception(e)
+
+        with self._lock:
+            self._running -= 1
+            tasks = self._chats[chat_id]
+            tasks.popleft()
+            idle = not tasks
+            if idle:
+                del self._chats[chat_id]
+            else:
+                self._executor.submit(self._run_next, chat_id)
+
+        if idle:
+            for listener in self._idle_listeners:
+                try:
+                    listener(chat_id)
+                except Exception:
+                    log.exception("Chat idle listener failed")
+
+    def pending(self, chat_id) -> int:
+        """Сколько задач чата ещё не завершено (включая выполняемую)"""
+        with self._lock:
+            return len(self._chats.get(chat_id, ()))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "running": self._running,
+                "queued": sum(len(tasks) for tasks in self._chats.values()) - self._running,
+                "chats": len(self._chats),
+                "workers": self.max_workers,
+            }
+
+
+# Общий пул долгих обработчиков
+chat_dispatcher = ChatDispatcher()
+
+
+def run_in_background(bot, chat_id, fn: Callable, *args, **kwargs) -> Future:
+    """
+    Запускает долгий обработчик в пуле. Если у чата уже есть задачи, сразу сообщает,
+    что новая принята и выполнится после них.
+    """
+    future, ahead = chat_dispatcher.submit(chat_id, fn, *args, **kwargs)
+    if ahead:
+        bot.send_message(chat_id, f"⏳ Принято! Выполню после предыдущих задач (перед этой: {ahead}).")
+    return future
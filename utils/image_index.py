@@ -0,0 +1,187 @@
+# utils/image_index.py
+"""
+Локальный индекс сгенерированных изображений.
+
+Промпты для картинок косметологических постов часто почти одинаковые
+(«белый фон, уход за кожей, минимализм»), и каждый раз платить за новую
+генерацию YandexArt незачем. Индекс хранит копии сгенерированных картинок,
+нормализованный промпт (набор основ слов) и перцептивный хэш (dHash).
+
+Поиск по промпту — коэффициент Жаккара по основам слов: дёшево и без
+внешних вызовов. dHash нужен, чтобы находить визуальные повторы среди
+уже опубликованных постов.
+"""
+import io
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from PIL import Image
+
+from config import IMAGE_REUSE_SIMILARITY
+
+log = logging.getLogger("tg-vk-bot")
+
+INDEX_FILE = "image_index.json"
+IMAGE_CACHE_DIR = "image_cache"
+MAX_ENTRIES = 200
+# Картинки с расстоянием Хэмминга dHash не больше этого считаются повтором
+DUPLICATE_DISTANCE = 6
+
+STOP_WORDS = {
+    "and", "the", "with", "for", "без", "для", "как", "или", "при", "что", "это", "изображение", "image",
+}
+
+
+def normalize_prompt(prompt: str) -> Set[str]:
+    """Множество основ значимых слов промпта (грубый стемминг — первые 6 букв)"""
+    words = re.findall(r"\w+", (prompt or "").lower())
+    return {word[:6] for word in words if len(word) > 2 and word not in STOP_WORDS and not word.isdigit()}
+
+
+def prompt_similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def dhash(image_bytes: bytes, size: int = 8) -> str:
+    """Перцептивный разностный хэш: 64 бита в hex"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        pixels = image.convert("L").resize((size + 1, size), Image.LANCZOS).tobytes()
+
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{size * size // 4}x}"
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def find_duplicates(
+    items: Iterable[Tuple[Any, str]], max_distance: int = DUPLICATE_DISTANCE
+) -> List[Tuple[Any, Any, int]]:
+    """Пары визуально совпадающих картинок из [(ключ, dhash)] — [(ключ1, ключ2, расстояние)]"""
+    items = [(key, value) for key, value in items if value]
+    pairs = []
+    for i, (key_a, hash_a) in enumerate(items):
+        for key_b, hash_b in items[i + 1:]:
+            distance = hamming(hash_a, hash_b)
+            if distance <= max_distance:
+                pairs.append((key_a, key_b, distance))
+    return pairs
+
+
+def near_duplicates(
+    image_hash: str, items: Iterable[Tuple[Any, str]], max_distance: int = DUPLICATE_DISTANCE
+) -> List[Any]:
+    """Ключи из [(ключ, dhash)], картинки которых визуально совпадают с image_hash"""
+    if not image_hash:
+        return []
+    return [key for key, value in items if value and hamming(image_hash, value) <= max_distance]
+
+
+class ImageIndex:
+    def __init__(
+        self,
+        index_file: str = INDEX_FILE,
+        cache_dir: str = IMAGE_CACHE_DIR,
+        max_entries: int = MAX_ENTRIES,
+        min_similarity: float = IMAGE_REUSE_SIMILARITY,
+    ):
+        self.index_file = index_file
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._entries: Optional[List[Dict[str, Any]]] = None
+
+    def _load(self) -> List[Dict[str, Any]]:
+        """Читает индекс с диска при первом обращении (вызывать под self._lock)"""
+        if self._entries is None:
+            self._entries = []
+            if os.path.exists(self.index_file):
+                try:
+                    with open(self.index_file, encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except Exception as e:
+                    log.warning(f"Image index is corrupted, starting empty: {e}")
+        return self._entries
+
+    def _save(self):
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+
+    def add(self, prompt: str, image_bytes: bytes) -> Optional[Dict[str, Any]]:
+        """Сохраняет копию картинки и её ключи в индекс"""
+        if not image_bytes or not prompt:
+            return None
+        try:
+            image_hash = dhash(image_bytes)
+        except Exception as e:
+            log.warning(f"Cannot hash image for index: {e}")
+            return None
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {
+            "id": uuid.uuid4().hex,
+            "prompt": prompt,
+            "dhash": image_hash,
+            "created_at": datetime.now().isoformat(),
+        }
+        with open(os.path.join(self.cache_dir, f"{entry['id']}.jpg"), "wb") as f:
+            f.write(image_bytes)
+
+        with self._lock:
+            entries = self._load()
+            entries.append(entry)
+            while len(entries) > self.max_entries:
+                self._remove_file(entries.pop(0))
+            self._save()
+        return entry
+
+    def _remove_file(self, entry: Dict[str, Any]):
+        try:
+            os.remove(os.path.join(self.cache_dir, f"{entry['id']}.jpg"))
+        except OSError:
+            pass
+
+    def find(self, prompt: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Самая похожая по промпту запись и её сходство, если оно не ниже порога"""
+        if self.min_similarity <= 0:
+            return None
+        tokens = normalize_prompt(prompt)
+        with self._lock:
+            entries = list(self._load())
+
+        best, best_score = None, 0.0
+        for entry in entries:
+            score = prompt_similarity(tokens, normalize_prompt(entry["prompt"]))
+            if score > best_score:
+                best, best_score = entry, score
+        if best is None or best_score < self.min_similarity:
+            return None
+        return best, best_score
+
+    def load(self, entry: Dict[str, Any]) -> Optional[bytes]:
+        try:
+            with open(os.path.join(self.cache_dir, f"{entry['id']}.jpg"), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+# Глобальный индекс изображений
+image_index = ImageIndex()
@@ -0,0 +1,145 @@
+# utils/image_renditions.py
+"""
+Версии изображения под площадки публикации.
+
+YandexArt отдаёт JPEG «как есть», а Telegram и VK всё равно пережимают фото
+на своей стороне. Поэтому перед отправкой один раз готовим версию под площадку:
+прогрессивный JPEG, ограничение по стороне и целевой размер файла. Для картинок
+из temp_images версия кэшируется рядом с оригиналом (<имя>.tg.jpg, <имя>.vk.jpg),
+для черновиков в памяти — в небольшом LRU-кэше.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from state import TEMP_IMAGES_DIR, load_image_from_file
+
+log = logging.getLogger("tg-vk-bot")
+
+# Ступени качества JPEG: берём первую, при которой файл укладывается в целевой размер
+QUALITY_STEPS = (88, 82, 76, 70, 62, 55)
+MEMORY_CACHE_SIZE = 16
+
+
+@dataclass(frozen=True)
+class RenditionProfile:
+    max_side: int  # Максимальная сторона в пикселях
+    max_bytes: int  # Целевой размер файла
+
+
+PROFILES = {
+    # Telegram сжимает фото до 1280 px по длинной стороне, больше отправлять нет смысла
+    "tg": RenditionProfile(max_side=1280, max_bytes=350 * 1024),
+    # VK показывает фото на стене до 1920 px (в ленте — меньше)
+    "vk": RenditionProfile(max_side=1920, max_bytes=600 * 1024),
+}
+
+_memory_cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def render(image_bytes: bytes, profile: RenditionProfile) -> bytes:
+    """Готовит версию изображения под профиль; если оригинал уже меньше и подходит — возвращает его"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        fits = image.format == "JPEG" and max(image.size) <= profile.max_side
+        if fits and len(image_bytes) <= profile.max_bytes:
+            return image_bytes
+
+        image = image.convert("RGB")
+        image.thumbnail((profile.max_side, profile.max_side), Image.LANCZOS)
+
+        data = b""
+        for quality in QUALITY_STEPS:
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+            data = buffer.getvalue()
+            if len(data) <= profile.max_bytes:
+                break
+
+    if fits and len(data) >= len(image_bytes):
+        return image_bytes
+    return data
+
+
+def rendition_path(filename: str, platform: str) -> str:
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(TEMP_IMAGES_DIR, f"{stem}.{platform}.jpg")
+
+
+def rendition_file(filename: str, platform: str) -> Optional[str]:
+    """
+    Путь к версии картинки из temp_images под площадку; версия создаётся на диске при первом обращении.
+    Публикация открывает этот файл и отправляет его потоком, не читая в память.
+    При ошибке обработки возвращается путь к оригиналу.
+    """
+    path = rendition_path(filename, platform)
+    if os.path.exists(path):
+        return path
+
+    image_bytes = load_image_from_file(filename)
+    if not image_bytes:
+        return None
+    try:
+        data = render(image_bytes, PROFILES[platform])
+    except Exception as e:
+        log.warning(f"Image rendition for {platform} failed, using original: {e}")
+        return os.path.join(TEMP_IMAGES_DIR, filename)
+    log.info(f"Image rendition {platform}: {len(image_bytes)} -> {len(data)} bytes")
+
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # Диск заполнен или нет прав — публикуем оригинал, а не падаем
+        log.warning(f"Cannot save image rendition for {platform}, using original: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return os.path.join(TEMP_IMAGES_DIR, filename)
+    return path
+
+
+def get_rendition(image_bytes: Optional[bytes], platform: str, filename: Optional[str] = None) -> Optional[bytes]:
+    """
+    Версия изображения для площадки ("tg" или "vk").
+    Если передано имя файла из temp_images, версия читается из кэша на диске или создаётся там же.
+    При ошибке обработки возвращается оригинал — публикация не должна падать из-за пережатия.
+    """
+    if filename:
+        path = rendition_file(filename, platform)
+        if not path:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    if not image_bytes:
+        return image_bytes
+
+    key = (hashlib.sha1(image_bytes).hexdigest(), platform)
+    with _memory_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+
+    try:
+        data = render(image_bytes, PROFILES[platform])
+    except Exception as e:
+        log.warning(f"Image rendition for {platform} failed, using original: {e}")
+        return image_bytes
+    log.info(f"Image rendition {platform}: {len(image_bytes)} -> {len(data)} bytes")
+
+    with _memory_lock:
+        _memory_cache[key] = data
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+    return data
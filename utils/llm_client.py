@@ -0,0 +1,201 @@
+# utils/llm_client.py
+"""
+Общий клиент OpenAI для обработчиков и планировщика.
+
+Все запросы проходят через один лимитер (запросы/мин и токены/мин) и очередь
+с приоритетами: интерактивные запросы (быстрые посты, правки) всегда обслуживаются
+раньше фоновых (планирование на неделю). На 429 клиент соблюдает Retry-After
+и приостанавливает всю очередь, а не только упавший запрос.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+from config import OPENAI_API_KEY, OPENAI_RPM, OPENAI_TPM
+from utils.cancellation import check_cancelled
+from utils.rate_limit import TokenBucket
+
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+HTTP_TIMEOUT = 30
+log = logging.getLogger("tg-vk-bot")
+
+# Приоритеты: меньше — важнее
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+LANE_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+# Оценка ответа модели до получения usage (в токенах)
+ESTIMATED_COMPLETION_TOKENS = 800
+RETRY_STATUSES = {429, 500, 502, 503}
+# Как часто запрос в очереди лимитера проверяет, не стал ли он ненужным (сек)
+ABANDON_POLL = 0.2
+
+
+class RequestAbandoned(RuntimeError):
+    """Запрос больше не нужен (например, хедж-запрос уже проиграл) и не был отправлен"""
+
+
+class LLMClient:
+    def __init__(self, api_key: str, rpm: int, tpm: int, url: str = OPENAI_URL, max_retries: int = 4):
+        self.api_key = api_key
+        self.url = url
+        self.max_retries = max_retries
+        self.session = requests.Session()
+
+        self._requests = TokenBucket(rpm / 60.0, max(1, rpm // 6))
+        self._tokens = TokenBucket(tpm / 60.0, tpm)
+        self._cond = threading.Condition()
+        self._waiting = []  # heap из (priority, seq)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+
+        self._queue_depth = {lane: 0 for lane in LANE_NAMES}
+        self._waits = {lane: deque(maxlen=200) for lane in LANE_NAMES}
+        self._counters = {"requests": 0, "throttled": 0, "retries": 0}
+
+    @staticmethod
+    def estimate_tokens(payload: Dict[str, Any]) -> int:
+        chars = sum(len(str(m.get("content", ""))) for m in payload.get("messages", []))
+        return chars // 3 + ESTIMATED_COMPLETION_TOKENS
+
+    def _acquire(self, tokens: int, priority: int, abandoned: Optional[threading.Event] = None) -> float:
+        """
+        Ждёт своей очереди и свободной ёмкости лимитера; возвращает время ожидания.
+        Если abandoned установлен до списания ёмкости, бросает RequestAbandoned — лимиты не тратятся.
+        """
+        ticket = (priority, next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            self._queue_depth[priority] += 1
+            try:
+                # Без abandoned ждём уведомления; с ним — просыпаемся, чтобы его проверить
+                poll = ABANDON_POLL if abandoned is not None else None
+                while True:
+                    if abandoned is not None and abandoned.is_set():
+                        raise RequestAbandoned("запрос больше не нужен")
+                    if self._waiting[0] != ticket:
+                        self._cond.wait(timeout=poll)
+                        continue
+                    delay = self._paused_until - time.monotonic()
+                    if delay <= 0:
+                        delay = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+                    if delay <= 0:
+                        self._requests.consume(1)
+                        self._tokens.consume(tokens)
+                        break
+                    self._cond.wait(timeout=min(delay, poll) if poll else delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._queue_depth[priority] -= 1
+                self._cond.notify_all()
+
+        waited = time.monotonic() - started
+        self._waits[priority].append(waited)
+        return waited
+
+    def _count(self, name: str):
+        with self._cond:
+            self._counters[name] += 1
+
+    def _pause(self, seconds: float):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    @staticmethod
+    def _retry_after(response: requests.Response, attempt: int) -> float:
+        headers = response.headers
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return min(2.0**attempt, 30.0)
+
+    def chat(
+        self,
+        payload: Dict[str, Any],
+        priority: int = PRIORITY_INTERACTIVE,
+        abandoned: Optional[threading.Event] = None,
+        on_latency: Optional[Callable[[float], Any]] = None,
+        on_send: Optional[Callable[[], Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Отправляет chat/completions и возвращает разобранный JSON ответа.
+        Если abandoned установлен, пока запрос ждал лимитера, он не отправляется и не тратит
+        лимиты (RequestAbandoned).
+        on_latency(секунды) получает время самого HTTP-запроса успешного ответа, без ожидания очереди.
+        on_send() вызывается, когда запрос прошёл лимитер и отправляется (при повторах — перед каждым).
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        estimate = self.estimate_tokens(payload)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            self._acquire(estimate, priority, abandoned)
+            # Пока запрос ждал очереди, генерацию могли отменить — тогда не отправляем его
+            check_cancelled()
+            self._count("requests")
+            if on_send is not None:
+                on_send()
+            started = time.monotonic()
+            r = self.session.post(self.url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+            elapsed = time.monotonic() - started
+
+            if r.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                delay = self._retry_after(r, attempt)
+                if r.status_code == 429:
+                    self._count("throttled")
+                    self._pause(delay)
+                self._count("retries")
+                log.warning(f"OpenAI {r.status_code}, повтор через {delay:.1f} с (попытка {attempt})")
+                time.sleep(delay)
+                continue
+
+            try:
+                data = r.json()
+            except Exception as e:
+                log.exception("OpenAI JSON error")
+                raise RuntimeError(f"OpenAI ответ не JSON: {r.text[:500]}") from e
+
+            if r.status_code >= 400 or "error" in data:
+                raise RuntimeError(f"OpenAI ошибка: {data.get('error', data)}")
+
+            # Корректируем лимитер токенов по фактическому расходу
+            usage = data.get("usage") or {}
+            if usage.get("total_tokens"):
+                self._tokens.consume(int(usage["total_tokens"]) - estimate)
+            if on_latency is not None:
+                on_latency(elapsed)
+            return data
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queue_depth = {LANE_NAMES[p]: n for p, n in self._queue_depth.items()}
+            counters = dict(self._counters)
+        waits = {}
+        for priority, samples in self._waits.items():
+            values = list(samples)
+            waits[LANE_NAMES[priority]] = {
+                "avg": sum(values) / len(values) if values else 0.0,
+                "max": max(values) if values else 0.0,
+            }
+        return dict(counters, queue_depth=queue_depth, wait=waits)
+
+
+# Глобальный экземпляр для обработчиков и планировщика
+llm_client = LLMClient(OPENAI_API_KEY, OPENAI_RPM, OPENAI_TPM)
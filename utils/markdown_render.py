@@ -0,0 +1,292 @@
+# utils/markdown_render.py
+"""
+Разбор Markdown поста за один проход и версии текста для площадок.
+
+Пост разбирается один раз построчно в промежуточную форму (MarkdownDocument),
+из которой строятся:
+- plain: текст без разметки для каналов — ровно то, что давала прежняя цепочка
+  re.sub в clean_markdown, включая её правила для непарных *, _ и #;
+- html: текст для parse_mode="HTML" в Telegram с <b>/<i>;
+- vk: plain с обрезкой под лимит VK.
+
+Для plain разбор пар не нужен: если в строке чётное число * (и отдельно _),
+удаляются все; полный разбор пар идёт только для строк с непарным маркером
+и для HTML. Версии кэшируются по тексту (render_markdown), поэтому предпросмотр
+и публикация одного поста не разбирают его заново.
+"""
+import bisect
+import functools
+import html
+import re
+from typing import List, Tuple
+
+BOLD, ITALIC = 1, 2
+
+# VK поддерживает до 16000 символов, оставляем запас
+VK_MAX_LEN = 15000
+VK_CUT_LEN = 14500
+VK_CONTINUED = "\n\n... (продолжение в комментариях)"
+
+# Одиночные * и #, окружённые пробелами
+_LONE_MARKER = re.compile(r"(?<!\S)[*#](?!\S)")
+
+Run = List  # [текст, начертание]
+
+
+def _positions(line: str, char: str) -> List[int]:
+    result = []
+    i = line.find(char)
+    while i != -1:
+        result.append(i)
+        i = line.find(char, i + 1)
+    return result
+
+
+def _pair_markers(positions: List[int], toggles: dict, shift=None) -> List[int]:
+    """
+    Парные маркеры одного символа в строке: сначала двойные (**текст** — жирный),
+    затем оставшиеся одиночные по порядку (*текст* — курсив). Пары ищутся слева
+    направо с кратчайшим содержимым, как у нежадного регулярного выражения.
+    В toggles для каждого удаляемого маркера записывается, какое начертание
+    начинается (+) или заканчивается (-) после него.
+    shift(p) — сколько символов перед p уже удалено: маркеры, между которыми
+    были только удалённые символы, считаются соседними.
+    Возвращает позиции, удалённые двойными маркерами.
+    """
+    keys = [p - shift(p) for p in positions] if shift else positions
+    doubles = [i for i in range(len(keys) - 1) if keys[i + 1] == keys[i] + 1]
+    doubled = []
+    i = 0
+    while i + 1 < len(doubles):
+        start, end = doubles[i], doubles[i + 1]
+        if end < start + 2:
+            # Перекрывающиеся пары (***): закрывающая ищется не раньше чем через два символа
+            del doubles[i + 1]
+            continue
+        for j in (start, start + 1, end, end + 1):
+            doubled.append(positions[j])
+            toggles[positions[j]] = 0
+        toggles[positions[start + 1]] = BOLD
+        toggles[positions[end]] = -BOLD
+        # Следующая пара начинается после закрывающей
+        i += 2
+        while i < len(doubles) and doubles[i] < end + 2:
+            del doubles[i]
+
+    rest = [p for p in positions if p not in toggles]
+    for p, q in zip(rest[::2], rest[1::2]):
+        toggles[p] = ITALIC
+        toggles[q] = -ITALIC
+    return doubled
+
+
+def _parse_inline(line: str) -> List[Run]:
+    """Фрагменты строки с начертанием; маркеры * и _ из пар удаляются"""
+    toggles = {}
+    doubled = _pair_markers(_positions(line, "*"), toggles) if "*" in line else []
+    if "_" in line:
+        # __ ищутся в тексте, из которого уже убраны пары **
+        _pair_markers(_positions(line, "_"), toggles, functools.partial(bisect.bisect, doubled) if doubled else None)
+    if not toggles:
+        return [[line, 0]] if line else []
+
+    # Начертание меняется только на удаляемых маркерах, между ними текст однороден
+    runs: List[Run] = []
+    counts = {BOLD: 0, ITALIC: 0}
+    style = 0
+    prev = 0
+    for m in sorted(toggles):
+        if m > prev:
+            if runs and runs[-1][1] == style:
+                runs[-1][0] += line[prev:m]
+            else:
+                runs.append([line[prev:m], style])
+        delta = toggles[m]
+        if delta:
+            counts[abs(delta)] += 1 if delta > 0 else -1
+            style = (BOLD if counts[BOLD] else 0) | (ITALIC if counts[ITALIC] else 0)
+        prev = m + 1
+    if prev < len(line):
+        if runs and runs[-1][1] == style:
+            runs[-1][0] += line[prev:]
+        else:
+            runs.append([line[prev:], style])
+    return runs
+
+
+def _lstrip_runs(runs: List[Run]):
+    while runs:
+        text = runs[0][0].lstrip()
+        if text:
+            runs[0][0] = text
+            return
+        runs.pop(0)
+
+
+def _rstrip_runs(runs: List[Run]):
+    while runs:
+        text = runs[-1][0].rstrip()
+        if text:
+            runs[-1][0] = text
+            return
+        runs.pop()
+
+
+def _remove_lone_markers(runs: List[Run]):
+    """Убирает одиночные * и #, окружённые пробелами (края строки считаются пробелами)"""
+    line = "".join(run[0] for run in runs)
+    lone = [m.start() for m in _LONE_MARKER.finditer(line)]
+    if not lone:
+        return
+    offset = 0
+    for run in runs:
+        end = offset + len(run[0])
+        cut = [p - offset for p in lone if offset <= p < end]
+        if cut:
+            text = run[0]
+            run[0] = "".join(text[a + 1 : b] for a, b in zip([-1] + cut, cut + [len(text)]))
+        offset = end
+    runs[:] = [run for run in runs if run[0]]
+
+
+def _strip_inline(line: str) -> str:
+    """
+    Текст строки без парных маркеров. При чётном числе * (и отдельно _) пары
+    находятся для всех, и маркеры просто удаляются; иначе один маркер остаётся,
+    и какой именно — определяет полный разбор.
+    """
+    if line.count("*") % 2 or line.count("_") % 2:
+        return "".join(run[0] for run in _parse_inline(line))
+    return line.replace("*", "").replace("_", "")
+
+
+def _drop_runs(runs: List[Run], count: int):
+    """Убирает первые count символов строки"""
+    while runs and count:
+        text = runs[0][0]
+        if len(text) > count:
+            runs[0][0] = text[count:]
+            return
+        count -= len(text)
+        runs.pop(0)
+
+
+class MarkdownDocument:
+    """
+    Промежуточная форма поста: для каждой строки — уровень заголовка, исходная строка,
+    сколько символов снято в её начале (# заголовка и пробелы) и текст без разметки.
+    Начертание фрагментов нужно только для HTML и разбирается при его построении.
+    """
+
+    def __init__(self, lines: List[Tuple[int, str, int, str]]):
+        self.lines = lines
+
+    @classmethod
+    def parse(cls, text: str) -> "MarkdownDocument":
+        lines = []
+        eat_whitespace = False  # Пустой заголовок «съедает» пробелы и пустые строки после себя
+        for raw in (text or "").split("\n"):
+            line = _strip_inline(raw) if "*" in raw or "_" in raw else raw
+
+            level = 0
+            stripped = line
+            if line.startswith("#"):
+                stripped = line.lstrip("#")
+                level = min(6, len(line) - len(stripped))
+                stripped = line[level:].lstrip()
+                eat_whitespace = not stripped
+            elif eat_whitespace:
+                stripped = line.lstrip()
+                eat_whitespace = not stripped
+            if eat_whitespace:
+                continue
+            lines.append((level, raw, len(line) - len(stripped), stripped))
+        return cls(lines)
+
+    def plain(self) -> str:
+        text = "\n".join(line[3] for line in self.lines)
+        return _LONE_MARKER.sub("", text).strip()
+
+    def runs(self) -> List[Tuple[int, List[Run]]]:
+        """Строки как фрагменты с начертанием, без одиночных маркеров и пробелов по краям текста"""
+        lines = []
+        for level, raw, cut, _ in self.lines:
+            runs = _parse_inline(raw) if "*" in raw or "_" in raw else [[raw, 0]] if raw else []
+            _drop_runs(runs, cut)
+            _remove_lone_markers(runs)
+            lines.append((level, runs))
+
+        while lines and not "".join(run[0] for run in lines[0][1]).strip():
+            lines.pop(0)
+        while lines and not "".join(run[0] for run in lines[-1][1]).strip():
+            lines.pop()
+        if lines:
+            _lstrip_runs(lines[0][1])
+            _rstrip_runs(lines[-1][1])
+        return lines
+
+    def html(self) -> str:
+        """Текст для parse_mode="HTML": жирный и курсив сохраняются, заголовки — жирные строки"""
+        result = []
+        for level, runs in self.runs():
+            parts = []
+            for text, style in runs:
+                if level:
+                    style |= BOLD
+                text = html.escape(text, quote=False)
+                if style & ITALIC:
+                    text = f"<i>{text}</i>"
+                if style & BOLD:
+                    text = f"<b>{text}</b>"
+                parts.append(text)
+            result.append("".join(parts))
+        return "\n".join(result)
+
+
+def truncate_vk(text: str) -> str:
+    """
+    Текст до VK_MAX_LEN символов отправляем полностью, длиннее — обрезаем красиво:
+    по последнему предложению, абзацу или просто по длине
+    """
+    if len(text) <= VK_MAX_LEN:
+        return text
+
+    truncated = text[:VK_CUT_LEN]  # Оставляем место для "..."
+
+    # Ищем последнее предложение
+    last_sentence = truncated.rfind(".")
+    if last_sentence > 10000:  # Если есть предложение в разумных пределах
+        return truncated[: last_sentence + 1] + VK_CONTINUED
+
+    # Если нет - ищем последний абзац
+    last_paragraph = truncated.rfind("\n\n")
+    if last_paragraph > 8000:
+        return truncated[:last_paragraph] + VK_CONTINUED
+
+    # В крайнем случае - просто обрезаем
+    return truncated + "..."
+
+
+class RenderedPost:
+    """Версии текста поста для площадок; каждая строится при первом обращении"""
+
+    def __init__(self, text: str):
+        self.document = MarkdownDocument.parse(text)
+
+    @functools.cached_property
+    def plain(self) -> str:
+        return self.document.plain()
+
+    @functools.cached_property
+    def html(self) -> str:
+        return self.document.html()
+
+    @functools.cached_property
+    def vk(self) -> str:
+        return truncate_vk(self.plain)
+
+
+@functools.lru_cache(maxsize=128)
+def render_markdown(text: str) -> RenderedPost:
+    """Разобранный пост из кэша: повторный предпросмотр и публикация того же текста не разбирают его заново"""
+    return RenderedPost(text)
@@ -0,0 +1,212 @@
+# utils/model_router.py
+"""
+Выбор модели OpenAI под задачу.
+
+Для каждой задачи задан маршрут: основная модель, запасная и SLO по задержке.
+Роутер считает скользящий p95 задержки по каждой модели. Если основной запрос
+не уложился в SLO, параллельно отправляется хедж-запрос в запасную модель,
+и побеждает первый успешный ответ; проигравший запрос, если он ещё ждёт
+лимитера, не отправляется. Хеджирование включено только для
+интерактивных запросов: фоновому планированию задержка не важна, а лишняя
+нагрузка на лимиты — важна.
+
+Задержка модели — время самого HTTP-запроса, без ожидания в очереди лимитера:
+иначе маршрут реагировал бы на собственную очередь бота, а не на модель. По той
+же причине SLO отсчитывается с отправки основного запроса: пока он ждёт лимитера,
+хедж встал бы в ту же насыщенную очередь.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    OPENAI_MODEL_TEXT,
+    OPENAI_MODEL_PROMPT,
+    OPENAI_MODEL_FAST,
+    OPENAI_MODEL_FALLBACK,
+    LLM_SLO_TEXT,
+    LLM_SLO_FAST,
+)
+from utils.cancellation import check_cancelled, current_generation
+from utils.llm_client import llm_client, PRIORITY_INTERACTIVE
+
+log = logging.getLogger("tg-vk-bot")
+
+# Минимум замеров, после которого p95 модели учитывается при выборе маршрута
+MIN_SAMPLES = 5
+# Замеры старше этого срока не учитываются, чтобы маршрут мог вернуться к основной модели
+SAMPLE_MAX_AGE = 600
+
+
+@dataclass(frozen=True)
+class Route:
+    primary: str
+    fallback: Optional[str]
+    slo: float  # секунды
+
+
+ROUTES: Dict[str, Route] = {
+    "post_text": Route(OPENAI_MODEL_TEXT, OPENAI_MODEL_FALLBACK, LLM_SLO_TEXT),
+    "text_edit": Route(OPENAI_MODEL_TEXT, OPENAI_MODEL_FALLBACK, LLM_SLO_TEXT),
+    "text_section_edit": Route(OPENAI_MODEL_TEXT, OPENAI_MODEL_FALLBACK, LLM_SLO_TEXT),
+    "topics": Route(OPENAI_MODEL_TEXT, OPENAI_MODEL_FALLBACK, LLM_SLO_TEXT),
+    "topics_edit": Route(OPENAI_MODEL_FAST, OPENAI_MODEL_TEXT, LLM_SLO_FAST),
+    "image_prompt": Route(OPENAI_MODEL_PROMPT, OPENAI_MODEL_TEXT, LLM_SLO_FAST),
+    "image_edit_prompt": Route(OPENAI_MODEL_PROMPT, OPENAI_MODEL_TEXT, LLM_SLO_FAST),
+}
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных запросов по моделям"""
+
+    def __init__(self, window: int = 100, max_age: float = SAMPLE_MAX_AGE):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self._window = window
+        self._max_age = max_age
+
+    def record(self, model: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self._window)).append((time.monotonic(), seconds))
+
+    def _recent(self, model: str) -> List[float]:
+        cutoff = time.monotonic() - self._max_age
+        with self._lock:
+            return [seconds for ts, seconds in self._samples.get(model, ()) if ts >= cutoff]
+
+    def p95(self, model: str) -> Optional[float]:
+        samples = sorted(self._recent(model))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def count(self, model: str) -> int:
+        return len(self._recent(model))
+
+    def models(self) -> List[str]:
+        with self._lock:
+            return list(self._samples)
+
+
+class ModelRouter:
+    def __init__(self, routes: Dict[str, Route], client=llm_client, max_workers: int = 16):
+        self.routes = routes
+        self.client = client
+        self.latency = LatencyTracker()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        self._lock = threading.Lock()
+        self._counters = {"hedged": 0, "hedge_wins": 0, "fallbacks": 0, "swapped": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def route(self, task: str) -> Route:
+        """Маршрут задачи; если основная модель стабильно медленнее SLO, а запасная нет — меняем их местами"""
+        route = self.routes.get(task) or Route(OPENAI_MODEL_TEXT, OPENAI_MODEL_FALLBACK, LLM_SLO_TEXT)
+        if not route.fallback or route.fallback == route.primary:
+            return Route(route.primary, None, route.slo)
+
+        primary_p95 = self.latency.p95(route.primary)
+        fallback_p95 = self.latency.p95(route.fallback)
+        if primary_p95 and fallback_p95 and primary_p95 > route.slo >= fallback_p95:
+            self._count("swapped")
+            return Route(route.fallback, route.primary, route.slo)
+        return route
+
+    def _call(
+        self, model: str, payload: Dict[str, Any], priority: int, generation=None, abandoned=None, on_send=None
+    ) -> Dict[str, Any]:
+        # Отмену генерации видит и клиент в потоке пула
+        with generation.activate() if generation else nullcontext():
+            return self.client.chat(
+                dict(payload, model=model),
+                priority=priority,
+                abandoned=abandoned,
+                on_latency=lambda seconds: self.latency.record(model, seconds),
+                on_send=on_send,
+            )
+
+    def _submit(
+        self, model: str, payload: Dict[str, Any], priority: int, generation, pending: dict
+    ) -> threading.Event:
+        """Ставит запрос в пул; возвращает событие «запрос отправлен или уже завершился»"""
+        abandoned, sent = threading.Event(), threading.Event()
+        future = self._pool.submit(self._call, model, payload, priority, generation, abandoned, sent.set)
+        future.add_done_callback(lambda _: sent.set())
+        pending[future] = (model, abandoned)
+        return sent
+
+    @staticmethod
+    def _abandon(pending: dict):
+        """Проигравшие запросы: ещё не начатые снимаются, ждущие лимитера не отправляются"""
+        for future, (_, abandoned) in pending.items():
+            abandoned.set()
+            future.cancel()
+
+    def chat(
+        self, task: str, messages: list, priority: int = PRIORITY_INTERACTIVE, **payload
+    ) -> Tuple[Dict[str, Any], str]:
+        """Выполняет запрос по маршруту задачи; возвращает (ответ, модель)"""
+        route = self.route(task)
+        payload = dict(payload, messages=messages)
+        generation = current_generation()
+        check_cancelled()
+
+        pending = {}
+        sent = self._submit(route.primary, payload, priority, generation, pending)
+        fallback_started = hedged = False
+
+        if route.fallback and priority == PRIORITY_INTERACTIVE:
+            # Пока основной запрос в очереди лимитера, не хеджируем: SLO считаем с отправки
+            sent.wait()
+            done, _ = wait(list(pending), timeout=route.slo)
+            if not done:
+                log.warning(f"LLM {route.primary} превысила SLO {route.slo:.0f} с для {task}, хедж в {route.fallback}")
+                self._count("hedged")
+                fallback_started = hedged = True
+                check_cancelled()
+                self._submit(route.fallback, payload, priority, generation, pending)
+
+        last_error = None
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                model, _ = pending.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    log.warning(f"LLM {model} ошибка для {task}: {e}")
+                    last_error = e
+                    continue
+                if hedged and model != route.primary:
+                    self._count("hedge_wins")
+                self._abandon(pending)
+                return data, model
+
+            if not pending and route.fallback and not fallback_started:
+                # Основная модель ответила ошибкой — повторяем в запасной
+                log.info(f"LLM fallback {route.primary} -> {route.fallback} для {task}")
+                self._count("fallbacks")
+                fallback_started = True
+                check_cancelled()
+                self._submit(route.fallback, payload, priority, generation, pending)
+
+        raise last_error
+
+    def stats(self) -> Dict[str, Any]:
+        models = {}
+        for model in self.latency.models():
+            models[model] = {"count": self.latency.count(model), "p95": self.latency.p95(model)}
+        with self._lock:
+            counters = dict(self._counters)
+        return dict(counters, models=models)
+
+
+# Глобальный роутер для всех вызовов OpenAI
+model_router = ModelRouter(ROUTES)
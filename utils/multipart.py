@@ -0,0 +1,112 @@
+# utils/multipart.py
+"""
+Потоковое тело multipart/form-data.
+
+requests с files= собирает всё тело запроса в памяти: картинка копируется
+в bytes при чтении файла и ещё раз в итоговое тело. MultipartStream отдаёт
+тело кусками прямо из открытого файла (или из уже готовых байтов через
+memoryview), длина известна заранее — запрос уходит с Content-Length,
+без chunked-кодирования.
+"""
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+
+
+def source_length(source) -> int:
+    """Размер байтов или файлового объекта; файл всегда отправляется целиком, с начала"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).nbytes
+    return source.seek(0, os.SEEK_END)
+
+
+def _part(source) -> Tuple[Any, int, int]:
+    """(источник, начальное смещение, длина) части тела"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast("B")
+        return view, 0, len(view)
+    return source, 0, source_length(source)
+
+
+def _filename(name: str, source) -> str:
+    """Имя файла в заголовке части — как у requests: имя открытого файла или имя поля"""
+    path = getattr(source, "name", None)
+    if isinstance(path, str) and path and not path.startswith("<"):
+        return os.path.basename(path)
+    return name
+
+
+class MultipartStream:
+    """
+    Тело multipart/form-data для requests (data=..., заголовок Content-Type — content_type).
+    files: {поле: файл | байты | (имя, файл | байты[, content-type])}, fields: обычные поля формы.
+    """
+
+    def __init__(self, files: Dict[str, Any], fields: Optional[Dict[str, Any]] = None, chunk_size: int = CHUNK_SIZE):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self._parts: List[Tuple[Any, int, int]] = []
+
+        for name, value in (fields or {}).items():
+            self._add_bytes(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+            )
+        for name, value in files.items():
+            if isinstance(value, tuple):
+                filename, source = value[0], value[1]
+                content_type = value[2] if len(value) > 2 else "application/octet-stream"
+            else:
+                filename, source, content_type = _filename(name, value), value, "application/octet-stream"
+            self._add_bytes(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n".encode("utf-8")
+            )
+            self._parts.append(_part(source))
+            self._add_bytes(b"\r\n")
+        self._add_bytes(f"--{self.boundary}--\r\n".encode("utf-8"))
+
+        self._length = sum(size for _, _, size in self._parts)
+        self._part = 0
+        self._offset = 0
+
+    def _add_bytes(self, data: bytes):
+        self._parts.append((memoryview(data), 0, len(data)))
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        """Следующий кусок тела: не больше одной части и не больше size байт (size < 0 — всё оставшееся)"""
+        if size is None or size < 0:
+            return b"".join(self)
+        while self._part < len(self._parts):
+            source, start, length = self._parts[self._part]
+            if self._offset >= length:
+                self._part += 1
+                self._offset = 0
+                continue
+            count = min(size, length - self._offset)
+            if isinstance(source, memoryview):
+                chunk = source[self._offset:self._offset + count].tobytes()
+            else:
+                # Смещение задаём явно: файл мог читать кто-то ещё (например, повтор отправки)
+                source.seek(start + self._offset)
+                chunk = source.read(count)
+                if not chunk:
+                    raise IOError("File was truncated while uploading")
+            self._offset += len(chunk)
+            return chunk
+        return b""
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
@@ -0,0 +1,224 @@
+# utils/openai_batch.py
+"""
+Пакетная (Batch API) генерация для недельного плана.
+
+Формат входного файла — JSONL, по строке на запрос:
+    {"custom_id": "...", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+Формат выходного файла — JSONL:
+    {"id": "...", "custom_id": "...", "response": {"status_code": 200, "body": {...}}, "error": null}
+
+OpenAIBatchBackend работает с настоящим Batch API, LocalBatchBackend — локальная
+замена с тем же форматом файлов для тестов и разработки.
+"""
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from config import OPENAI_API_KEY, PLANNING_BATCH_MODE
+
+OPENAI_API = "https://api.openai.com/v1"
+CHAT_ENDPOINT = "/v1/chat/completions"
+HTTP_TIMEOUT = 30
+LOCAL_BATCH_DIR = "batch_jobs"
+log = logging.getLogger("tg-vk-bot")
+
+# Статусы Batch API, после которых результатов больше не будет
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchError(RuntimeError):
+    pass
+
+
+class TransientBatchError(BatchError):
+    """Временный сбой API (429, 5xx): запрос можно повторить позже"""
+
+
+# Ошибки опроса пакета, после которых пакет не бросают, а опрашивают дальше
+TRANSIENT_BATCH_ERRORS = (requests.RequestException, TransientBatchError)
+
+
+def _check_transient(r: requests.Response):
+    if r.status_code == 429 or r.status_code >= 500:
+        raise TransientBatchError(f"OpenAI Batch временно недоступен ({r.status_code}): {r.text[:200]}")
+
+
+def build_batch_line(custom_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    return {"custom_id": custom_id, "method": "POST", "url": CHAT_ENDPOINT, "body": body}
+
+
+def to_jsonl(lines: List[Dict[str, Any]]) -> str:
+    return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines)
+
+
+def parse_batch_output(text: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Разбирает выходной JSONL. Возвращает {custom_id: {"body": ...} или {"error": ...}}.
+    """
+    results = {}
+    for raw in text.splitlines():
+        if not raw.strip():
+            continue
+        line = json.loads(raw)
+        custom_id = line.get("custom_id")
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code", 200) >= 400:
+            results[custom_id] = {"error": line.get("error") or response.get("body")}
+        else:
+            results[custom_id] = {"body": response.get("body") or {}}
+    return results
+
+
+def result_content(result: Dict[str, Any]) -> str:
+    """Текст ответа модели из одной строки результатов"""
+    if "error" in result:
+        raise BatchError(f"Ошибка в пакете: {result['error']}")
+    return result["body"]["choices"][0]["message"]["content"].strip()
+
+
+class OpenAIBatchBackend:
+    """Batch API OpenAI: загрузка файла, создание пакета, опрос и скачивание результатов"""
+
+    def __init__(self, api_key: str, api_url: str = OPENAI_API):
+        self.api_url = api_url
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _json(self, r: requests.Response) -> Dict[str, Any]:
+        _check_transient(r)
+        try:
+            data = r.json()
+        except ValueError as e:
+            raise BatchError(f"OpenAI Batch ответ не JSON: {r.text[:500]}") from e
+        if r.status_code >= 400 or data.get("error"):
+            raise BatchError(f"OpenAI Batch ошибка: {data.get('error', data)}")
+        return data
+
+    def submit(self, lines: List[Dict[str, Any]]) -> str:
+        payload = io.BytesIO(to_jsonl(lines).encode("utf-8"))
+        file_resp = self.session.post(
+            f"{self.api_url}/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", payload, "application/jsonl")},
+            timeout=HTTP_TIMEOUT,
+        )
+        input_file_id = self._json(file_resp)["id"]
+
+        batch_resp = self.session.post(
+            f"{self.api_url}/batches",
+            json={"input_file_id": input_file_id, "endpoint": CHAT_ENDPOINT, "completion_window": "24h"},
+            timeout=HTTP_TIMEOUT,
+        )
+        return self._json(batch_resp)["id"]
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        return self._json(self.session.get(f"{self.api_url}/batches/{batch_id}", timeout=HTTP_TIMEOUT))
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        batch = self.status(batch_id)
+        results = {}
+        for key in ("output_file_id", "error_file_id"):
+            file_id = batch.get(key)
+            if not file_id:
+                continue
+            r = self.session.get(f"{self.api_url}/files/{file_id}/content", timeout=HTTP_TIMEOUT)
+            _check_transient(r)
+            if r.status_code >= 400:
+                raise BatchError(f"Не удалось скачать {key}: {r.text[:200]}")
+            results.update(parse_batch_output(r.text))
+        return results
+
+
+class LocalBatchBackend:
+    """
+    Локальная замена Batch API. Пишет входной и выходной JSONL в каталог base_dir
+    и выполняет запросы в фоновом потоке через execute(body) -> body ответа.
+    """
+
+    def __init__(self, execute: Callable[[Dict[str, Any]], Dict[str, Any]], base_dir: str = LOCAL_BATCH_DIR):
+        self.execute = execute
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        self._batches: Dict[str, Dict[str, Any]] = {}
+
+    def _path(self, batch_id: str, kind: str) -> str:
+        return os.path.join(self.base_dir, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, lines: List[Dict[str, Any]]) -> str:
+        os.makedirs(self.base_dir, exist_ok=True)
+        batch_id = f"batch_local_{uuid.uuid4().hex}"
+        with open(self._path(batch_id, "input"), "w", encoding="utf-8") as f:
+            f.write(to_jsonl(lines))
+
+        with self._lock:
+            self._batches[batch_id] = {"id": batch_id, "status": "validating"}
+        threading.Thread(target=self._process, args=(batch_id,), daemon=True).start()
+        return batch_id
+
+    def _process(self, batch_id: str):
+        self._set_status(batch_id, "in_progress")
+        output = []
+        with open(self._path(batch_id, "input"), encoding="utf-8") as f:
+            requests_lines = [json.loads(raw) for raw in f if raw.strip()]
+
+        for line in requests_lines:
+            entry = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": line["custom_id"], "error": None}
+            try:
+                entry["response"] = {"status_code": 200, "body": self.execute(line["body"])}
+            except Exception as e:
+                entry["response"] = None
+                entry["error"] = {"code": "local_error", "message": str(e)}
+            output.append(entry)
+
+        with open(self._path(batch_id, "output"), "w", encoding="utf-8") as f:
+            f.write(to_jsonl(output))
+        self._set_status(batch_id, "completed", output_file_id=self._path(batch_id, "output"))
+
+    def _set_status(self, batch_id: str, status: str, **extra):
+        with self._lock:
+            self._batches.setdefault(batch_id, {"id": batch_id}).update(extra, status=status)
+
+    def status(self, batch_id: str) -> Dict[str, Any]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch:
+                return dict(batch)
+        # Пакет мог завершиться до перезапуска процесса — ищем выходной файл
+        output_path = self._path(batch_id, "output")
+        if os.path.exists(output_path):
+            return {"id": batch_id, "status": "completed", "output_file_id": output_path}
+        return {"id": batch_id, "status": "failed"}
+
+    def results(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        output_path = self.status(batch_id).get("output_file_id")
+        if not output_path:
+            return {}
+        with open(output_path, encoding="utf-8") as f:
+            return parse_batch_output(f.read())
+
+
+_backends: Dict[str, Any] = {}
+_backends_lock = threading.Lock()
+
+
+def get_batch_backend(mode: Optional[str] = None):
+    """Бэкенд пакетной генерации по настройке PLANNING_BATCH_MODE (off/openai/local)"""
+    mode = (mode or PLANNING_BATCH_MODE or "off").lower()
+    if mode not in ("openai", "local"):
+        return None
+
+    with _backends_lock:
+        if mode not in _backends:
+            if mode == "openai":
+                _backends[mode] = OpenAIBatchBackend(OPENAI_API_KEY)
+            else:
+                from utils.llm_client import llm_client, PRIORITY_BACKGROUND
+
+                _backends[mode] = LocalBatchBackend(lambda body: llm_client.chat(body, priority=PRIORITY_BACKGROUND))
+        return _backends[mode]
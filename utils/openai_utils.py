@@ -1,86 +1,52 @@
-import requests
-from config import OPENAI_API_KEY, OPENAI_MODEL_TEXT, OPENAI_MODEL_PROMPT
+import json
+from typing import Any, Dict, Optional
+from utils.llm_client import PRIORITY_INTERACTIVE
+from utils.model_router import model_router
+from utils.prompts import get_prompt, prompt_cache_stats
+from utils.singleflight import singleflight, normalize
+from utils.post_sections import split_sections, render_sections, apply_section_patches, MIN_SECTIONS
 import logging
 
-OPENAI_URL = "https://api.openai.com/v1/chat/completions"
-HTTP_TIMEOUT = 30
 log = logging.getLogger("tg-vk-bot")
 
 
-def _openai_chat(messages, model: str) -> str:
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    payload = {
-        "model": model,
-        "messages": messages,
-    }
-    r = requests.post(OPENAI_URL, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
-    try:
-        data = r.json()
-    except Exception as e:
-        log.exception("OpenAI JSON error")
-        raise RuntimeError(f"OpenAI ответ не JSON: {r.text[:500]}") from e
+def _chat_with_prompt(
+    name: str, priority: int = PRIORITY_INTERACTIVE, payload: Optional[Dict[str, Any]] = None, **variables
+) -> str:
+    """Запрос по промпту из реестра; модель выбирает роутер по имени промпта"""
+    template = get_prompt(name)
+    data, model = model_router.chat(name, template.build(**variables), priority=priority, **(payload or {}))
+    log.debug(f"OpenAI {template.key} -> {model}")
 
-    if r.status_code >= 400 or "error" in data:
-        raise RuntimeError(f"OpenAI ошибка: {data.get('error', data)}")
+    # Сколько токенов промпта пришло из кэша префикса OpenAI
+    prompt_cache_stats.record(template.key, data.get("usage"))
 
     return data["choices"][0]["message"]["content"].strip()
 
 
-def generate_text(topic: str) -> str:
-    prompt = (
-        f"Ты — эксперт-косметолог и блогер. Генерируй посты для Telegram в стиле: понятно, дружелюбно, но с научными фактами.\n\n"
-        f"ТЕМА: {topic}\n\n"
-        f"Формат поста:\n"
-        f"• Вступление-крючок (вопрос, миф, наблюдение)\n"
-        f"• Основная часть — факты, советы или разбор (желательно в виде списков)\n"
-        f"• Итог/вывод с мотивацией или ключевой мыслью\n\n"
-        f"Правила:\n"
-        f"• Используй подзаголовки: «Что это такое?», «Миф 1», «ТОП-5»\n"
-        f"• Делай списки и структурированный текст для лёгкого восприятия\n"
-        f"• Стиль — лёгкий, дружеский, но экспертный\n"
-        f"• Объём: 1000–1500 знаков\n"
-        f"• Объём: полный развернутый пост (без ограничений длины)\n"
-        f"• Темы: уход за кожей, мифы и правда, процедуры, ингредиенты, здоровые привычки для кожи\n\n"
-        f"Примеры фраз:\n"
-        f"• Начало: «Давайте разберёмся, правда ли…»\n"
-        f"• Конец: «Сияющая кожа — это система привычек, а не только косметика»\n\n"
-        f"Напиши пост строго по этому формату:"
-    )
-    return _openai_chat([{"role": "user", "content": prompt}], OPENAI_MODEL_TEXT)
+def build_chat_body(name: str, **variables) -> Dict[str, Any]:
+    """Тело запроса chat/completions по промпту из реестра (для пакетной генерации)"""
+    template = get_prompt(name)
+    return {"model": model_router.route(name).primary, "messages": template.build(**variables)}
 
 
-def generate_image_prompt(text: str) -> str:
-    system_msg = (
-        "Ты — помощник SMM-специалиста. На основе поста сформируй краткий промпт для генерации 1:1 изображения. "
-        "Ключевые требования: чистый белый фон или нейтральный пастельный; минимализм; "
-        "акцент на коже/уходе; без текста на изображении; без логотипов; как для Instagram."
-    )
-    return _openai_chat(
-        [{"role": "system", "content": system_msg}, {"role": "user", "content": text}], OPENAI_MODEL_PROMPT
+# Одинаковые одновременные запросы генерации выполняются один раз (utils/singleflight).
+# Приоритет входит в ключ: интерактивный запрос не ждёт такой же фоновый в его очереди
+
+
+def generate_text(topic: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+    return singleflight.do(
+        ("post_text", priority, normalize(topic)), _chat_with_prompt, "post_text", priority, topic=topic
     )
 
 
-def generate_topics() -> list[str]:
+def generate_image_prompt(text: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+    return singleflight.do(("image_prompt", priority, text), _chat_with_prompt, "image_prompt", priority, text=text)
+
+
+def generate_topics(priority: int = PRIORITY_INTERACTIVE) -> list[str]:
     """Генерирует 3 актуальные темы для постов на неделю"""
-    prompt = (
-        "Ты — эксперт-косметолог и блогер. "
-        "Предложи 3 актуальные темы для постов на неделю в Telegram-канале о косметологии.\n\n"
-        "Темы должны быть:\n"
-        "• Сезонными и актуальными\n"
-        "• Подходящими для формата: вступление-крючок → факты/советы → вывод\n"
-        "• Разнообразными: уход за кожей, мифы и правда, процедуры, ингредиенты, здоровые привычки\n"
-        "• Интересными для широкой аудитории\n"
-        "• Подходящими для дружелюбного, но экспертного стиля\n\n"
-        "Примеры хороших тем:\n"
-        "• Правда ли, что кожа привыкает к косметике\n"
-        "• Зимний уход: 5 главных правил\n"
-        "• Витамин С для лица: мифы и факты\n\n"
-        "Формат ответа: просто список из 3 тем, каждая с новой строки, без нумерации."
-    )
-    response = _openai_chat([{"role": "user", "content": prompt}], OPENAI_MODEL_TEXT)
+    response = singleflight.do(("topics", priority), _chat_with_prompt, "topics", priority)
     topics = [topic.strip() for topic in response.split("\n") if topic.strip()]
     return topics[:3]  # Берем только первые 3 темы
 
@@ -88,13 +54,55 @@ def generate_topics() -> list[str]:
 def edit_topics(topics: list[str], instruction: str) -> list[str]:
     """Редактирует темы согласно инструкции пользователя"""
     topics_text = "\n".join(f"{i + 1}. {topic}" for i, topic in enumerate(topics))
-    prompt = (
-        f"Отредактируй темы для постов согласно инструкции. "
-        f"Сохрани профессиональный подход к косметологии.\n\n"
-        f"ТЕКУЩИЕ ТЕМЫ:\n{topics_text}\n\n"
-        f"ИНСТРУКЦИЯ:\n{instruction}\n\n"
-        f"Верни 3 отредактированные темы, каждую с новой строки, без нумерации."
-    )
-    response = _openai_chat([{"role": "user", "content": prompt}], OPENAI_MODEL_TEXT)
+    response = _chat_with_prompt("topics_edit", topics=topics_text, instruction=instruction)
     new_topics = [topic.strip() for topic in response.split("\n") if topic.strip()]
     return new_topics[:3]
+
+
+def edit_post_text(text: str, instruction: str) -> str:
+    """Редактирует текст поста по инструкции пользователя"""
+    return _chat_with_prompt("text_edit", text=text, instruction=instruction)
+
+
+def edit_post_sections(text: str, instruction: str) -> str:
+    """
+    Точечная правка: модель возвращает только изменённые разделы поста, они подставляются локально.
+    Если пост почти без структуры, модель просит полную переработку или ответ не разобрался —
+    делаем обычную правку всего текста.
+    """
+    sections = split_sections(text)
+    if len(sections) < MIN_SECTIONS:
+        return edit_post_text(text, instruction)
+
+    response = _chat_with_prompt(
+        "text_section_edit",
+        payload={"response_format": {"type": "json_object"}},
+        sections=render_sections(sections),
+        instruction=instruction,
+    )
+    try:
+        result = json.loads(response)
+    except ValueError:
+        result = None
+    # Ответ должен быть объектом с объектом sections; всё остальное — как неразобранный ответ
+    if not isinstance(result, dict) or not isinstance(result.get("sections") or {}, dict):
+        log.warning("Section edit returned unexpected JSON, falling back to full rewrite")
+        return edit_post_text(text, instruction)
+
+    keys = {section.key for section in sections}
+    patches = {
+        key: value
+        for key, value in (result.get("sections") or {}).items()
+        if key in keys and isinstance(value, str) and value.strip()
+    }
+    if result.get("full_rewrite") or not patches:
+        log.info("Section edit requested full rewrite")
+        return edit_post_text(text, instruction)
+
+    log.info(f"Section edit patched {sorted(patches)} of {len(sections)} sections")
+    return apply_section_patches(sections, patches)
+
+
+def generate_image_prompt_with_wish(text: str, wish: str) -> str:
+    """Формирует промпт для изображения с учётом пожелания пользователя"""
+    return _chat_with_prompt("image_edit_prompt", text=text, wish=wish)
@@ -0,0 +1,78 @@
+# utils/post_sections.py
+"""
+Разбиение поста на адресуемые разделы для точечного редактирования.
+
+Раздел начинается с подзаголовка (Markdown-заголовок, строка целиком жирным
+или типовые подзаголовки наших постов: «Миф 1», «ТОП-5», «Итог» и т.д.).
+Текст до первого подзаголовка — вступление-крючок. Разбиение обратимо:
+join_sections(split_sections(text)) == text.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List
+
+HEADING_RE = re.compile(
+    r"^\s*(?:"
+    r"#{1,6}\s+\S.*"  # ### Заголовок
+    r"|\*\*[^*\n]+\*\*[:.!?]?"  # **Заголовок**
+    r"|__[^_\n]+__[:.!?]?"  # __Заголовок__
+    r"|(?:\W{0,3}\s*)?(?:Миф|Правда|ТОП|Топ|Что это такое|Итог|Вывод|Совет)\b[^\n]{0,80}"
+    r")\s*$"
+)
+# Минимальное число разделов, при котором точечная правка имеет смысл
+MIN_SECTIONS = 3
+
+
+@dataclass
+class Section:
+    key: str
+    title: str
+    text: str
+
+
+def _title(line: str) -> str:
+    return re.sub(r"^[#*_\s]+|[*_\s]+$", "", line)[:60] or "Раздел"
+
+
+def split_sections(text: str) -> List[Section]:
+    """Делит пост на разделы по подзаголовкам"""
+    sections: List[Section] = []
+    current_title = "Вступление"
+    current: List[str] = []
+
+    for line in text.splitlines(keepends=True):
+        if HEADING_RE.match(line.rstrip("\n")):
+            if "".join(current).strip():
+                sections.append(Section(f"s{len(sections)}", current_title, "".join(current)))
+                current = []
+            current_title = _title(line)
+        current.append(line)
+
+    sections.append(Section(f"s{len(sections)}", current_title, "".join(current)))
+    if len(sections) > 1:
+        sections[-1].title = f"{sections[-1].title} (вывод)"
+    return sections
+
+
+def join_sections(sections: List[Section]) -> str:
+    return "".join(section.text for section in sections)
+
+
+def render_sections(sections: List[Section]) -> str:
+    """Текст разделов с идентификаторами для промпта"""
+    return "\n\n".join(f"=== {s.key}: {s.title} ===\n{s.text.strip()}" for s in sections)
+
+
+def apply_section_patches(sections: List[Section], patches: Dict[str, str]) -> str:
+    """Подставляет новые тексты разделов, сохраняя отступы между ними"""
+    result = []
+    for section in sections:
+        patch = patches.get(section.key)
+        if patch is None:
+            result.append(section.text)
+            continue
+        trailing = section.text[len(section.text.rstrip()):]
+        result.append(patch.strip() + (trailing or "\n\n"))
+
+    original = join_sections(sections)
+    return "".join(result).rstrip() + original[len(original.rstrip()):]
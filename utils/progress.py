@@ -0,0 +1,172 @@
+# utils/progress.py
+"""
+Одно статусное сообщение на долгую операцию.
+
+Вместо отдельного сообщения на каждый шаг («Генерирую пост 2/3…», ошибки)
+ProgressReporter держит одно сообщение и правит его через edit_message_text:
+список этапов с временем выполнения, предупреждения и итог. Правки не чаще
+min_interval: промежуточные состояния, которые не успели показать, схлопываются
+в одну правку по таймеру, а итог показывается сразу.
+"""
+import logging
+import threading
+import time
+from typing import List, Optional
+
+log = logging.getLogger("tg-vk-bot")
+
+# Минимальный интервал между правками статусного сообщения (сек)
+PROGRESS_MIN_INTERVAL = 2.0
+
+STAGE_RUNNING, STAGE_DONE, STAGE_FAILED = "⏳", "✅", "❌"
+
+
+class _Stage:
+    def __init__(self, text: str):
+        self.text = text
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.status = STAGE_RUNNING
+
+    def close(self, status: str = STAGE_DONE):
+        if self.finished is None:
+            self.finished = time.monotonic()
+            self.status = status
+
+    def render(self) -> str:
+        if self.finished is None:
+            return f"{self.status} {self.text}…"
+        return f"{self.status} {self.text} — {self.finished - self.started:.1f} с"
+
+
+class ProgressReporter:
+    def __init__(self, bot, chat_id, title: str, min_interval: float = PROGRESS_MIN_INTERVAL, reply_markup=None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.title = title
+        self.min_interval = min_interval
+        self.reply_markup = reply_markup  # Кнопки под сообщением, пока операция не завершена
+        self.message_id: Optional[int] = None
+        self.edits = 0  # Сколько раз сообщение правилось
+        self._stages: List[_Stage] = []
+        self._notes: List[str] = []
+        self._footer: Optional[str] = None
+        self._started = time.monotonic()
+        self._shown: Optional[str] = None
+        self._last_edit = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "ProgressReporter":
+        """Отправляет статусное сообщение (сразу — как подтверждение, что работа началась)"""
+        text = self.render()
+        message = self.bot.send_message(self.chat_id, text, reply_markup=self.reply_markup)
+        with self._lock:
+            self.message_id = message.message_id
+            self._shown = text
+            self._last_edit = time.monotonic()
+        return self
+
+    def stage(self, text: str):
+        """Завершает текущий этап и начинает новый"""
+        with self._lock:
+            if self._stages:
+                self._stages[-1].close()
+            self._stages.append(_Stage(text))
+        self._flush()
+
+    def update(self, text: str):
+        """Меняет подпись текущего этапа (например, счётчик «2/3»), не сбрасывая его время"""
+        with self._lock:
+            if self._stages:
+                self._stages[-1].text = text
+        self._flush()
+
+    def fail_stage(self, note: Optional[str] = None):
+        """Помечает текущий этап неудачным; операция продолжается"""
+        with self._lock:
+            if self._stages:
+                self._stages[-1].close(STAGE_FAILED)
+            if note:
+                self._notes.append(f"⚠️ {note}")
+        self._flush()
+
+    def note(self, text: str):
+        with self._lock:
+            self._notes.append(f"⚠️ {text}")
+        self._flush()
+
+    def done(self, text: str):
+        """Итог операции; показывается сразу, без ожидания интервала"""
+        self._finish(text, STAGE_DONE)
+
+    def fail(self, text: str):
+        self._finish(text, STAGE_FAILED)
+
+    def _finish(self, text: str, status: str):
+        with self._lock:
+            if self._stages:
+                self._stages[-1].close(status)
+            self._footer = f"{text}\n⏱ {time.monotonic() - self._started:.0f} с"
+        self._flush(force=True)
+
+    def delete(self):
+        """Удаляет статусное сообщение (например, когда результат отправлен отдельным сообщением)"""
+        with self._lock:
+            self._cancel_timer()
+            message_id, self.message_id = self.message_id, None
+        if message_id is not None:
+            try:
+                self.bot.delete_message(self.chat_id, message_id)
+            except Exception:
+                pass  # Игнорируем ошибки удаления
+
+    def render(self) -> str:
+        lines = [self.title]
+        if self._stages:
+            lines.append("")
+            lines.extend(stage.render() for stage in self._stages)
+        if self._notes:
+            lines.append("")
+            lines.extend(self._notes)
+        if self._footer:
+            lines.append("")
+            lines.append(self._footer)
+        return "\n".join(lines)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+        self._flush()
+
+    def _flush(self, force: bool = False):
+        """Правит сообщение, если текст изменился и интервал прошёл; иначе откладывает правку по таймеру"""
+        with self._lock:
+            if self.message_id is None:
+                return
+            text = self.render()
+            if text == self._shown:
+                return
+            wait = self.min_interval - (time.monotonic() - self._last_edit)
+            if wait > 0 and not force:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._on_timer)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._cancel_timer()
+            self._shown = text
+            self._last_edit = time.monotonic()
+            self.edits += 1
+            # Правим под блокировкой: правки одного сообщения не должны обгонять друг друга
+            # После итога кнопки убираем: правка без reply_markup снимает клавиатуру
+            reply_markup = self.reply_markup if self._footer is None else None
+            try:
+                self.bot.edit_message_text(text, self.chat_id, self.message_id, reply_markup=reply_markup)
+            except Exception as e:
+                log.warning(f"Cannot update progress message: {e}")
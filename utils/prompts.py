@@ -0,0 +1,232 @@
+# utils/prompts.py
+"""
+Реестр промптов для OpenAI.
+
+Статическая часть промпта (роль, формат, правила, примеры) всегда идёт первым
+system-сообщением и не меняется между вызовами — тогда OpenAI может переиспользовать
+закэшированный префикс. Переменные (тема, текст, инструкция) подставляются только
+в последнее user-сообщение.
+
+Каждый промпт версионирован: активные версии задаются переменной окружения PROMPT_VERSIONS,
+например ``post_text=v1|v2,topics=v1``. Если указано несколько версий через ``|``,
+версия выбирается случайно на каждый вызов (A/B), а статистика ведётся отдельно
+по каждой версии.
+"""
+import random
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from config import PROMPT_VERSIONS
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    version: str
+    system: str
+    user: str  # Шаблон для str.format, содержит только переменные части
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@{self.version}"
+
+    def build(self, **variables) -> List[Dict[str, str]]:
+        """Собирает сообщения: неизменный system-префикс, затем переменные"""
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user.format(**variables)},
+        ]
+
+
+_registry: Dict[str, Dict[str, PromptTemplate]] = {}
+
+
+def register_prompt(template: PromptTemplate) -> PromptTemplate:
+    _registry.setdefault(template.name, {})[template.version] = template
+    return template
+
+
+def _parse_versions(raw: str) -> Dict[str, List[str]]:
+    versions = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        choices = [v.strip() for v in value.split("|") if v.strip()]
+        if choices:
+            versions[name.strip()] = choices
+    return versions
+
+
+ACTIVE_VERSIONS = _parse_versions(PROMPT_VERSIONS)
+
+
+def _version_key(version: str) -> list:
+    """Ключ сортировки версий: числа сравниваются как числа ("v10" новее "v2")"""
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version)]
+
+
+def get_prompt(name: str, version: Optional[str] = None) -> PromptTemplate:
+    """Возвращает шаблон промпта; без версии — активную (или последнюю зарегистрированную)"""
+    versions = _registry.get(name)
+    if not versions:
+        raise KeyError(f"Промпт не найден: {name}")
+
+    if version is None:
+        choices = [v for v in ACTIVE_VERSIONS.get(name, []) if v in versions]
+        version = random.choice(choices) if choices else max(versions, key=_version_key)
+
+    if version not in versions:
+        raise KeyError(f"Версия промпта не найдена: {name}@{version}")
+    return versions[version]
+
+
+class PromptCacheStats:
+    """Счётчики использования кэша промптов по ключу name@version"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, key: str, usage: Optional[dict]):
+        usage = usage or {}
+        details = usage.get("prompt_tokens_details") or {}
+        with self._lock:
+            entry = self._stats.setdefault(key, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+            entry["calls"] += 1
+            entry["prompt_tokens"] += int(usage.get("prompt_tokens") or 0)
+            entry["cached_tokens"] += int(details.get("cached_tokens") or 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            result = {}
+            for key, entry in self._stats.items():
+                prompt_tokens = entry["prompt_tokens"]
+                hit_rate = entry["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+                result[key] = dict(entry, hit_rate=hit_rate)
+            return result
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+# ---------------------------------------------------------------------------
+# Промпты версии v1 (перенесены из прежних f-строк, переменные вынесены в конец)
+# ---------------------------------------------------------------------------
+
+register_prompt(
+    PromptTemplate(
+        name="post_text",
+        version="v1",
+        system=(
+            "Ты — эксперт-косметолог и блогер. Генерируй посты для Telegram в стиле: понятно, дружелюбно, но с научными фактами.\n\n"
+            "Формат поста:\n"
+            "• Вступление-крючок (вопрос, миф, наблюдение)\n"
+            "• Основная часть — факты, советы или разбор (желательно в виде списков)\n"
+            "• Итог/вывод с мотивацией или ключевой мыслью\n\n"
+            "Правила:\n"
+            "• Используй подзаголовки: «Что это такое?», «Миф 1», «ТОП-5»\n"
+            "• Делай списки и структурированный текст для лёгкого восприятия\n"
+            "• Стиль — лёгкий, дружеский, но экспертный\n"
+            "• Объём: 1000–1500 знаков\n"
+            "• Объём: полный развернутый пост (без ограничений длины)\n"
+            "• Темы: уход за кожей, мифы и правда, процедуры, ингредиенты, здоровые привычки для кожи\n\n"
+            "Примеры фраз:\n"
+            "• Начало: «Давайте разберёмся, правда ли…»\n"
+            "• Конец: «Сияющая кожа — это система привычек, а не только косметика»\n\n"
+            "Тема поста будет в следующем сообщении. Напиши пост строго по этому формату."
+        ),
+        user="ТЕМА: {topic}",
+    )
+)
+
+register_prompt(
+    PromptTemplate(
+        name="image_prompt",
+        version="v1",
+        system=(
+            "Ты — помощник SMM-специалиста. На основе поста сформируй краткий промпт для генерации 1:1 изображения. "
+            "Ключевые требования: чистый белый фон или нейтральный пастельный; минимализм; "
+            "акцент на коже/уходе; без текста на изображении; без логотипов; как для Instagram."
+        ),
+        user="{text}",
+    )
+)
+
+register_prompt(
+    PromptTemplate(
+        name="topics",
+        version="v1",
+        system=(
+            "Ты — эксперт-косметолог и блогер. "
+            "Предложи 3 актуальные темы для постов на неделю в Telegram-канале о косметологии.\n\n"
+            "Темы должны быть:\n"
+            "• Сезонными и актуальными\n"
+            "• Подходящими для формата: вступление-крючок → факты/советы → вывод\n"
+            "• Разнообразными: уход за кожей, мифы и правда, процедуры, ингредиенты, здоровые привычки\n"
+            "• Интересными для широкой аудитории\n"
+            "• Подходящими для дружелюбного, но экспертного стиля\n\n"
+            "Примеры хороших тем:\n"
+            "• Правда ли, что кожа привыкает к косметике\n"
+            "• Зимний уход: 5 главных правил\n"
+            "• Витамин С для лица: мифы и факты\n\n"
+            "Формат ответа: просто список из 3 тем, каждая с новой строки, без нумерации."
+        ),
+        user="Предложи темы на эту неделю.",
+    )
+)
+
+register_prompt(
+    PromptTemplate(
+        name="topics_edit",
+        version="v1",
+        system=(
+            "Отредактируй темы для постов согласно инструкции. "
+            "Сохрани профессиональный подход к косметологии.\n\n"
+            "Верни 3 отредактированные темы, каждую с новой строки, без нумерации."
+        ),
+        user="ТЕКУЩИЕ ТЕМЫ:\n{topics}\n\nИНСТРУКЦИЯ:\n{instruction}",
+    )
+)
+
+register_prompt(
+    PromptTemplate(
+        name="text_edit",
+        version="v1",
+        system=(
+            "Отредактируй текст поста строго по инструкции. Сохрани факты, улучшай структуру и ясность. "
+            "Верни только готовый текст без пояснений."
+        ),
+        user="ТЕКСТ:\n{text}\n\nИНСТРУКЦИЯ:\n{instruction}",
+    )
+)
+
+register_prompt(
+    PromptTemplate(
+        name="image_edit_prompt",
+        version="v1",
+        system=(
+            "Сформируй краткий промпт для генератора изображений (1:1) на основе текста поста и пожелания. "
+            "Стиль минималистичный, без текста, фокус на теме ухода за кожей."
+        ),
+        user="ПОСТ:\n{text}\n\nПОЖЕЛАНИЕ:\n{wish}",
+    )
+)
+
+register_prompt(
+    PromptTemplate(
+        name="text_section_edit",
+        version="v1",
+        system=(
+            "Ты редактируешь пост косметолога по частям. Пост разбит на разделы с идентификаторами "
+            "(=== s0: Название ===). Измени строго по инструкции только те разделы, которых она касается. "
+            "Сохрани факты, стиль и разметку.\n\n"
+            "Ответь JSON-объектом:\n"
+            '{"sections": {"<id раздела>": "<новый текст раздела целиком, вместе с подзаголовком>"}}\n'
+            "Не включай разделы, которые не меняются. Если инструкция касается всего поста "
+            '(тон, объём, структура целиком), ответь {"full_rewrite": true}.'
+        ),
+        user="РАЗДЕЛЫ:\n{sections}\n\nИНСТРУКЦИЯ:\n{instruction}",
+    )
+)
@@ -0,0 +1,94 @@
+# utils/rate_limit.py
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Классический token bucket: ёмкость capacity, пополнение rate единиц в секунду.
+    Уровень может уходить в минус (долг), если фактический расход оказался больше оценки.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._level = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float = 1) -> float:
+        """Сколько секунд ждать, пока в корзине появится amount единиц"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._level >= amount:
+                return 0.0
+            return (amount - self._level) / self.rate
+
+    def consume(self, amount: float = 1):
+        """Списывает amount единиц (отрицательное значение возвращает их в корзину)"""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - min(amount, self.capacity))
+
+    def try_consume(self, amount: float = 1) -> float:
+        """Списывает amount, если хватает; иначе возвращает время ожидания"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill()
+            if self._level >= amount:
+                self._level -= amount
+                return 0.0
+            return (amount - self._level) / self.rate
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+
+class AdaptiveRateLimiter:
+    """
+    Лимитер запросов с подстройкой под ответы сервера (AIMD): при ответе «слишком много
+    запросов» скорость делится пополам и корзина уходит в долг, после успешных запросов
+    скорость плавно возвращается к базовой.
+    """
+
+    def __init__(self, rate: float, min_rate: float = 0.5, increase: float = 0.05):
+        self.base_rate = float(rate)
+        self.min_rate = min(float(min_rate), self.base_rate)
+        self.increase = increase
+        self.bucket = TokenBucket(rate, max(1.0, rate))
+        self._lock = threading.Lock()
+        self.throttled = 0
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def acquire(self) -> float:
+        """Ждёт разрешения на запрос; возвращает время ожидания"""
+        waited = 0.0
+        while True:
+            delay = self.bucket.try_consume()
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def on_success(self):
+        with self._lock:
+            if self.bucket.rate < self.base_rate:
+                self.bucket.set_rate(min(self.base_rate, self.bucket.rate + self.increase))
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttled += 1
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+            # Корзина уходит в долг примерно на секунду при новой скорости
+            self.bucket.consume(self.bucket.rate)
@@ -0,0 +1,110 @@
+# utils/singleflight.py
+"""
+Объединение одинаковых одновременных запросов генерации.
+
+Пока выполняется вызов с некоторым ключом (нормализованный запрос), такие же
+вызовы не повторяют работу, а ждут его результат: двойное нажатие «Генерировать
+темы» или одна и та же тема от двух редакторов стоят одного запроса к OpenAI
+или YandexArt. Ключ живёт только пока вызов выполняется — это не кэш.
+
+Ждущий вызов прерывается отменой своей генерации (utils/cancellation), не
+задевая остальных. Если отменили генерацию ведущего вызова, ждущие не получают
+чужую отмену, а повторяют вызов сами.
+"""
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from utils.cancellation import GenerationCancelled, check_cancelled, current_generation
+
+log = logging.getLogger("tg-vk-bot")
+
+
+def normalize(text: str) -> str:
+    """Ключ запроса: регистр и пробелы не делают запрос другим"""
+    return " ".join((text or "").lower().split())
+
+
+def _follow(shared: Future) -> Future:
+    """Собственный Future ждущего вызова: его отмена не отменяет общий"""
+    own = Future()
+
+    def copy(done: Future):
+        try:
+            if done.exception() is not None:
+                own.set_exception(done.exception())
+            else:
+                own.set_result(done.result())
+        except InvalidStateError:
+            pass  # Ждущий уже отменён
+
+    shared.add_done_callback(copy)
+    return own
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Tuple[Hashable, ...], Future] = {}
+        self._calls: Counter = Counter()
+        self._deduplicated: Counter = Counter()
+
+    def do(self, key: Tuple[Hashable, ...], fn: Callable, *args, **kwargs) -> Any:
+        """
+        Выполняет fn(*args, **kwargs) или ждёт результат такого же вызова, который уже выполняется.
+        Первый элемент ключа — вид запроса, по нему ведётся статистика.
+        """
+        while True:
+            with self._lock:
+                shared = self._flights.get(key)
+                leader = shared is None
+                if leader:
+                    shared = self._flights[key] = Future()
+                    self._calls[key[0]] += 1
+                else:
+                    self._deduplicated[key[0]] += 1
+
+            if leader:
+                return self._lead(key, shared, fn, args, kwargs)
+
+            log.info(f"Singleflight: joined in-flight {key[0]} request")
+            try:
+                generation = current_generation()
+                if generation is None:
+                    return shared.result()
+                return generation.wait(_follow(shared))
+            except GenerationCancelled:
+                # Отменили генерацию ведущего вызова, а не нашу — выполняем запрос сами
+                check_cancelled()
+
+    def _lead(self, key, shared: Future, fn: Callable, args, kwargs) -> Any:
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._land(key)
+            shared.set_exception(e)
+            raise
+        self._land(key)
+        shared.set_result(result)
+        return result
+
+    def _land(self, key):
+        # Ключ снимаем до выдачи результата: следующий такой же запрос — уже новый вызов
+        with self._lock:
+            del self._flights[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds = set(self._calls) | set(self._deduplicated)
+            return {
+                "calls": sum(self._calls.values()),
+                "deduplicated": sum(self._deduplicated.values()),
+                "in_flight": len(self._flights),
+                "kinds": {kind: {"calls": self._calls[kind], "deduplicated": self._deduplicated[kind]} for kind in kinds},
+            }
+
+
+# Общий объединитель запросов генерации
+singleflight = SingleFlight()
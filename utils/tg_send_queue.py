@@ -0,0 +1,295 @@
+# utils/tg_send_queue.py
+"""
+Очередь исходящих запросов к Telegram.
+
+Telegram ограничивает бота примерно 30 сообщениями в секунду в целом, одним
+сообщением в секунду в личном чате (с небольшими всплесками) и 20 сообщениями
+в минуту в группе или канале. При превышении приходит 429 с retry_after.
+
+Все отправки проходят через TelegramSendQueue: вызывающий поток ставит запрос
+в очередь и ждёт результат, а несколько рабочих потоков отправляют запросы,
+соблюдая общий лимит и лимит каждого чата. Ответы пользователям идут раньше
+фоновых уведомлений (публикации, отчёты планировщика) других чатов; внутри
+одного чата сообщения всегда уходят в порядке постановки, а чат с ожидающим
+ответом пользователю обслуживается с его приоритетом. 429 обрабатывается
+прозрачно: чат ставится на паузу на retry_after, запрос повторяется.
+
+Отправка блокирует вызывающий поток до ответа Telegram (а при 429 — на время
+паузы), поэтому под store_lock и другими общими блокировками её не делают.
+"""
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+
+from config import TG_GLOBAL_RPS, TG_CHAT_RPS, TG_GROUP_RPM, TG_SEND_WORKERS
+from utils.llm_client import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, LANE_NAMES
+from utils.rate_limit import TokenBucket
+
+log = logging.getLogger("tg-vk-bot")
+
+# Сколько сообщений подряд можно отправить в один чат без паузы
+CHAT_BURST = 3
+# Сколько раз повторяем запрос после 429
+MAX_FLOOD_RETRIES = 5
+# Корзины чатов, к которым не обращались дольше этого (сек), удаляются
+CHAT_IDLE_TTL = 300
+
+_context = threading.local()
+
+
+@contextmanager
+def send_priority(priority: int):
+    """Приоритет отправок текущего потока внутри блока (по умолчанию — интерактивный)"""
+    previous = getattr(_context, "priority", PRIORITY_INTERACTIVE)
+    _context.priority = priority
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+def background_sends(fn: Callable) -> Callable:
+    """Декоратор: все отправки внутри функции — фоновые уведомления"""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with send_priority(PRIORITY_BACKGROUND):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def current_priority() -> int:
+    return getattr(_context, "priority", PRIORITY_INTERACTIVE)
+
+
+def _is_group(chat_id) -> bool:
+    """Группы и каналы: отрицательный id или @username канала"""
+    return str(chat_id).startswith(("-", "@"))
+
+
+def _retry_after(error: ApiTelegramException) -> float:
+    parameters = (getattr(error, "result_json", None) or {}).get("parameters") or {}
+    return float(parameters.get("retry_after") or 1)
+
+
+@dataclass(order=True)
+class _SendJob:
+    priority: int
+    seq: int
+    chat_id: Any = field(compare=False)
+    fn: Callable = field(compare=False)
+    future: Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+class TelegramSendQueue:
+    def __init__(
+        self,
+        global_rate: float = TG_GLOBAL_RPS,
+        chat_rate: float = TG_CHAT_RPS,
+        group_rate: float = TG_GROUP_RPM / 60,
+        workers: int = TG_SEND_WORKERS,
+    ):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.workers = max(1, workers)
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._chat_used: Dict[Any, float] = {}
+        self._paused: Dict[Any, float] = {}
+        self._in_flight = set()  # Чаты, запрос в которые выполняется прямо сейчас
+        self._jobs: List[_SendJob] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+        self._sent = 0
+        self._throttled = 0
+        self._recent: deque = deque()  # Время отправки за последнюю минуту
+        self._delay = {lane: {"count": 0, "total": 0.0, "max": 0.0} for lane in LANE_NAMES}
+
+    def call(self, chat_id, fn: Callable, *args, **kwargs):
+        """Выполняет запрос fn(*args, **kwargs) через очередь и возвращает его результат"""
+        return self.submit(chat_id, fn, *args, **kwargs).result()
+
+    def submit(self, chat_id, fn: Callable, *args, **kwargs) -> Future:
+        job = _SendJob(
+            priority=current_priority(),
+            seq=next(self._seq),
+            chat_id=chat_id,
+            fn=lambda: fn(*args, **kwargs),
+            future=Future(),
+            enqueued_at=time.monotonic(),
+        )
+        with self._cond:
+            self._ensure_workers()
+            heapq.heappush(self._jobs, job)
+            self._cond.notify()
+        return job.future
+
+    def _ensure_workers(self):
+        """Потоки отправки запускаются при первом запросе (вызывать под self._cond)"""
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"tg-send-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if _is_group(chat_id) else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, CHAT_BURST)
+        return bucket
+
+    def _next_job(self):
+        """Первый по приоритету запрос, который можно отправить сейчас, или время ожидания (под self._cond)"""
+        now = time.monotonic()
+        wait = None
+        # Запросы одного чата уходят по одному и строго по порядку постановки (seq): следующим
+        # отправляется самый ранний запрос чата, а чат встаёт в очередь с лучшим приоритетом своих запросов
+        heads: Dict[Any, _SendJob] = {}
+        ranks: Dict[Any, int] = {}
+        for job in self._jobs:
+            head = heads.get(job.chat_id)
+            if head is None or job.seq < head.seq:
+                heads[job.chat_id] = job
+            ranks[job.chat_id] = min(ranks.get(job.chat_id, job.priority), job.priority)
+
+        for job in sorted(heads.values(), key=lambda job: (ranks[job.chat_id], job.seq)):
+            if job.chat_id in self._in_flight:
+                continue
+            bucket = self._chat_bucket(job.chat_id)
+            chat_wait = max(self._paused.get(job.chat_id, 0) - now, bucket.wait_time())
+            if chat_wait > 0:
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+                continue
+            global_wait = self._global.try_consume()
+            if global_wait > 0:
+                return None, global_wait if wait is None else min(wait, global_wait)
+            bucket.consume()
+            self._in_flight.add(job.chat_id)
+            self._chat_used[job.chat_id] = now
+            self._jobs.remove(job)
+            heapq.heapify(self._jobs)
+            return job, None
+        return None, wait
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        active = {job.chat_id for job in self._jobs}
+        for chat_id, used in list(self._chat_used.items()):
+            if now - used > CHAT_IDLE_TTL and chat_id not in active:
+                self._chat_used.pop(chat_id, None)
+                self._chats.pop(chat_id, None)
+                self._paused.pop(chat_id, None)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job, wait = self._next_job()
+                while job is None:
+                    self._cond.wait(timeout=wait)
+                    job, wait = self._next_job()
+                if len(self._chat_used) > 1000:
+                    self._forget_idle_chats()
+            try:
+                self._send(job)
+            finally:
+                with self._cond:
+                    self._in_flight.discard(job.chat_id)
+                    self._cond.notify_all()
+
+    def _send(self, job: _SendJob):
+        if job.attempts == 0:
+            self._record_delay(job.priority, time.monotonic() - job.enqueued_at)
+        try:
+            result = job.fn()
+        except ApiTelegramException as e:
+            if e.error_code != 429 or job.attempts >= MAX_FLOOD_RETRIES:
+                job.future.set_exception(e)
+                return
+            retry_after = _retry_after(e)
+            log.warning(f"Telegram flood control for chat {job.chat_id}: retry after {retry_after:.0f} s")
+            with self._cond:
+                self._throttled += 1
+                self._paused[job.chat_id] = time.monotonic() + retry_after
+                job.attempts += 1
+                heapq.heappush(self._jobs, job)
+                self._cond.notify_all()
+            return
+        except BaseException as e:
+            job.future.set_exception(e)
+            return
+
+        with self._cond:
+            self._sent += 1
+            self._recent.append(time.monotonic())
+        job.future.set_result(result)
+
+    def _record_delay(self, priority: int, delay: float):
+        with self._cond:
+            entry = self._delay.setdefault(priority, {"count": 0, "total": 0.0, "max": 0.0})
+            entry["count"] += 1
+            entry["total"] += delay
+            entry["max"] = max(entry["max"], delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            queued = {LANE_NAMES.get(lane, str(lane)): 0 for lane in LANE_NAMES}
+            for job in self._jobs:
+                queued[LANE_NAMES.get(job.priority, str(job.priority))] += 1
+            return {
+                "sent": self._sent,
+                "per_minute": len(self._recent),
+                "throttled": self._throttled,
+                "queued": queued,
+                "delay": {
+                    LANE_NAMES.get(lane, str(lane)): {
+                        "avg": entry["total"] / entry["count"] if entry["count"] else 0.0,
+                        "max": entry["max"],
+                    }
+                    for lane, entry in self._delay.items()
+                },
+            }
+
+
+# Общая очередь отправки для всех потоков бота
+tg_send_queue = TelegramSendQueue()
+
+
+class QueuedTeleBot(TeleBot):
+    """TeleBot, у которого отправка и правка сообщений идут через очередь с лимитами Telegram"""
+
+    def __init__(self, *args, send_queue: TelegramSendQueue = tg_send_queue, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_queue = send_queue
+
+    def send_message(self, chat_id, *args, **kwargs):
+        return self.send_queue.call(chat_id, super().send_message, chat_id, *args, **kwargs)
+
+    def send_photo(self, chat_id, *args, **kwargs):
+        return self.send_queue.call(chat_id, super().send_photo, chat_id, *args, **kwargs)
+
+    def send_media_group(self, chat_id, *args, **kwargs):
+        return self.send_queue.call(chat_id, super().send_media_group, chat_id, *args, **kwargs)
+
+    def edit_message_text(self, text, chat_id=None, *args, **kwargs):
+        return self.send_queue.call(chat_id, super().edit_message_text, text, chat_id, *args, **kwargs)
+
@@ -1,32 +1,27 @@
+import hashlib
+import logging
+from typing import Optional
+
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+log = logging.getLogger("tg-vk-bot")
+
 
 def clean_markdown(text: str) -> str:
     """
     Убирает Markdown разметку из текста для публикации в каналы.
     Удаляет символы: *, **, #, ###, и т.д.
     """
-    import re
-
-    if not text:
-        return ""
+    from utils.markdown_render import render_markdown
 
-    # Убираем жирный текст (**text** и __text__)
-    text = re.sub(r"\*\*(.*?)\*\*", r"\1", text)
-    text = re.sub(r"__(.*?)__", r"\1", text)
+    return render_markdown(text).plain if text else ""
 
-    # Убираем курсив (*text* и _text_)
-    text = re.sub(r"\*(.*?)\*", r"\1", text)
-    text = re.sub(r"_(.*?)_", r"\1", text)
 
-    # Убираем заголовки (# ## ###)
-    text = re.sub(r"^#{1,6}\s*", "", text, flags=re.MULTILINE)
+def post_html(text: str) -> str:
+    """Текст поста для предпросмотра с parse_mode="HTML": разметка берётся из разобранного Markdown"""
+    from utils.markdown_render import render_markdown
 
-    # Убираем оставшиеся одиночные * и #
-    text = re.sub(r"(?<!\S)\*(?!\S)", "", text)  # одиночные *
-    text = re.sub(r"(?<!\S)#(?!\S)", "", text)  # одиночные #
-
-    return text.strip()
+    return render_markdown(text).html if text else ""
 
 
 def truncate_caption(text: str, max_len: int = 1024) -> str:
@@ -46,44 +41,96 @@ def smart_vk_text(text: str) -> str:
     - Если текст до 15000 символов - отправляем полностью
     - Если больше - обрезаем красиво
     """
-    if not text:
-        return ""
+    from utils.markdown_render import render_markdown
+
+    return render_markdown(text).vk if text else ""
+
+
+def _photo_input(image):
+    """Фото для send_photo: байты оборачиваются в BytesIO (он делит буфер с bytes), файл перематывается в начало"""
+    import io
+
+    if isinstance(image, (bytes, bytearray)):
+        return io.BytesIO(image)
+    image.seek(0)
+    return image
+
+
+def streaming_request_sender(method, url, params=None, files=None, timeout=None, proxies=None):
+    """
+    Отправитель запросов telebot (apihelper.CUSTOM_REQUEST_SENDER): файлы уходят потоком
+    через MultipartStream, а не собираются requests в одно тело в памяти.
+    Запросы без файлов идут как обычно, через сессию telebot.
+    """
+    from telebot import apihelper
+    from utils.multipart import MultipartStream
+
+    session = apihelper._get_req_session()
+    if not files:
+        return session.request(method, url, params=params, timeout=timeout, proxies=proxies)
 
-    clean_text = clean_markdown(text)
+    body = MultipartStream(files)
+    return session.request(
+        method,
+        url,
+        params=params,
+        data=body,
+        headers={"Content-Type": body.content_type},
+        timeout=timeout,
+        proxies=proxies,
+    )
 
-    # VK поддерживает до 16000 символов, оставляем запас
-    if len(clean_text) <= 15000:
-        return clean_text
 
-    # Если текст слишком длинный - обрезаем красиво
-    truncated = clean_text[:14500]  # Оставляем место для "..."
+def photo_file_id(message) -> Optional[str]:
+    """file_id фото из отправленного сообщения (самая крупная версия)"""
+    photos = getattr(message, "photo", None)
+    return photos[-1].file_id if photos else None
 
-    # Ищем последнее предложение
-    last_sentence = truncated.rfind(".")
-    if last_sentence > 10000:  # Если есть предложение в разумных пределах
-        return truncated[: last_sentence + 1] + "\n\n... (продолжение в комментариях)"
 
-    # Если нет - ищем последний абзац
-    last_paragraph = truncated.rfind("\n\n")
-    if last_paragraph > 8000:
-        return truncated[:last_paragraph] + "\n\n... (продолжение в комментариях)"
+def _send_photo(bot, chat_id, image_bytes, file_id=None, on_upload=None, **kwargs):
+    """
+    Отправляет фото по file_id, если он известен, иначе загружает картинку.
+    Если Telegram не принял file_id, картинка загружается заново.
+    После загрузки новый file_id передаётся в on_upload(file_id).
+    """
+    from telebot.apihelper import ApiTelegramException
+
+    if file_id:
+        try:
+            return bot.send_photo(chat_id, file_id, **kwargs)
+        except ApiTelegramException as e:
+            if "file" not in str(e).lower():
+                raise
+            log.warning(f"Cached Telegram file_id rejected, uploading image again: {e}")
 
-    # В крайнем случае - просто обрезаем
-    return truncated + "..."
+    message = bot.send_photo(chat_id, _photo_input(image_bytes), **kwargs)
+    if on_upload and photo_file_id(message):
+        on_upload(photo_file_id(message))
+    return message
 
 
-def send_post_with_image(bot, chat_id, text: str, image_bytes: bytes, reply_markup=None, parse_mode=None):
+def send_post_with_image(
+    bot, chat_id, text: str, image_bytes, reply_markup=None, parse_mode=None, file_id=None, on_upload=None
+):
     """
     Отправляет пост с изображением без ограничений на длину текста.
     Если текст длинный - отправляет отдельно изображение и текст.
+    image_bytes — байты или открытый двоичный файл (например, версия картинки из temp_images).
+    file_id — картинка, уже загруженная в Telegram: тогда байты не передаются вовсе;
+    on_upload(file_id) вызывается, если картинку пришлось загрузить.
     """
-    import io
-
     # Если текст короткий - отправляем как caption
     if len(text) <= 1000:
         try:
-            return bot.send_photo(
-                chat_id, io.BytesIO(image_bytes), caption=text, reply_markup=reply_markup, parse_mode=parse_mode
+            return _send_photo(
+                bot,
+                chat_id,
+                image_bytes,
+                file_id,
+                on_upload,
+                caption=text,
+                reply_markup=reply_markup,
+                parse_mode=parse_mode,
             )
         except Exception:
             # Если не удалось с caption, отправляем отдельно
@@ -92,7 +139,7 @@ def send_post_with_image(bot, chat_id, text: str, image_bytes: bytes, reply_mark
     # Отправляем изображение и текст отдельно
     try:
         # Сначала изображение
-        bot.send_photo(chat_id, io.BytesIO(image_bytes))
+        _send_photo(bot, chat_id, image_bytes, file_id, on_upload)
 
         # Затем текст с кнопками
         return bot.send_message(chat_id, text, reply_markup=reply_markup, parse_mode=parse_mode)
@@ -103,6 +150,92 @@ def send_post_with_image(bot, chat_id, text: str, image_bytes: bytes, reply_mark
         )
 
 
+def _image_key(image_bytes: bytes) -> str:
+    return hashlib.sha1(image_bytes).hexdigest()
+
+
+def draft_file_id(draft: dict, image_bytes: Optional[bytes] = None) -> Optional[str]:
+    """file_id картинки черновика (по умолчанию текущей), если она уже отправлялась в Telegram"""
+    image_bytes = draft.get("image_bytes") if image_bytes is None else image_bytes
+    if not image_bytes:
+        return None
+    return (draft.get("image_file_ids") or {}).get(_image_key(image_bytes))
+
+
+def remember_draft_file_id(draft: dict, image_bytes: bytes, file_id: str):
+    """
+    Запоминает file_id картинки в черновике. Ключ — хэш содержимого: после правки картинки
+    старый file_id просто не найдётся, а при возврате к прежнему варианту снова пригодится.
+    """
+    if image_bytes and file_id:
+        draft.setdefault("image_file_ids", {})[_image_key(image_bytes)] = file_id
+
+
+def send_draft_post(bot, chat_id, text: str, draft: dict, image_bytes: Optional[bytes] = None, **kwargs):
+    """
+    send_post_with_image для картинки черновика: повторные показы идут по file_id, без загрузки байтов.
+    Загружается версия картинки для Telegram — её file_id потом публикуется и в канал.
+    """
+    from utils.image_renditions import get_rendition
+
+    image_bytes = draft.get("image_bytes") if image_bytes is None else image_bytes
+    return send_post_with_image(
+        bot,
+        chat_id,
+        text,
+        get_rendition(image_bytes, "tg"),
+        file_id=draft_file_id(draft, image_bytes),
+        on_upload=lambda file_id: remember_draft_file_id(draft, image_bytes, file_id),
+        **kwargs,
+    )
+
+
+def send_image_candidates(bot, chat_id, images: list, draft: Optional[dict] = None):
+    """
+    Отправляет варианты изображения альбомом и сообщение с кнопками выбора.
+    file_id вариантов запоминаются в черновике — выбранный вариант потом не загружается повторно.
+    """
+    import io
+    from telebot.types import InputMediaPhoto
+    from utils.image_renditions import get_rendition
+
+    # Варианты показываются версией для Telegram: file_id выбранного потом уходит в канал
+    media = [
+        InputMediaPhoto(io.BytesIO(get_rendition(image, "tg")), caption=f"Вариант {i}")
+        for i, image in enumerate(images, 1)
+    ]
+    messages = bot.send_media_group(chat_id, media)
+    if draft is not None:
+        for image, message in zip(images, messages or []):
+            remember_draft_file_id(draft, image, photo_file_id(message))
+    return bot.send_message(
+        chat_id,
+        "🖼️ Выберите вариант изображения. Остальные сохранятся — можно будет переключиться без новой генерации:",
+        reply_markup=image_candidates_keyboard(len(images)),
+    )
+
+
+def image_candidates_keyboard(count: int) -> InlineKeyboardMarkup:
+    """Кнопки выбора варианта изображения"""
+    kb = InlineKeyboardMarkup()
+    kb.row(*[InlineKeyboardButton(f"🖼️ {i + 1}", callback_data=f"pick_image_{i}") for i in range(count)])
+    return kb
+
+
+def fresh_image_keyboard() -> InlineKeyboardMarkup:
+    """Кнопка генерации новой картинки вместо взятой из индекса"""
+    kb = InlineKeyboardMarkup()
+    kb.row(InlineKeyboardButton("🎨 Сгенерировать новую", callback_data="fresh_image"))
+    return kb
+
+
+def cancel_generation_keyboard(generation_id: int) -> InlineKeyboardMarkup:
+    """Кнопка отмены генерации под статусным сообщением"""
+    kb = InlineKeyboardMarkup()
+    kb.row(InlineKeyboardButton("⏹ Отменить", callback_data=f"cancel_generation_{generation_id}"))
+    return kb
+
+
 def action_keyboard() -> InlineKeyboardMarkup:
     kb = InlineKeyboardMarkup()
     kb.row(
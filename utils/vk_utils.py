@@ -1,24 +1,143 @@
 # utils/vk_utils.py
 import requests
-import io
+import threading
 import time
 import logging
-from typing import Optional, Dict, Any
-from config import VK_ACCESS_TOKEN, VK_GROUP_ID, VK_API_VERSION
+from typing import Optional, Dict, Any, BinaryIO, Union
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from config import VK_ACCESS_TOKEN, VK_GROUP_ID, VK_API_VERSION, VK_RPS
+from utils.rate_limit import AdaptiveRateLimiter
+from utils.multipart import MultipartStream, source_length
 
 VK_API = "https://api.vk.com/method"
 HTTP_TIMEOUT = 30
+# Соединений в пуле на один хост VK (api.vk.com, сервер загрузки)
+POOL_SIZE = 8
+# Сколько переиспользуем адрес сервера загрузки фото на стену (сек)
+UPLOAD_SERVER_TTL = 15 * 60
 log = logging.getLogger("tg-vk-bot")
 
+# Изображение для загрузки: байты или открытый на чтение двоичный файл (он отправляется потоком, без копии в памяти)
+ImageSource = Union[bytes, BinaryIO]
+
+# VKScript для execute: сохранить загруженное фото и сразу опубликовать пост с ним — один запрос вместо двух
+SAVE_AND_POST_CODE = """
+var photo = API.photos.saveWallPhoto({"group_id": Args.group_id, "photo": Args.photo,
+                                      "server": Args.server, "hash": Args.hash})[0];
+var attachment = "photo" + photo.owner_id + "_" + photo.id;
+var post = API.wall.post({"owner_id": "-" + Args.group_id, "from_group": 1,
+                          "message": Args.message, "attachments": attachment});
+return {"post_id": post.post_id, "attachment": attachment};
+"""
+
 
 class VkApiError(RuntimeError):
-    pass
+    def __init__(self, message: str, code: Optional[int] = None, attachment: Optional[str] = None):
+        super().__init__(message)
+        self.code = code  # Код ошибки VK, если он известен
+        self.attachment = attachment  # Уже сохранённое фото, если до ошибки успели его сохранить
+
+
+VK_TOO_MANY_REQUESTS = 6
+
+
+class VkApiStats:
+    """Задержка и число отказов по методам VK API"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._methods: Dict[str, Dict[str, float]] = {}
+
+    def record(self, method: str, seconds: float, throttled: bool = False, waited: float = 0.0):
+        with self._lock:
+            entry = self._methods.setdefault(
+                method, {"calls": 0, "throttled": 0, "total": 0.0, "max": 0.0, "waited": 0.0}
+            )
+            entry["calls"] += 1
+            entry["throttled"] += int(throttled)
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["waited"] += waited
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                method: {
+                    "calls": int(entry["calls"]),
+                    "throttled": int(entry["throttled"]),
+                    "avg": entry["total"] / entry["calls"],
+                    "max": entry["max"],
+                    "waited": entry["waited"],
+                }
+                for method, entry in self._methods.items()
+            }
+
+
+# Лимитеры общие для процесса: все вызовы с одним токеном делят один лимит VK
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+vk_api_stats = VkApiStats()
+
+
+def get_vk_limiter(access_token: str) -> AdaptiveRateLimiter:
+    with _limiters_lock:
+        if access_token not in _limiters:
+            _limiters[access_token] = AdaptiveRateLimiter(VK_RPS, min_rate=min(0.5, VK_RPS))
+        return _limiters[access_token]
 
 
 class VKPublisher:
-    def __init__(self, vk_api_key: str, group_id: str):
+    def __init__(
+        self,
+        vk_api_key: str,
+        group_id: str,
+        api_url: str = VK_API,
+        limiter: Optional[AdaptiveRateLimiter] = None,
+    ):
         self.vk_api_key = vk_api_key
         self.group_id = group_id
+        self.api_url = api_url
+        self.limiter = limiter or get_vk_limiter(vk_api_key)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+        self._upload_server: Optional[str] = None
+        self._upload_server_expires = 0.0
+
+    def _session(self, url: str) -> requests.Session:
+        """Сессия с пулом keep-alive соединений для хоста url — TLS-рукопожатие не повторяется на каждый вызов"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def _get_upload_server(self, refresh: bool = False) -> str:
+        """Адрес сервера загрузки фото на стену; кэшируется на UPLOAD_SERVER_TTL"""
+        with self._lock:
+            if not refresh and self._upload_server and time.monotonic() < self._upload_server_expires:
+                return self._upload_server
+
+        try:
+            upload_url_resp = self._vk_call("photos.getWallUploadServer", params={"group_id": self.group_id})
+            upload_url = upload_url_resp["response"]["upload_url"]
+            log.info(f"VK upload URL obtained: {upload_url[:50]}...")
+        except Exception as e:
+            raise VkApiError(f"Failed to get VK upload URL: {e}")
+
+        with self._lock:
+            self._upload_server = upload_url
+            self._upload_server_expires = time.monotonic() + UPLOAD_SERVER_TTL
+        return upload_url
+
+    def _invalidate_upload_server(self):
+        with self._lock:
+            self._upload_server = None
 
     def _vk_call(
         self,
@@ -35,18 +154,23 @@ class VKPublisher:
         params.setdefault("access_token", self.vk_api_key)
         params.setdefault("v", VK_API_VERSION)
 
+        url = f"{self.api_url}/{method}"
+        session = self._session(url)
         attempt = 0
         while True:
             attempt += 1
+            # Общий для процесса лимит запросов на токен
+            waited = self.limiter.acquire()
+            started = time.monotonic()
             try:
                 # Для методов с длинным текстом используем POST data вместо params
-                if method == "wall.post" and "message" in params:
+                if method in ("wall.post", "execute") and "message" in params:
                     # Отправляем данные в теле запроса для избежания 414 ошибки
-                    r = requests.post(f"{VK_API}/{method}", data=params, files=files, timeout=HTTP_TIMEOUT)
+                    r = session.post(url, data=params, files=files, timeout=HTTP_TIMEOUT)
                     log.info(f"VK API {method} using POST data (text length: {len(params.get('message', ''))})")
                 else:
                     # Для остальных методов используем обычные параметры
-                    r = requests.post(f"{VK_API}/{method}", params=params, files=files, timeout=HTTP_TIMEOUT)
+                    r = session.post(url, params=params, files=files, timeout=HTTP_TIMEOUT)
                 log.info(f"VK API {method} response status: {r.status_code}")
                 log.info(f"VK API {method} response text (first 200 chars): {r.text[:200]}")
 
@@ -72,63 +196,51 @@ class VKPublisher:
                 raise VkApiError(f"VK API запрос не удался: {e}") from e
 
             err = data.get("error")
+            code = err.get("error_code") if err else None
+            vk_api_stats.record(
+                method, time.monotonic() - started, throttled=code == VK_TOO_MANY_REQUESTS, waited=waited
+            )
             if not err:
+                self.limiter.on_success()
                 return data
 
-            code = err.get("error_code")
             msg = err.get("error_msg", "Unknown VK error")
-            if code == 6 and attempt < max_retries:  # Too many requests
-                time.sleep(0.7 * attempt)
-                continue
-            raise VkApiError(f"VK API error {code}: {msg}")
+            if code == VK_TOO_MANY_REQUESTS:
+                # Снижаем скорость для всех вызовов с этим токеном; пауза — через долг в корзине лимитера
+                self.limiter.on_throttle()
+                log.warning(f"VK API {method}: too many requests, rate lowered to {self.limiter.rate:.2f}/s")
+                if attempt < max_retries:
+                    continue
+            raise VkApiError(f"VK API error {code}: {msg}", code=code)
 
-    def upload_photo(self, image_url: Optional[str] = None, image_bytes: Optional[bytes] = None) -> str:
+    def upload_photo(self, image_url: Optional[str] = None, image_bytes: Optional[ImageSource] = None) -> str:
         """
         Загружает фото в альбом группы и возвращает attachment id.
-        Можно передать либо URL, либо байты изображения.
+        Можно передать либо URL, либо байты (или открытый файл) изображения.
         """
-        # 1. Получить upload_url
-        try:
-            upload_url_resp = self._vk_call("photos.getWallUploadServer", params={"group_id": self.group_id})
-            upload_url = upload_url_resp["response"]["upload_url"]
-            log.info(f"VK upload URL obtained: {upload_url[:50]}...")
-        except Exception as e:
-            raise VkApiError(f"Failed to get VK upload URL: {e}")
+        upload_response = self._upload_to_server(self._image_data(image_url, image_bytes))
+        return self._save_wall_photo(upload_response)
 
-        # 2. Скачать или использовать готовое изображение
+    def _image_data(self, image_url: Optional[str], image_bytes: Optional[ImageSource]) -> ImageSource:
+        """Скачивает или берёт готовое изображение и проверяет размер"""
         if image_url:
-            image_data = requests.get(image_url, timeout=HTTP_TIMEOUT).content
-        elif image_bytes:
+            image_data = self._session(image_url).get(image_url, timeout=HTTP_TIMEOUT).content
+        elif image_bytes is not None:
             image_data = image_bytes
         else:
             raise ValueError("Не передано изображение для загрузки")
 
         # Проверяем размер изображения
-        if len(image_data) == 0:
+        size = source_length(image_data)
+        if size == 0:
             raise VkApiError("Image data is empty")
-        if len(image_data) > 50 * 1024 * 1024:  # 50MB limit
-            raise VkApiError(f"Image too large: {len(image_data)} bytes")
+        if size > 50 * 1024 * 1024:  # 50MB limit
+            raise VkApiError(f"Image too large: {size} bytes")
 
-        log.info(f"VK image size: {len(image_data)} bytes")
-
-        # 3. Загрузить на сервер VK
-        try:
-            upload_response = requests.post(
-                upload_url, files={"photo": ("image.jpg", io.BytesIO(image_data), "image/jpeg")}, timeout=HTTP_TIMEOUT
-            ).json()
+        log.info(f"VK image size: {size} bytes")
+        return image_data
 
-            # Проверяем ответ загрузки
-            if "photo" not in upload_response or not upload_response["photo"]:
-                raise VkApiError(f"VK upload failed: {upload_response}")
-
-            log.info(f"VK upload successful: {upload_response.keys()}")
-
-        except requests.exceptions.RequestException as e:
-            raise VkApiError(f"VK upload request failed: {e}")
-        except ValueError as e:
-            raise VkApiError(f"VK upload response not JSON: {e}")
-
-        # 4. Сохранить фото
+    def _save_wall_photo(self, upload_response: Dict[str, Any]) -> str:
         save_response = self._vk_call(
             "photos.saveWallPhoto",
             params={
@@ -142,14 +254,87 @@ class VKPublisher:
         ph = save_response["response"][0]
         return f"photo{ph['owner_id']}_{ph['id']}"
 
-    def publish_post(self, content: str, image_url: Optional[str] = None, image_bytes: Optional[bytes] = None) -> Dict:
+    def _save_and_post(self, upload_response: Dict[str, Any], content: str) -> Dict[str, Any]:
+        """saveWallPhoto и wall.post одним запросом execute; ответ в формате wall.post плюс attachment"""
+        resp = self._vk_call(
+            "execute",
+            params={
+                "code": SAVE_AND_POST_CODE,
+                "group_id": self.group_id,
+                "photo": upload_response["photo"],
+                "server": upload_response["server"],
+                "hash": upload_response["hash"],
+                "message": content,
+            },
+        )
+        result = resp.get("response") or {}
+        if not result.get("post_id"):
+            errors = resp.get("execute_errors") or []
+            code = next((err.get("error_code") for err in errors if err.get("method") == "wall.post"), None)
+            raise VkApiError(
+                f"VK execute failed: {errors or resp}", code=code, attachment=result.get("attachment") or None
+            )
+        return {"response": result}
+
+    def _upload_to_server(self, image_data: ImageSource) -> Dict[str, Any]:
+        """
+        Загружает изображение на сервер загрузки VK. Тело запроса читается кусками прямо
+        из байтов или файла — без сборки multipart-копии в памяти.
+        Если загрузка по закэшированному адресу не удалась (адрес устарел или сервер недоступен),
+        получает новый адрес и повторяет один раз.
+        """
+        for attempt in (1, 2):
+            upload_url = self._get_upload_server(refresh=attempt > 1)
+            body = MultipartStream({"photo": ("image.jpg", image_data, "image/jpeg")})
+            try:
+                upload_response = (
+                    self._session(upload_url)
+                    .post(
+                        upload_url,
+                        data=body,
+                        headers={"Content-Type": body.content_type},
+                        timeout=HTTP_TIMEOUT,
+                    )
+                    .json()
+                )
+
+                # Проверяем ответ загрузки
+                if "photo" not in upload_response or not upload_response["photo"] or upload_response["photo"] == "[]":
+                    raise VkApiError(f"VK upload failed: {upload_response}")
+
+                log.info(f"VK upload successful: {upload_response.keys()}")
+                return upload_response
+
+            except VkApiError as e:
+                error = e
+            except ValueError as e:
+                error = VkApiError(f"VK upload response not JSON: {e}")
+            except requests.exceptions.RequestException as e:
+                error = VkApiError(f"VK upload request failed: {e}")
+
+            self._invalidate_upload_server()
+            if attempt > 1:
+                raise error
+            log.warning(f"VK upload via cached server failed, refreshing upload URL: {error}")
+
+    def publish_post(
+        self, content: str, image_url: Optional[str] = None, image_bytes: Optional[ImageSource] = None
+    ) -> Dict:
         """
         Публикация поста в VK с текстом и опционально картинкой.
         """
         params = {"from_group": 1, "owner_id": f"-{self.group_id}", "message": content}
         if image_url or image_bytes:
-            attachment = self.upload_photo(image_url=image_url, image_bytes=image_bytes)
-            params["attachments"] = attachment
+            image_data = self._image_data(image_url, image_bytes)
+
+            # Сохранение фото и пост — одним execute; при ошибке — прежний путь отдельными вызовами
+            try:
+                return self._save_and_post(self._upload_to_server(image_data), content)
+            except VkApiError as e:
+                log.warning(f"VK execute save+post failed, falling back to separate calls: {e}")
+                attachment = e.attachment
+
+            params["attachments"] = attachment or self._save_wall_photo(self._upload_to_server(image_data))
 
         return self._vk_call("wall.post", params=params)
 
@@ -177,60 +362,100 @@ def vk_post_url(group_id: str, post_id: int) -> str:
     return VKPublisher.post_url(group_id, post_id)
 
 
-def vk_publish_with_image_required(group_id: str, image_bytes: bytes, text: str) -> int:
-    """
-    Публикует пост с изображением в VK с гарантией наличия картинки.
-    Пробует разные стратегии, но всегда с картинкой.
-    """
+# Коды ошибок VK, при которых менять текст бесполезно: нет прав, заблокировано, капча
+VK_FATAL_CODES = {5, 14, 15, 27, 200, 203, 210, 214}
+# Ошибки, после которых стоит изменить текст поста
+VK_LINKS_FORBIDDEN = 222
+VK_BAD_PARAMETER = 100
+VK_MIN_TEXT_LENGTH = 500
 
-    # Стратегия 1: Обычная публикация с картинкой
-    try:
-        log.info("VK Strategy 1: Normal photo+text post")
-        resp = vk_publisher.publish_post(text, image_bytes=image_bytes)
-        post_id = int(resp["response"]["post_id"])
-        log.info(f"VK Strategy 1 success: post_id={post_id}")
-        return post_id
-    except Exception as e:
-        log.warning(f"VK Strategy 1 failed: {e}")
 
-    # Стратегия 2: Сначала загружаем картинку, потом публикуем
-    try:
-        log.info("VK Strategy 2: Upload image first, then post")
-        attachment = vk_publisher.upload_photo(image_bytes=image_bytes)
-        resp = vk_publisher._vk_call(
-            "wall.post", params={"owner_id": f"-{group_id}", "message": text, "attachments": attachment}
-        )
-        post_id = int(resp["response"]["post_id"])
-        log.info(f"VK Strategy 2 success: post_id={post_id}")
-        return post_id
-    except Exception as e:
-        log.warning(f"VK Strategy 2 failed: {e}")
+def _strip_links(text: str) -> str:
+    import re
 
-    # Стратегия 3: Минимальный текст с картинкой
-    try:
-        log.info("VK Strategy 3: Minimal text with image")
-        # Импортируем здесь, чтобы избежать циклического импорта
-        import re
+    return re.sub(r"(?:https?://|www\.)\S+", "", text)
 
-        clean_text = re.sub(r"[^\w\s\.\,\!\?\-\n]", "", text)  # Убираем спецсимволы
-        short_text = clean_text[:500] + "..." if len(clean_text) > 500 else clean_text
-        resp = vk_publisher.publish_post(short_text, image_bytes=image_bytes)
-        post_id = int(resp["response"]["post_id"])
-        log.info(f"VK Strategy 3 success: post_id={post_id}")
-        return post_id
-    except Exception as e:
-        log.warning(f"VK Strategy 3 failed: {e}")
 
-    # Стратегия 4: Только картинка с минимальным текстом
+def _safe_short_text(text: str) -> str:
+    """Текст без спецсимволов, не длиннее VK_MIN_TEXT_LENGTH"""
+    import re
+
+    clean_text = re.sub(r"[^\w\s\.\,\!\?\-\n]", "", text)  # Убираем спецсимволы
+    return clean_text[:VK_MIN_TEXT_LENGTH] + "..." if len(clean_text) > VK_MIN_TEXT_LENGTH else clean_text
+
+
+def _pick_text_strategy(error: VkApiError, tried: set):
+    """
+    Следующий вариант текста по коду ошибки VK: (имя, функция преобразования) или None,
+    если ошибка не связана с текстом или варианты исчерпаны.
+    """
+    if error.code is None:
+        # Сетевой сбой или пустой ответ — повторяем тот же текст один раз
+        strategies = [("same", lambda text: text)]
+    elif error.code == VK_LINKS_FORBIDDEN:
+        strategies = [("no_links", _strip_links), ("short", _safe_short_text)]
+    elif error.code == VK_BAD_PARAMETER or "too long" in str(error).lower():
+        strategies = [("short", _safe_short_text), ("minimal", lambda text: "Новый пост")]
+    else:
+        return None
+
+    for name, transform in strategies:
+        if name not in tried:
+            return name, transform
+    return None
+
+
+def vk_publish_with_image_required(group_id: str, image_bytes: ImageSource, text: str) -> int:
+    """
+    Публикует пост с изображением в VK с гарантией наличия картинки.
+    Изображение — байты или открытый файл: файл отправляется потоком, не читаясь в память.
+
+    Картинка загружается и сохраняется один раз, дальше переиспользуется attachment.
+    Если VK отклонил пост, вариант текста выбирается по коду ошибки: без ссылок,
+    короткий без спецсимволов, минимальный. Ошибки прав доступа не повторяются.
+    """
+    publisher = vk_publisher
+    image_data = publisher._image_data(None, image_bytes)
+
+    # Обычный путь: сохранить фото и опубликовать пост одним execute
     try:
-        log.info("VK Strategy 4: Image with minimal text")
-        minimal_text = "Новый пост"
-        resp = vk_publisher.publish_post(minimal_text, image_bytes=image_bytes)
+        log.info("VK: photo+text post via execute")
+        resp = publisher._save_and_post(publisher._upload_to_server(image_data), text)
         post_id = int(resp["response"]["post_id"])
-        log.info(f"VK Strategy 4 success: post_id={post_id}")
+        log.info(f"VK post success: post_id={post_id}")
         return post_id
-    except Exception as e:
-        log.warning(f"VK Strategy 4 failed: {e}")
+    except VkApiError as e:
+        log.warning(f"VK execute post failed: {e}")
+        error, attachment = e, e.attachment
+
+    if error.code in VK_FATAL_CODES:
+        raise VkApiError(f"VK отклонил пост: {error}", code=error.code) from error
+
+    # Фото не сохранилось внутри execute — сохраняем его отдельно (загрузка одноразовая, поэтому новая)
+    if not attachment:
+        attachment = publisher.upload_photo(image_bytes=image_data)
+        error = None
+
+    tried = set()
+    variant = text
+    while True:
+        if error is not None:
+            strategy = _pick_text_strategy(error, tried)
+            if strategy is None:
+                raise VkApiError(f"Не удалось опубликовать пост с картинкой: {error}", code=error.code) from error
+            name, transform = strategy
+            tried.add(name)
+            variant = transform(variant)
+            log.info(f"VK retry with text strategy '{name}' after error {error.code}")
 
-    # Если все стратегии не сработали
-    raise VkApiError("Не удалось опубликовать пост с картинкой ни одним способом")
+        try:
+            resp = publisher._vk_call(
+                "wall.post",
+                params={"owner_id": f"-{group_id}", "from_group": 1, "message": variant, "attachments": attachment},
+            )
+            post_id = int(resp["response"]["post_id"])
+            log.info(f"VK post success: post_id={post_id}, attachment reused")
+            return post_id
+        except VkApiError as e:
+            log.warning(f"VK wall.post failed: {e}")
+            error = e
@@ -1,11 +1,304 @@
+import logging
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import grpc
+from yandex.cloud.ai.foundation_models.v1.image_generation.image_generation_service_pb2 import ImageGenerationResponse
 from yandex_cloud_ml_sdk import YCloudML
-from config import YANDEX_API_KEY, YANDEX_FOLDER_ID
+from yandex_cloud_ml_sdk._models.image_generation.result import ImageGenerationModelResult
+from yandex_cloud_ml_sdk._types.operation import Operation
+from config import YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_ART_MAX_CONCURRENCY
+from utils.cancellation import current_generation
+from utils.singleflight import singleflight
+
+log = logging.getLogger("tg-vk-bot")
+
+# Интервалы опроса операций: первый опрос, рост и потолок (сек)
+POLL_INITIAL = 2.0
+POLL_BACKOFF = 1.5
+POLL_MAX = 5.0
+# Сколько ждать одну генерацию, прежде чем считать её зависшей (сек)
+IMAGE_TIMEOUT = 300
+
+AUTH_ERROR_CODES = {grpc.StatusCode.UNAUTHENTICATED, grpc.StatusCode.PERMISSION_DENIED}
+
+
+def _is_auth_error(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            return code() in AUTH_ERROR_CODES
+        except Exception:
+            return False
+    return "UNAUTHENTICATED" in str(error)
+
+
+class YandexArtClient:
+    """
+    Долгоживущий клиент YandexArt.
+
+    SDK создаётся лениво один раз и переиспользуется всеми потоками: внутри он держит
+    gRPC-каналы и карту эндпоинтов, а IAM-токены обновляет сам. Если облако ответило
+    ошибкой авторизации (например, ключ перевыпустили), клиент пересоздаёт SDK и
+    повторяет запрос один раз.
+    """
+
+    def __init__(self, folder_id: str, auth: str, sdk_factory: Callable[..., YCloudML] = YCloudML, **sdk_kwargs):
+        self.folder_id = folder_id
+        self.auth = auth
+        self.sdk_factory = sdk_factory
+        self.sdk_kwargs = sdk_kwargs
+        self._lock = threading.Lock()
+        self._sdk = None
+        self._model = None
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                log.info("Creating YandexArt SDK client")
+                self._sdk = self.sdk_factory(folder_id=self.folder_id, auth=self.auth, **self.sdk_kwargs)
+                self._model = self._sdk.models.image_generation("yandex-art").configure(width_ratio=1, height_ratio=1)
+            return self._model
+
+    def reset(self):
+        """Сбрасывает SDK: следующий запрос создаст новый клиент и каналы"""
+        with self._lock:
+            self._sdk = None
+            self._model = None
+
+    def run_deferred(self, prompt: str, seed: Optional[int] = None):
+        """Запускает генерацию и возвращает операцию SDK"""
+        seed = seed if seed is not None else int(time.time())
+        try:
+            return self._get_model().configure(seed=seed).run_deferred(prompt)
+        except Exception as e:
+            if not _is_auth_error(e):
+                raise
+            log.warning(f"YandexArt auth error, recreating client: {e}")
+            self.reset()
+            return self._get_model().configure(seed=seed).run_deferred(prompt)
+
+    def attach(self, operation_id: str) -> Operation:
+        """
+        Операция по сохранённому id (например, после перезапуска бота).
+        Собираем её вручную: attach из SDK не знает proto-тип ответа генерации изображений.
+        """
+        self._get_model()
+        return Operation(
+            id=operation_id,
+            sdk=self._sdk,
+            result_type=ImageGenerationModelResult,
+            proto_result_type=ImageGenerationResponse,
+        )
+
+    def generate(self, prompt: str, seed: Optional[int] = None) -> bytes:
+        result = self.run_deferred(prompt, seed=seed).wait()
+        return bytes(result.image_bytes)
+
+
+@dataclass
+class _ImageJob:
+    prompt: str
+    seed: Optional[int]
+    future: Future
+    operation_id: Optional[str] = None
+    on_started: Optional[Callable[[str], None]] = None
+    operation: Any = None
+    deadline: float = 0.0
+    next_poll: float = 0.0
+    interval: float = 0.0
+    errors: int = 0
+
+
+class ImageJobManager:
+    """
+    Менеджер генераций YandexArt.
+
+    submit() сразу возвращает Future. Операции запускаются через run_deferred
+    (не больше max_concurrency одновременно, остальные ждут в очереди), а их
+    статус опрашивает один фоновый поток с растущим интервалом. Вызывающий
+    поток блокируется только если сам ждёт future.result().
+    """
+
+    def __init__(
+        self,
+        client: YandexArtClient,
+        max_concurrency: int = YANDEX_ART_MAX_CONCURRENCY,
+        poll_initial: float = POLL_INITIAL,
+        poll_max: float = POLL_MAX,
+    ):
+        self.client = client
+        self.max_concurrency = max(1, max_concurrency)
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self._cond = threading.Condition()
+        self._active: Dict[int, _ImageJob] = {}
+        self._queue: deque = deque()
+        self._launcher = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="yandex-art-submit")
+        self._poller: Optional[threading.Thread] = None
+
+    def submit(
+        self, prompt: str, seed: Optional[int] = None, on_started: Optional[Callable[[str], None]] = None
+    ) -> Future:
+        """
+        Ставит генерацию изображения; результат Future — байты картинки.
+        on_started(operation_id) вызывается сразу после запуска операции — чтобы сохранить id.
+        """
+        return self._enqueue(_ImageJob(prompt=prompt, seed=seed, future=Future(), on_started=on_started))
+
+    def attach(self, operation_id: str) -> Future:
+        """Продолжает опрос уже запущенной операции (после перезапуска бота)"""
+        return self._enqueue(_ImageJob(prompt="", seed=None, future=Future(), operation_id=operation_id))
+
+    def _enqueue(self, job: _ImageJob) -> Future:
+        with self._cond:
+            self._queue.append(job)
+            self._ensure_poller()
+            self._launch_queued()
+        return job.future
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"active": len(self._active), "queued": len(self._queue)}
+
+    def _ensure_poller(self):
+        if self._poller is None or not self._poller.is_alive():
+            self._poller = threading.Thread(target=self._poll_loop, name="yandex-art-poller", daemon=True)
+            self._poller.start()
+
+    def _launch_queued(self):
+        """Запускает ожидающие задачи, пока есть свободные слоты (вызывать под self._cond)"""
+        while self._queue and len(self._active) < self.max_concurrency:
+            job = self._queue.popleft()
+            if job.future.cancelled():
+                # Генерацию отменили, пока задача ждала слота, — операцию не запускаем
+                continue
+            self._active[id(job)] = job
+            self._launcher.submit(self._start, job)
+
+    def _start(self, job: _ImageJob):
+        """Запуск операции в пуле — сетевой вызов не держит ни вызывающий поток, ни поллер"""
+        if job.future.cancelled():
+            self._finish(job)
+            return
+        try:
+            if job.operation_id:
+                operation = self.client.attach(job.operation_id)
+            else:
+                operation = self.client.run_deferred(job.prompt, seed=job.seed)
+        except Exception as e:
+            self._finish(job, error=e)
+            return
+
+        if job.on_started:
+            try:
+                job.on_started(operation.id)
+            except Exception:
+                log.exception("Error in YandexArt on_started callback")
+
+        now = time.monotonic()
+        with self._cond:
+            job.operation = operation
+            job.deadline = now + IMAGE_TIMEOUT
+            job.interval = self.poll_initial
+            job.next_poll = now + job.interval
+            self._cond.notify_all()
+
+    def _finish(self, job: _ImageJob, result: Optional[bytes] = None, error: Optional[Exception] = None):
+        with self._cond:
+            self._active.pop(id(job), None)
+            self._launch_queued()
+        try:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+        except InvalidStateError:
+            pass  # Future отменён: результат больше никому не нужен
+
+    def _poll_loop(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                started = [job for job in self._active.values() if job.operation is not None]
+                due = [job for job in started if job.next_poll <= now]
+                if not due:
+                    wake_at = min((job.next_poll for job in started), default=now + self.poll_max)
+                    self._cond.wait(timeout=max(0.05, wake_at - now))
+                    continue
+
+            for job in due:
+                self._poll(job)
+
+    def _poll(self, job: _ImageJob):
+        now = time.monotonic()
+        if job.future.cancelled():
+            # Результат отменённой генерации не ждём; слот отдаём следующей задаче
+            log.info(f"YandexArt operation {job.operation.id} abandoned: generation cancelled")
+            self._finish(job)
+            return
+        try:
+            status = job.operation.get_status()
+            if status.is_running:
+                if now > job.deadline:
+                    raise TimeoutError(f"YandexArt operation {job.operation.id} timed out")
+                job.interval = min(job.interval * POLL_BACKOFF, self.poll_max)
+                job.next_poll = now + job.interval
+                return
+            result = job.operation.get_result()
+        except TimeoutError as e:
+            self._finish(job, error=e)
+            return
+        except Exception as e:
+            job.errors += 1
+            if job.errors >= 3:
+                self._finish(job, error=e)
+            else:
+                log.warning(f"YandexArt poll error ({job.errors}): {e}")
+                job.next_poll = now + job.interval
+            return
+
+        self._finish(job, result=bytes(result.image_bytes))
+
+
+# Глобальный клиент и менеджер генераций для обработчиков и планировщика
+yandex_art = YandexArtClient(YANDEX_FOLDER_ID, YANDEX_API_KEY)
+image_jobs = ImageJobManager(yandex_art)
 
 
 def generate_image_bytes_with_yc(prompt: str) -> bytes:
-    sdk = YCloudML(folder_id=YANDEX_FOLDER_ID, auth=YANDEX_API_KEY)
-    model = sdk.models.image_generation("yandex-art").configure(width_ratio=1, height_ratio=1, seed=int(time.time()))
-    op = model.run_deferred(prompt)
-    result = op.wait()
-    return bytes(result.image_bytes)
+    # Одинаковый промпт, который уже генерируется, не запускает вторую операцию
+    return singleflight.do(("image", prompt), _generate_image, prompt)
+
+
+def _generate_image(prompt: str) -> bytes:
+    future = image_jobs.submit(prompt)
+    # Ожидание прерывается отменой текущей генерации потока
+    generation = current_generation()
+    if generation is not None:
+        return generation.wait(future, timeout=IMAGE_TIMEOUT + 60)
+    return future.result(timeout=IMAGE_TIMEOUT + 60)
+
+
+def generate_image_candidates(prompt: str, count: int) -> List[bytes]:
+    """
+    Генерирует count вариантов изображения по одному промпту с разными seed.
+    Варианты генерируются параллельно; неудачные пропускаются, ошибка — только если не удалось ни одного.
+    """
+    base_seed = int(time.time())
+    futures = [image_jobs.submit(prompt, seed=base_seed + i) for i in range(max(1, count))]
+
+    images, last_error = [], None
+    for future in futures:
+        try:
+            images.append(future.result(timeout=IMAGE_TIMEOUT + 60))
+        except Exception as e:
+            log.warning(f"Image candidate failed: {e}")
+            last_error = e
+    if not images:
+        raise last_error
+    return images
@@ -0,0 +1,247 @@
+# webhook.py
+"""
+Приём обновлений Telegram через webhook.
+
+Лёгкий HTTP-сервер на http.server: проверяет секрет из заголовка
+X-Telegram-Bot-Api-Secret-Token, кладёт обновление в ограниченную очередь
+и сразу отвечает 200. Обновления разбирают рабочие потоки и передают в
+bot.process_new_updates — дальше всё как при polling. Если очередь полна,
+сервер отвечает 503, и Telegram повторит доставку позже.
+
+У каждого рабочего потока своя очередь, и обновления одного чата всегда попадают
+в одну и ту же: сообщение и нажатие кнопки сразу после него разбираются в том
+порядке, в каком пришли, а разные чаты по-прежнему обрабатываются параллельно.
+"""
+import hmac
+import logging
+import math
+import queue
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from telebot.types import Update
+
+from config import WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE
+
+log = logging.getLogger("tg-vk-bot")
+
+WEBHOOK_PATH = "/telegram/webhook"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Обновление Telegram — небольшой JSON; всё, что заметно больше, не от Telegram
+MAX_BODY = 1024 * 1024
+# Сколько обновлений рабочий поток забирает из очереди за раз
+BATCH_SIZE = 20
+# Поля обновления, в которых лежит его источник (сообщение, нажатие кнопки и т.д.)
+UPDATE_FIELDS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "shipping_query",
+    "pre_checkout_query",
+    "poll_answer",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+)
+
+
+def update_chat_id(update: Update):
+    """Чат (или пользователь), от которого пришло обновление; None, если определить нельзя"""
+    for field in UPDATE_FIELDS:
+        source = getattr(update, field, None)
+        if source is None:
+            continue
+        # У нажатия кнопки чат — в сообщении с кнопками
+        chat = getattr(source, "chat", None) or getattr(getattr(source, "message", None), "chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(source, "from_user", None) or getattr(source, "user", None)
+        if user is not None:
+            return user.id
+    return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive: Telegram держит соединения к webhook открытыми
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes = b""):
+        # После отказа тело запроса могло остаться непрочитанным — такое соединение не переиспользуем
+        self.close_connection = status != 200
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Проверка живости для Docker и балансировщика
+        if self.path == "/healthz":
+            self._reply(200, b"ok")
+        else:
+            self._reply(404)
+
+    def do_POST(self):
+        server = self.server.webhook
+        if self.path != server.path:
+            self._reply(404)
+            return
+
+        if not hmac.compare_digest(self.headers.get(SECRET_HEADER, ""), server.secret):
+            server.count("rejected")
+            self._reply(403)
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY:
+            server.count("rejected")
+            self._reply(413 if length > MAX_BODY else 400)
+            return
+
+        try:
+            update = Update.de_json(self.rfile.read(length).decode("utf-8"))
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning(f"Webhook: bad update payload: {e}")
+            server.count("rejected")
+            self._reply(400)
+            return
+
+        if not server.enqueue(update):
+            self._reply(503)
+            return
+        self._reply(200)
+
+
+class WebhookServer:
+    """HTTP-сервер webhook и пул рабочих потоков с ограниченной очередью обновлений"""
+
+    def __init__(
+        self,
+        bot,
+        secret: str,
+        host: str = WEBHOOK_HOST,
+        port: int = WEBHOOK_PORT,
+        path: str = WEBHOOK_PATH,
+        workers: int = WEBHOOK_WORKERS,
+        queue_size: int = WEBHOOK_QUEUE_SIZE,
+    ):
+        self.bot = bot
+        self.secret = secret
+        self.path = path
+        self.workers = max(1, workers)
+        # Очередь на рабочий поток; общий размер — queue_size
+        shard_size = max(1, math.ceil(queue_size / self.workers))
+        self.shards: "List[queue.Queue[Optional[Update]]]" = [
+            queue.Queue(maxsize=shard_size) for _ in range(self.workers)
+        ]
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.webhook = self
+        self.httpd.daemon_threads = True
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counters = {"received": 0, "processed": 0, "rejected": 0, "dropped": 0}
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters, queued=sum(shard.qsize() for shard in self.shards))
+
+    def _shard(self, update: Update) -> "queue.Queue[Optional[Update]]":
+        """Очередь для обновления: все обновления одного чата — в одну очередь"""
+        chat_id = update_chat_id(update)
+        key = chat_id if chat_id is not None else update.update_id
+        return self.shards[hash(key) % self.workers]
+
+    def enqueue(self, update: Update) -> bool:
+        try:
+            self._shard(update).put_nowait(update)
+        except queue.Full:
+            self.count("dropped")
+            log.warning("Webhook: update queue is full, asking Telegram to retry")
+            return False
+        self.count("received")
+        return True
+
+    def _worker(self, updates: "queue.Queue[Optional[Update]]"):
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            # Забираем всё, что уже накопилось: process_new_updates обрабатывает пачку так же, как при polling
+            batch = [update]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    update = updates.get_nowait()
+                except queue.Empty:
+                    break
+                if update is None:
+                    updates.put(None)
+                    break
+                batch.append(update)
+            try:
+                self.bot.process_new_updates(batch)
+            except Exception:
+                log.exception("Webhook: error processing updates")
+            self.count("processed", len(batch))
+
+    def start(self):
+        """Запускает рабочие потоки и HTTP-сервер в фоне"""
+        self._start_workers()
+        threading.Thread(target=self.httpd.serve_forever, name="webhook-http", daemon=True).start()
+        log.info(f"Webhook server listening on port {self.port}")
+
+    def _start_workers(self):
+        for i, updates in enumerate(self.shards):
+            thread = threading.Thread(target=self._worker, args=(updates,), name=f"webhook-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def serve_forever(self):
+        """Запускает рабочие потоки и обслуживает HTTP в текущем потоке (до остановки)"""
+        self._start_workers()
+        log.info(f"Webhook server listening on port {self.port}")
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for updates in self.shards:
+            updates.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+
+# Сервер текущего процесса (в режиме polling — None)
+webhook_server: Optional[WebhookServer] = None
+
+
+def run_webhook(bot):
+    """Регистрирует webhook в Telegram и обслуживает его до остановки процесса"""
+    global webhook_server
+
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_MODE=webhook требует WEBHOOK_URL")
+    # Без заданного секрета генерируем свой на время работы процесса: Telegram пришлёт его в каждом запросе
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+    webhook_server = WebhookServer(bot, secret)
+    url = WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+    bot.set_webhook(url=url, secret_token=secret)
+    log.info(f"Webhook set: {url}")
+    webhook_server.serve_forever()